@@ -0,0 +1,187 @@
+"""
+Cluster benchmark
+Pushes the same update stream through the sharding ingress with 1..N worker
+processes (fake back ends, shared state in the local RESP server) and reports
+throughput per worker count.
+
+Run from the project root:
+    python -m benchmarks.bench_cluster --workers 1 2 4 --users 200 --calendar-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+from telegram.ext import Application
+from benchmarks.loadgen import FAKE_TOKEN, SCRIPT_MIX
+from utils.resp_server import RespServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+DONE_KEY = 'bench:done'
+READY_KEY = 'bench:ready'
+
+
+class CountingApplication(Application):
+    """Counts processed updates in the shared store so the parent can see progress"""
+
+    async def process_update(self, update: object) -> None:
+        await super().process_update(update)
+        from services.state_store import get_store
+        get_store().incr(DONE_KEY)
+
+
+def fake_builder():
+    """Builder factory run inside each worker (see ClusterIngress.builder_factory)"""
+    import config
+    import main as bot_main
+    from benchmarks.fakes import FakeBotAPI, FakeCalendarBackend, FakeGeminiModel
+    from services.google_calendar import GoogleCalendarService
+    from services.state_store import get_store
+
+    # The worker opens WRITE_QUEUE_FILE.<index> after this; keep it out of the project directory
+    config.WRITE_QUEUE_FILE = os.path.join(tempfile.mkdtemp(prefix='bench-writes-'), 'pending_writes.jsonl')
+    backend = FakeCalendarBackend(latency=float(os.environ['BENCH_CALENDAR_LATENCY']))
+    backend.seed(datetime.now(config.TIMEZONE), days=14, per_day=4)
+    bot_main.bot_handlers.calendar_service = GoogleCalendarService(service=backend)
+    bot_main.bot_handlers.ai_service.model = FakeGeminiModel(latency=float(os.environ['BENCH_GEMINI_LATENCY']))
+    get_store().incr(READY_KEY)
+    return (Application.builder()
+            .token(FAKE_TOKEN)
+            .request(FakeBotAPI(latency=float(os.environ['BENCH_TELEGRAM_LATENCY'])))
+            .application_class(CountingApplication))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_resp_server(port: int):
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(RespServer().serve('127.0.0.1', port),),
+                              name='resp-server', daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('RESP server did not start')
+
+
+def build_stream(users: int, flows: int, seed: int):
+    """Raw update payloads; each user's messages stay in order"""
+    rng = random.Random(seed)
+    scripts, weights = zip(*SCRIPT_MIX)
+    per_user = []
+    update_id = 0
+    for index in range(users):
+        user_id = 300000 + index
+        messages = []
+        for _ in range(flows):
+            for text in rng.choices(scripts, weights)[0](rng):
+                update_id += 1
+                message = {
+                    'message_id': update_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+                    'text': text,
+                }
+                if text.startswith('/'):
+                    message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text)}]
+                messages.append(json.dumps({'update_id': update_id, 'message': message}).encode())
+        per_user.append(messages)
+    # Interleave users round-robin, like independent chats arriving together
+    stream = []
+    for position in range(max(len(messages) for messages in per_user)):
+        stream.extend(messages[position] for messages in per_user if position < len(messages))
+    return stream
+
+
+def run_step(workers: int, stream, store, timeout: float) -> dict:
+    from bot.cluster import ClusterIngress
+
+    store.execute('FLUSHALL')
+    ingress = ClusterIngress(workers, builder_factory='benchmarks.bench_cluster:fake_builder')
+    ingress.start()
+    deadline = time.monotonic() + 120
+    while int(store.get(READY_KEY) or 0) < workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError('workers did not start')
+        time.sleep(0.1)
+    time.sleep(1.0)  # Let the applications finish initialize()
+
+    started = time.perf_counter()
+    for payload in stream:
+        ingress.dispatch(payload)
+    deadline = time.monotonic() + timeout
+    done = 0
+    while done < len(stream) and time.monotonic() < deadline:
+        time.sleep(0.05)
+        done = int(store.get(DONE_KEY) or 0)
+    elapsed = time.perf_counter() - started
+    ingress.stop(timeout=10)
+    return {
+        'workers': workers,
+        'updates': done,
+        'sent': len(stream),
+        'seconds': round(elapsed, 3),
+        'updates_per_second': round(done / elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--flows', type=int, default=2, help='scripted flows per user')
+    parser.add_argument('--calendar-latency', type=float, default=0.02)
+    parser.add_argument('--gemini-latency', type=float, default=0.1)
+    parser.add_argument('--telegram-latency', type=float, default=0.01)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/cluster-<time>.json)')
+    args = parser.parse_args()
+
+    port = _free_port()
+    _start_resp_server(port)
+    # Workers are spawned processes and read their configuration from the environment
+    os.environ['STATE_BACKEND_URL'] = f"redis://127.0.0.1:{port}/0"
+    os.environ['BENCH_CALENDAR_LATENCY'] = str(args.calendar_latency)
+    os.environ['BENCH_GEMINI_LATENCY'] = str(args.gemini_latency)
+    os.environ['BENCH_TELEGRAM_LATENCY'] = str(args.telegram_latency)
+    from services.state_store import RedisStore
+    store = RedisStore(os.environ['STATE_BACKEND_URL'])
+
+    stream = build_stream(args.users, args.flows, args.seed)
+    print(f"{len(stream)} updates from {args.users} users, {os.cpu_count()} CPUs\n")
+    results = []
+    for workers in args.workers:
+        result = run_step(workers, stream, store, args.timeout)
+        speedup = result['updates_per_second'] / results[0]['updates_per_second'] if results else 1.0
+        result['speedup'] = round(speedup, 2)
+        results.append(result)
+        print(f"{workers:>3} workers  {result['updates_per_second']:>9.1f} updates/s  "
+              f"{result['seconds']:>8.2f} s  x{speedup:.2f}"
+              + ('' if result['updates'] == result['sent'] else f"  ({result['updates']}/{result['sent']} done)"))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"cluster-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                   'cpus': os.cpu_count(), 'steps': results}, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
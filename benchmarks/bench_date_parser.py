@@ -0,0 +1,186 @@
+"""
+Date/time parser benchmark
+Compares the unified parsing engine against the previous ad-hoc parsers and
+checks what parse_schedule_locally reads from a few schedule messages.
+
+Run from the project root:
+    python -m benchmarks.bench_date_parser
+"""
+import re
+import timeit
+from datetime import datetime, timedelta
+import config
+from utils import date_parser
+
+DATE_INPUTS = [
+    'hari ini', 'besok', 'lusa', 'minggu depan', 'bulan depan',
+    '25/12/2024', '25-12-24', '2024-12-25', 'Senin', 'hari jumat',
+]
+TIME_INPUTS = [
+    '14:30', '2:30 PM', 'jam 2 siang', 'pukul 10 pagi', '10.00',
+    'jam 7 malam', '09:15', '12 am',
+]
+
+# (message, expected (start, location) from parse_schedule_locally at SCHEDULE_NOW, None: left to the AI)
+SCHEDULE_NOW = config.TIMEZONE.localize(datetime(2026, 10, 19, 9))
+SCHEDULE_CASES = [
+    ('Meeting dengan tim besok jam 3 sore di kantor', ('2026-10-20 15:00', 'kantor')),
+    ('lunch at 12:00 at cafe', ('2026-10-19 12:00', 'cafe')),
+    ('rapat senin minggu depan jam 10', ('2026-10-26 10:00', '')),
+    ('meeting minggu ini jam 10', None),
+    ('meeting minggu depan jam 10', None),
+]
+
+
+def legacy_parse_datetime_input(text):
+    """parse_datetime_input as it was before the parsing engine"""
+    text = text.lower().strip()
+    now = datetime.now(config.TIMEZONE)
+
+    if text in ['hari ini', 'today']:
+        return now
+    elif text in ['besok', 'tomorrow']:
+        return now + timedelta(days=1)
+    elif text in ['lusa', 'day after tomorrow']:
+        return now + timedelta(days=2)
+    elif 'minggu depan' in text or 'next week' in text:
+        return now + timedelta(weeks=1)
+    elif 'bulan depan' in text or 'next month' in text:
+        return now + timedelta(days=30)
+
+    date_pattern = r'(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})'
+    match = re.search(date_pattern, text)
+    if match:
+        day = int(match.group(1))
+        month = int(match.group(2))
+        year = int(match.group(3))
+        if year < 100:
+            year += 2000
+        return config.TIMEZONE.localize(datetime(year, month, day))
+
+    date_pattern2 = r'(\d{4})[/\-.](\d{1,2})[/\-.](\d{1,2})'
+    match = re.search(date_pattern2, text)
+    if match:
+        year = int(match.group(1))
+        month = int(match.group(2))
+        day = int(match.group(3))
+        return config.TIMEZONE.localize(datetime(year, month, day))
+
+    days = {
+        'senin': 0, 'monday': 0,
+        'selasa': 1, 'tuesday': 1,
+        'rabu': 2, 'wednesday': 2,
+        'kamis': 3, 'thursday': 3,
+        'jumat': 4, 'friday': 4,
+        'sabtu': 5, 'saturday': 5,
+        'minggu': 6, 'sunday': 6
+    }
+    for day_name, day_num in days.items():
+        if day_name in text:
+            days_ahead = day_num - now.weekday()
+            if days_ahead <= 0:
+                days_ahead += 7
+            return now + timedelta(days=days_ahead)
+
+    raise ValueError(f"Could not parse date: {text}")
+
+
+def legacy_parse_time_input(text):
+    """parse_time_input as it was before the parsing engine"""
+    text = text.lower().strip()
+    text = text.replace('jam', '').replace('pukul', '').replace('at', '').strip()
+
+    match = re.search(r'(\d{1,2})[:\.](\d{2})', text)
+    if match:
+        hour = int(match.group(1))
+        minute = int(match.group(2))
+        if 'pm' in text and hour < 12:
+            hour += 12
+        elif 'am' in text and hour == 12:
+            hour = 0
+        return hour, minute
+
+    single_num = re.search(r'(\d{1,2})', text)
+    if single_num:
+        hour = int(single_num.group(1))
+        if 'malam' in text or 'sore' in text or 'pm' in text:
+            if hour < 12:
+                hour += 12
+        elif 'pagi' in text or 'am' in text:
+            if hour == 12:
+                hour = 0
+        return hour, 0
+
+    raise ValueError(f"Could not parse time: {text}")
+
+
+def legacy_handler_time(text):
+    """The inline parser receive_event_time used before the parsing engine"""
+    time_parts = re.findall(r'\d+', text)
+    if len(time_parts) < 2:
+        raise ValueError("Invalid time format")
+    hour = int(time_parts[0])
+    minute = int(time_parts[1])
+    if 'pm' in text.lower() or 'sore' in text.lower() or 'malam' in text.lower():
+        if hour < 12:
+            hour += 12
+    return hour, minute
+
+
+def _run_all(func, inputs):
+    for text in inputs:
+        try:
+            func(text)
+        except ValueError:
+            pass
+
+
+def _bench(label, func, inputs, number):
+    seconds = timeit.timeit(lambda: _run_all(func, inputs), number=number)
+    per_call = seconds / (number * len(inputs)) * 1e6
+    print(f"{label:<40} {per_call:8.2f} µs/call")
+    return per_call
+
+
+def _uncached(func, inputs):
+    def run(text):
+        date_parser.cache_clear()
+        return func(text)
+    return run
+
+
+def main(number=2000):
+    print("Date parsing")
+    _bench("legacy parse_datetime_input", legacy_parse_datetime_input, DATE_INPUTS, number)
+    _bench("engine parse_date (cold memo)", _uncached(date_parser.parse_date, DATE_INPUTS),
+           DATE_INPUTS, number)
+    _bench("engine parse_date (warm memo)", date_parser.parse_date, DATE_INPUTS, number)
+
+    print("\nTime parsing")
+    _bench("legacy parse_time_input", legacy_parse_time_input, TIME_INPUTS, number)
+    _bench("legacy receive_event_time parser", legacy_handler_time, TIME_INPUTS, number)
+    _bench("engine parse_time (cold memo)", _uncached(date_parser.parse_time, TIME_INPUTS),
+           TIME_INPUTS, number)
+    _bench("engine parse_time (warm memo)", date_parser.parse_time, TIME_INPUTS, number)
+
+    print("\nBehaviour differences (input: legacy helper / legacy handler / engine)")
+    for text in TIME_INPUTS:
+        results = []
+        for func in (legacy_parse_time_input, legacy_handler_time, date_parser.parse_time):
+            try:
+                results.append('%02d:%02d' % func(text))
+            except ValueError:
+                results.append('error')
+        print(f"  {text!r:<16} {' / '.join(results)}")
+
+    misread = []
+    for text, expected in SCHEDULE_CASES:
+        data = date_parser.parse_schedule_locally(text, SCHEDULE_NOW)
+        got = data and (f"{data['start_date']} {data['start_time']}", data['location'])
+        if got != expected:
+            misread.append((text, got))
+    print(f"\nMisread schedule cases: {len(misread)} {misread if misread else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+"""
+Digest benchmark
+Simulates one morning of N users who each want today's agenda at their own
+time (most of them at the same few times) and counts the Calendar list
+calls it takes, per second and per minute at the peak:
+  herd     every user taps "📋 Lihat Hari Ini" around their time and each
+           tap lists every calendar they show (the today view before its
+           day listings were cached)
+  cached   the same taps against the today view's cached day listings
+  digest   everyone subscribed with /digest: the DigestScheduler lists each
+           calendar once per send time, spread over the lead window, and
+           the sender paces the messages (delay after the chosen time)
+The schedule is driven in virtual time. The per-digest render time is
+measured for real against the fake Calendar with the listings prefetched.
+
+Run from the project root:
+    python -m benchmarks.bench_digest
+    python -m benchmarks.bench_digest --users 1000 10000 --calendars 6 --send-rate 25
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+import config
+from benchmarks.fakes import FakeCalendarBackend
+from bot.digest import DigestScheduler
+from bot.handlers import BotHandlers
+from services.google_calendar import GoogleCalendarService
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Share of users per chosen time; the rest pick a 5-minute mark between 05:00 and 09:00
+PEAK_TIMES = (('07:00', 0.5), ('06:30', 0.15), ('07:30', 0.15))
+# Seconds after their chosen time a user taps the today view
+TAP_JITTER = 120
+
+
+def make_users(count: int, calendars: int, rng: random.Random) -> Dict[int, Dict]:
+    """user id -> {'time', 'calendars'}: primary plus each shared calendar with a 30% chance"""
+    shared = [f"shared{index}@group.calendar.google.com" for index in range(calendars - 1)]
+    users = {}
+    for user_id in range(1, count + 1):
+        draw, clock = rng.random(), None
+        for peak, share in PEAK_TIMES:
+            if draw < share:
+                clock = peak
+                break
+            draw -= share
+        if clock is None:
+            minutes = 5 * 60 + 5 * rng.randrange(48)
+            clock = f"{minutes // 60:02d}:{minutes % 60:02d}"
+        users[user_id] = {'time': clock,
+                          'calendars': ['primary'] + [calendar for calendar in shared if rng.random() < 0.3]}
+    return users
+
+
+def at(day: datetime, clock: str) -> datetime:
+    hour, minute = (int(part) for part in clock.split(':'))
+    return day.replace(hour=hour, minute=minute)
+
+
+def peaks(times: List[float]) -> Dict:
+    """Total calls and the most in any one second and any one minute (sliding)"""
+    times = sorted(times)
+    per_second = per_minute = 0
+    first_second = first_minute = 0
+    for index, moment in enumerate(times):
+        while times[first_second] <= moment - 1:
+            first_second += 1
+        while times[first_minute] <= moment - 60:
+            first_minute += 1
+        per_second = max(per_second, index - first_second + 1)
+        per_minute = max(per_minute, index - first_minute + 1)
+    return {'calls': len(times), 'peak_per_second': per_second, 'peak_per_minute': per_minute}
+
+
+def taps(users: Dict[int, Dict], day: datetime, rng: random.Random, ttl: float = None) -> Dict:
+    """List calls of every user opening the today view once, with or without cached day listings"""
+    opened = sorted((at(day, user['time']) + timedelta(seconds=rng.uniform(0, TAP_JITTER)), user_id)
+                    for user_id, user in users.items())
+    calls, listed = [], {}
+    for moment, user_id in opened:
+        stamp = moment.timestamp()
+        for calendar_id in users[user_id]['calendars']:
+            if ttl is not None and stamp - listed.get(calendar_id, float('-inf')) <= ttl:
+                continue
+            listed[calendar_id] = stamp
+            calls.append(stamp)
+    return peaks(calls)
+
+
+def digest_run(users: Dict[int, Dict], day: datetime, send_rate: float) -> Dict:
+    """Drive a DigestScheduler through the morning in virtual time"""
+    scheduler = DigestScheduler(lambda user_id: users[user_id]['calendars'], None, None)
+    start = day.replace(hour=3)
+    for user_id, user in users.items():
+        scheduler._add(user_id, {'chat_id': user_id, 'time': user['time']}, start)
+
+    calls, sends = [], []
+    now, ticks = start, 0
+    started = time.perf_counter()
+    while now < day.replace(hour=10):
+        fetches, due, next_at = scheduler.due(now)
+        ticks += 1
+        calls += [now.timestamp()] * len(fetches)
+        sends += [(send_at.timestamp(), user_id) for user_id, send_at in due]
+        now = next_at if next_at and next_at > now else now + timedelta(seconds=1)
+    schedule_seconds = time.perf_counter() - started
+
+    # The sender takes one message every 1/send_rate seconds, in the order they fell due
+    delays, free_at, interval = [], 0.0, 1.0 / send_rate
+    for due_at, _ in sorted(sends):
+        free_at = max(free_at, due_at) + interval
+        delays.append(free_at - due_at)
+    delays.sort()
+    result = peaks(calls)
+    result.update({
+        'digests': len(sends),
+        'delay_p50_seconds': round(statistics.median(delays), 1),
+        'delay_p99_seconds': round(delays[int(len(delays) * 0.99) - 1], 1),
+        'delay_max_seconds': round(delays[-1], 1),
+        'scheduler_ticks': ticks,
+        'scheduler_ms': round(schedule_seconds * 1000, 1),
+    })
+    return result
+
+
+def render_run(calendars: int, messages: int) -> Dict:
+    """Seconds per digest_message with every listing prefetched (the work done per send)"""
+    backend = FakeCalendarBackend()
+    today = datetime.now(config.TIMEZONE)
+    shared = ['primary'] + [f"shared{index}@group.calendar.google.com" for index in range(calendars - 1)]
+    for calendar_id in shared:
+        backend.seed(today, days=1, per_day=4, calendar_id=calendar_id)
+    handlers = BotHandlers()
+    handlers.calendar_service = GoogleCalendarService(service=backend)
+    handlers.calendar_selection['1'] = {calendar_id: calendar_id.split('@')[0] for calendar_id in shared}
+
+    async def run():
+        for calendar_id in shared:
+            await handlers.prefetch_day(calendar_id, today.date())
+        calls = backend.calls
+        started = time.perf_counter()
+        for _ in range(messages):
+            await handlers.digest_message(1, today.date())
+        return time.perf_counter() - started, backend.calls - calls
+
+    elapsed, extra_calls = asyncio.run(run())
+    handlers.calendar_service.fanout.shutdown()
+    return {'calendars': calendars, 'ms_per_digest': round(elapsed / messages * 1000, 3),
+            'calendar_calls': extra_calls}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--calendars', type=int, default=5, help='calendars of the account (primary + shared)')
+    parser.add_argument('--send-rate', type=float, default=config.DIGEST_SEND_RATE, help='digests per second')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/digest-<time>.json)')
+    args = parser.parse_args()
+
+    day = config.TIMEZONE.localize(datetime(2024, 6, 3))
+    results = []
+    print(f"{'users':>6} {'mode':>7} {'calls':>7} {'peak/s':>7} {'peak/min':>9}  digest delay p50/p99/max")
+    for count in args.users:
+        users = make_users(count, args.calendars, random.Random(args.seed))
+        result = {
+            'users': count,
+            'herd': taps(users, day, random.Random(args.seed)),
+            'cached': taps(users, day, random.Random(args.seed), ttl=config.EVENT_CACHE_TTL),
+            'digest': digest_run(users, day, args.send_rate),
+        }
+        results.append(result)
+        for mode in ('herd', 'cached', 'digest'):
+            row = result[mode]
+            line = f"{count:>6} {mode:>7} {row['calls']:>7,} {row['peak_per_second']:>7} {row['peak_per_minute']:>9}"
+            if mode == 'digest':
+                line += (f"  {row['delay_p50_seconds']}s / {row['delay_p99_seconds']}s / "
+                         f"{row['delay_max_seconds']}s ({row['scheduler_ms']} ms scheduling)")
+            print(line)
+
+    render = render_run(args.calendars, 200)
+    print(f"\nRender: {render['ms_per_digest']} ms per digest over {render['calendars']} calendars, "
+          f"{render['calendar_calls']} extra Calendar calls")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"digest-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                   'lead_seconds': config.DIGEST_LEAD, 'results': results, 'render': render}, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Field mask benchmark
+Compares events.list responses with and without the service's fields= mask:
+payload bytes (plain and gzip), JSON parse time and the memory the event
+cache holds, for calendars shaped like busy work calendars (attendees,
+Meet links, reminders).
+
+Run from the project root:
+    python -m benchmarks.bench_field_masks
+    python -m benchmarks.bench_field_masks --events 50 500 2500 --attendees 12
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import config
+from services.event_cache import EventCache, compact_event
+from services.google_calendar import LIST_MASK
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def parse_mask(mask: str) -> Dict:
+    """'a,b(c,d)' -> {'a': {}, 'b': {'c': {}, 'd': {}}} (empty dict: whole value)"""
+    def parse(position: int) -> Tuple[Dict, int]:
+        fields, name = {}, ''
+        while position < len(mask):
+            char = mask[position]
+            if char == '(':
+                fields[name], position = parse(position + 1)
+                name = ''
+            elif char == ')':
+                break
+            elif char == ',':
+                if name:
+                    fields[name] = {}
+                name = ''
+            else:
+                name += char
+            position += 1
+        if name:
+            fields[name] = {}
+        return fields, position
+
+    return parse(0)[0]
+
+
+def apply_mask(value, fields: Dict):
+    """What the API returns for a fields= selector (lists apply it per element)"""
+    if not fields:
+        return value
+    if isinstance(value, list):
+        return [apply_mask(item, fields) for item in value]
+    return {key: apply_mask(value[key], sub) for key, sub in fields.items() if key in value}
+
+
+def full_event(rng: random.Random, index: int, start: datetime, attendees: int) -> Dict:
+    """An events.list item with what Google returns for a typical work meeting"""
+    event_id = f"{rng.getrandbits(80):020x}"
+    end = start + timedelta(minutes=rng.choice([30, 45, 60, 90]))
+    people = [{
+        'email': f"person{rng.randint(1, 5000)}@example.com",
+        'displayName': f"Rekan Kerja {rng.randint(1, 5000)}",
+        'responseStatus': rng.choice(['accepted', 'needsAction', 'tentative', 'declined']),
+    } for _ in range(rng.randint(0, attendees))]
+    event = {
+        'kind': 'calendar#event',
+        'etag': f'"{rng.getrandbits(60)}"',
+        'id': event_id,
+        'status': 'confirmed',
+        'htmlLink': f"https://www.google.com/calendar/event?eid={event_id}bWVAZXhhbXBsZS5jb20",
+        'created': '2024-01-02T03:04:05.000Z',
+        'updated': '2024-01-03T03:04:05.678Z',
+        'summary': f"Rapat proyek {index}",
+        'creator': {'email': 'me@example.com', 'self': True},
+        'organizer': {'email': 'me@example.com', 'self': True},
+        'start': {'dateTime': start.isoformat(), 'timeZone': config.TIMEZONE_STR},
+        'end': {'dateTime': end.isoformat(), 'timeZone': config.TIMEZONE_STR},
+        'iCalUID': f"{event_id}@google.com",
+        'sequence': rng.randint(0, 3),
+        'attendees': people,
+        'reminders': {'useDefault': False, 'overrides': [{'method': 'popup', 'minutes': 10}]},
+        'eventType': 'default',
+    }
+    if rng.random() < 0.5:
+        event['location'] = 'Ruang meeting lantai 3'
+    if rng.random() < 0.4:
+        event['description'] = 'Agenda: update progres, kendala, rencana minggu depan. ' * rng.randint(1, 4)
+    if rng.random() < 0.6:
+        code = f"{rng.choice('abcdefghij')*3}-{rng.choice('klmnopqrs')*4}-{rng.choice('tuvwxyz')*3}"
+        event['hangoutLink'] = f"https://meet.google.com/{code}"
+        event['conferenceData'] = {
+            'entryPoints': [
+                {'entryPointType': 'video', 'uri': f"https://meet.google.com/{code}", 'label': f"meet.google.com/{code}"},
+                {'entryPointType': 'more', 'uri': 'https://tel.meet/abc?pin=123', 'pin': '1234567890'},
+                {'entryPointType': 'phone', 'uri': 'tel:+62-21-1234-5678', 'label': '+62 21-1234-5678', 'pin': '123456789'},
+            ],
+            'conferenceSolution': {
+                'key': {'type': 'hangoutsMeet'}, 'name': 'Google Meet',
+                'iconUri': 'https://fonts.gstatic.com/s/i/productlogos/meet_2020q4/v6/web-512dp/logo_meet_2020q4_color_2x_web_512dp.png',
+            },
+            'conferenceId': code,
+        }
+    return event
+
+
+def list_response(events: List[Dict]) -> Dict:
+    return {
+        'kind': 'calendar#events', 'etag': '"p33c9fm6n6v1ce0g"', 'summary': 'me@example.com',
+        'updated': '2024-01-03T03:04:05.678Z', 'timeZone': config.TIMEZONE_STR, 'accessRole': 'owner',
+        'defaultReminders': [{'method': 'popup', 'minutes': 10}], 'items': events,
+    }
+
+
+def measure(body: bytes, repeats: int) -> float:
+    """Median json.loads time in ms"""
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        json.loads(body)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def cache_bytes(body: bytes, compact: bool, start: datetime, end: datetime) -> int:
+    """Memory still held once a response is parsed and cached (the response itself is dropped)"""
+    tracemalloc.start()
+    cache = EventCache()
+    items = json.loads(body)['items']
+    if compact:
+        items = [compact_event(item) for item in items]
+    cache.store_window('primary', start, end, items)
+    del items
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+
+def run_size(count: int, attendees: int, repeats: int, seed: int) -> Dict:
+    rng = random.Random(seed)
+    start = config.TIMEZONE.localize(datetime(2024, 3, 4, 0, 0))
+    events = [full_event(rng, index, start + timedelta(hours=8 + index % 10, days=index // 10), attendees)
+              for index in range(count)]
+    end = start + timedelta(days=count // 10 + 1)
+    full = json.dumps(list_response(events)).encode('utf-8')
+    masked = json.dumps(apply_mask(list_response(events), parse_mask(LIST_MASK))).encode('utf-8')
+
+    result = {'events': count}
+    for name, body in (('full', full), ('masked', masked)):
+        parse_ms = measure(body, repeats)
+        result[name] = {
+            'bytes': len(body),
+            'gzip_bytes': len(gzip.compress(body)),
+            'parse_ms': round(parse_ms, 3),
+            'cache_bytes': cache_bytes(body, name == 'masked', start, end),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, nargs='+', default=[10, 50, 250, 2500],
+                        help='events per list response (today, week, conflict fill, sync page)')
+    parser.add_argument('--attendees', type=int, default=8, help='maximum attendees per event')
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/field-masks-<time>.json)')
+    args = parser.parse_args()
+
+    print(f"fields={LIST_MASK}\n")
+    print(f"{'events':>7} {'bytes full':>11} {'masked':>9} {'gzip full':>10} {'masked':>8} "
+          f"{'parse full':>11} {'masked':>9} {'cache full':>11} {'compact':>9}")
+    results = []
+    for count in args.events:
+        result = run_size(count, args.attendees, args.repeats, args.seed)
+        results.append(result)
+        full, masked = result['full'], result['masked']
+        print(f"{count:>7} {full['bytes']:>11,} {masked['bytes']:>9,} {full['gzip_bytes']:>10,} "
+              f"{masked['gzip_bytes']:>8,} {full['parse_ms']:>9.2f}ms {masked['parse_ms']:>7.2f}ms "
+              f"{full['cache_bytes'] / 1024:>8.0f}KiB {masked['cache_bytes'] / 1024:>6.0f}KiB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"field-masks-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                   'mask': LIST_MASK, 'sizes': results}, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
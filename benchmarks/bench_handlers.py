@@ -0,0 +1,240 @@
+"""
+Handler benchmark
+Drives BotHandlers through realistic update streams against fake back ends.
+
+Run from the project root:
+    python -m benchmarks.bench_handlers
+    python -m benchmarks.bench_handlers --users 20 --calendar-latency 0.08 --compare old.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List
+import config
+from benchmarks.fakes import FakeCalendarBackend, FakeClient, FakeGeminiModel, FakeTelegram
+from bot.handlers import BotHandlers, WAITING_EVENT_CONFIRM
+from services.google_calendar import GoogleCalendarService
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+AI_MESSAGES = [
+    'meeting dengan tim besok jam 3 sore',
+    'beri tips produktivitas untuk minggu ini',
+    'makan siang dengan klien besok jam 12',
+    'bagaimana cara mengatur waktu rapat?',
+]
+
+
+async def add_event_flow(handlers: BotHandlers, client: FakeClient, rng: random.Random) -> int:
+    """/add conversation: title, date, time, duration, location (+ conflict answer)"""
+    steps = [
+        (handlers.add_event_start, '/add'),
+        (handlers.receive_event_title, f"Sesi fokus {rng.randint(1, 999)}"),
+        (handlers.receive_event_date, 'besok'),
+        (handlers.receive_event_time, f"{rng.randint(8, 18):02d}:{rng.choice(['00', '30'])}"),
+        (handlers.receive_event_duration, rng.choice(['1 jam', '30 menit', '1 jam 30 menit'])),
+        (handlers.receive_event_location, rng.choice(['skip', 'Kantor'])),
+    ]
+    state = None
+    for handler, text in steps:
+        state = await handler(*client.message(text))
+    if state == WAITING_EVENT_CONFIRM:
+        await handlers.receive_event_confirm(*client.message('ya'))
+        return len(steps) + 1
+    return len(steps)
+
+
+async def list_week_flow(handlers: BotHandlers, client: FakeClient, rng: random.Random) -> int:
+    await handlers.list_week_events(*client.message('/week'))
+    return 1
+
+
+async def ai_chat_flow(handlers: BotHandlers, client: FakeClient, rng: random.Random) -> int:
+    """Free text through handle_message; conflicting AI events get the keyboard answered"""
+    await handlers.handle_message(*client.message(rng.choice(AI_MESSAGES)))
+    if str(client.user.id) in handlers.pending_events:
+        await handlers.resolve_event_conflict(*client.callback('conflict_keep'))
+        return 2
+    return 1
+
+
+async def delete_flow(handlers: BotHandlers, client: FakeClient, rng: random.Random) -> int:
+    """/delete then pick the first listed event"""
+    await handlers.delete_event_start(*client.message('/delete'))
+    if client.user.id not in handlers.user_data:
+        return 1
+    await handlers.receive_delete_selection(*client.message('1'))
+    return 2
+
+
+SCENARIOS: Dict[str, Callable] = {
+    'add_event': add_event_flow,
+    'list_week': list_week_flow,
+    'ai_chat': ai_chat_flow,
+    'delete': delete_flow,
+}
+
+
+def build_handlers(args) -> (BotHandlers, FakeCalendarBackend, FakeGeminiModel, FakeTelegram):
+    backend = FakeCalendarBackend(latency=args.calendar_latency)
+    # Enough events that every delete has something to remove
+    backend.seed(datetime.now(config.TIMEZONE), days=14, per_day=args.events_per_day)
+    model = FakeGeminiModel(latency=args.gemini_latency)
+    backend.outage = args.calendar_outage
+    model.outage = args.gemini_outage
+    telegram = FakeTelegram(latency=args.telegram_latency)
+
+    handlers = BotHandlers()
+    handlers.calendar_service = GoogleCalendarService(service=backend)
+    handlers.ai_service.model = model
+    # Writes queued during a --calendar-outage run stay out of the project directory
+    handlers.write_queue.open(os.path.join(tempfile.mkdtemp(prefix='bench-writes-'), 'pending_writes.jsonl'))
+    return handlers, backend, model, telegram
+
+
+def duplicate_check(args) -> int:
+    """Events inserted when a user sends the same request twice, as two messages (expected 1)"""
+    handlers, backend, _, telegram = build_handlers(args)
+    client = FakeClient(telegram, 100000)
+    before = len(backend.calendar('primary'))
+
+    async def run():
+        for _ in range(2):
+            await handlers.handle_message(*client.message(AI_MESSAGES[0]))
+            if str(client.user.id) in handlers.pending_events:
+                await handlers.resolve_event_conflict(*client.callback('conflict_keep'))
+
+    asyncio.run(run())
+    return len(backend.calendar('primary')) - before
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+async def _run_users(flow, handlers, telegram, users: int, iterations: int, seed: int) -> List[float]:
+    latencies = []
+
+    async def user(user_id):
+        client = FakeClient(telegram, user_id)
+        rng = random.Random(seed + user_id)
+        for _ in range(iterations):
+            started = time.perf_counter()
+            updates = await flow(handlers, client, rng)
+            latencies.append((time.perf_counter() - started, updates))
+
+    await asyncio.gather(*(user(100000 + index) for index in range(users)))
+    return latencies
+
+
+def run_scenario(name: str, args) -> Dict:
+    flow = SCENARIOS[name]
+
+    # Timing pass
+    handlers, backend, model, telegram = build_handlers(args)
+    started = time.perf_counter()
+    samples = asyncio.run(_run_users(flow, handlers, telegram, args.users, args.iterations, args.seed))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in samples)
+    updates = sum(count for _, count in samples)
+    result = {
+        'flows': len(samples),
+        'updates': updates,
+        'seconds': round(elapsed, 4),
+        'flows_per_second': round(len(samples) / elapsed, 2),
+        'updates_per_second': round(updates / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50': round(_percentile(latencies, 0.50) * 1000, 3),
+            'p99': round(_percentile(latencies, 0.99) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3),
+        },
+        'calendar_calls': backend.calls,
+        'gemini_calls': model.calls,
+        'telegram_sends': telegram.sent,
+    }
+
+    # Memory pass: tracemalloc slows everything down, so it gets its own run
+    handlers, _, _, telegram = build_handlers(args)
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    asyncio.run(_run_users(flow, handlers, telegram, args.users, args.iterations, args.seed))
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result['memory_kib'] = {
+        'peak': round((peak - baseline) / 1024, 1),
+        'retained': round((retained - baseline) / 1024, 1),
+    }
+    return result
+
+
+def print_result(name: str, result: Dict, previous: Dict = None):
+    latency = result['latency_ms']
+    line = (f"{name:<10} {result['flows_per_second']:>9.1f} flows/s {result['updates_per_second']:>9.1f} upd/s "
+            f"p50 {latency['p50']:>8.2f} ms  p99 {latency['p99']:>8.2f} ms  "
+            f"peak {result['memory_kib']['peak']:>8.1f} KiB")
+    if previous:
+        before = previous['latency_ms']['p50']
+        change = (latency['p50'] - before) / before * 100 if before else 0.0
+        line += f"  (p50 {change:+.1f}% vs previous)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--users', type=int, default=10, help='concurrent simulated chats')
+    parser.add_argument('--iterations', type=int, default=20, help='flows per user')
+    parser.add_argument('--events-per-day', type=int, default=4)
+    parser.add_argument('--calendar-latency', type=float, default=0.0, help='seconds per Calendar call')
+    parser.add_argument('--gemini-latency', type=float, default=0.0, help='seconds per Gemini call')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='seconds per Telegram send')
+    parser.add_argument('--calendar-outage', type=float, help='Calendar calls hang this many seconds, then fail')
+    parser.add_argument('--gemini-outage', type=float, help='Gemini calls hang this many seconds, then fail')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/handlers-<time>.json)')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f).get('scenarios', {})
+
+    print(f"{args.users} users x {args.iterations} flows, latency calendar {args.calendar_latency}s "
+          f"gemini {args.gemini_latency}s telegram {args.telegram_latency}s\n")
+    results = {}
+    for name in args.scenarios:
+        results[name] = run_scenario(name, args)
+        print_result(name, results[name], previous.get(name))
+
+    if args.calendar_outage is None:
+        print(f"\nSame request sent twice: {duplicate_check(args)} event(s) inserted (expected 1)")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"handlers-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            'scenarios': results,
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
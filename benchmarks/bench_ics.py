@@ -0,0 +1,193 @@
+"""
+ICS benchmark
+Streams synthetic .ics files (events with descriptions, alarms, recurring
+series and moved occurrences) through utils.ics and the bot's import and
+export paths against the fake Calendar API: parse throughput and peak
+memory per file size, Calendar round trips of a batched import against one
+call per event, and export throughput. Import wall time is modeled from
+the fake's per-request latency instead of sleeping through it.
+
+Run from the project root:
+    python -m benchmarks.bench_ics
+    python -m benchmarks.bench_ics --events 1000 10000 50000 --call-latency 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict
+import config
+from benchmarks.fakes import FakeCalendarBackend, FakeClient, FakeTelegram
+from bot.handlers import BotHandlers
+from services.google_calendar import GoogleCalendarService
+from utils.ics import escape, fold, read_events
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+WORDS = ('rapat', 'review', 'sprint', 'klien', 'anggaran', 'makan siang', 'presentasi', 'pelatihan')
+
+
+def write_sample(path: str, events: int, seed: int):
+    """An .ics file like a calendar export: 5% recurring series with a moved occurrence each"""
+    rng = random.Random(seed)
+    first = datetime(2024, 1, 1, 8)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write(fold('BEGIN:VCALENDAR') + fold('VERSION:2.0') + fold('PRODID:-//bench//ID'))
+        for index in range(events):
+            start = first + timedelta(days=rng.randrange(730), hours=rng.randrange(10), minutes=rng.choice((0, 30)))
+            end = start + timedelta(minutes=rng.choice((30, 60, 90)))
+            lines = [
+                'BEGIN:VEVENT',
+                f"UID:bench-{index}@example.com",
+                'DTSTAMP:20240101T000000Z',
+                f"DTSTART;TZID=Asia/Jakarta:{start.strftime('%Y%m%dT%H%M%S')}",
+                f"DTEND;TZID=Asia/Jakarta:{end.strftime('%Y%m%dT%H%M%S')}",
+                f"SUMMARY:{escape(' '.join(rng.sample(WORDS, 2)).title())} {index}",
+                f"DESCRIPTION:{escape(' '.join(rng.choice(WORDS) for _ in range(rng.randrange(5, 60))))}",
+                f"LOCATION:Ruang {rng.randrange(1, 20)}\\, Lantai {rng.randrange(1, 5)}",
+            ]
+            series = index % 20 == 0
+            if series:
+                lines.append('RRULE:FREQ=WEEKLY;COUNT=30')
+            lines += ['BEGIN:VALARM', 'ACTION:DISPLAY', 'TRIGGER:-PT10M', 'DESCRIPTION:Pengingat', 'END:VALARM',
+                      'END:VEVENT']
+            if series:
+                moved = start + timedelta(weeks=2)
+                lines += [
+                    'BEGIN:VEVENT',
+                    f"UID:bench-{index}@example.com",
+                    f"RECURRENCE-ID;TZID=Asia/Jakarta:{moved.strftime('%Y%m%dT%H%M%S')}",
+                    f"DTSTART;TZID=Asia/Jakarta:{(moved + timedelta(hours=2)).strftime('%Y%m%dT%H%M%S')}",
+                    f"DTEND;TZID=Asia/Jakarta:{(end + timedelta(weeks=2, hours=2)).strftime('%Y%m%dT%H%M%S')}",
+                    'SUMMARY:Dipindah',
+                    'END:VEVENT',
+                ]
+            f.write(''.join(fold(line) for line in lines))
+        f.write(fold('END:VCALENDAR'))
+
+
+def parse_run(path: str) -> Dict:
+    """Events read and seconds of a streamed pass over a file, and the peak traced memory of another"""
+    started = time.perf_counter()
+    with open(path, encoding='utf-8') as f:
+        count = sum(1 for _ in read_events(f))
+    elapsed = time.perf_counter() - started
+
+    # Memory pass (tracemalloc slows everything down)
+    tracemalloc.start()
+    with open(path, encoding='utf-8') as f:
+        for _ in read_events(f):
+            pass
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'events': count, 'seconds': round(elapsed, 3), 'events_per_second': round(count / elapsed),
+            'peak_kib': round(peak / 1024, 1)}
+
+
+def import_run(path: str, args) -> Dict:
+    """Import a file through BotHandlers.run_ics_import into an empty fake calendar"""
+    backend = FakeCalendarBackend()
+    handlers = BotHandlers()
+    handlers.calendar_service = GoogleCalendarService(service=backend)
+    client = FakeClient(FakeTelegram(), 1)
+    update, _ = client.message('')
+    copy = f"{path}.import"
+    shutil.copy(path, copy)  # run_ics_import deletes its file
+
+    async def run():
+        status = await update.message.reply_text('📥')
+        return await handlers.run_ics_import(1, status, copy)
+
+    started = time.perf_counter()
+    counts = asyncio.run(run())
+    client_seconds = time.perf_counter() - started
+    handlers.calendar_service.fanout.shutdown()
+    requests = counts['imported'] + counts['failed']
+    batches = backend.calls
+    # What the fake did not sleep: one round trip per batch, plus the time Calendar spends per event
+    batched = client_seconds + batches * args.call_latency + requests * args.batch_item_latency
+    single = client_seconds + requests * args.call_latency
+    return {'events': requests, 'imported': counts['imported'], 'calendar_requests': batches,
+            'client_seconds': round(client_seconds, 2), 'modeled_batched_minutes': round(batched / 60, 1),
+            'modeled_one_per_event_minutes': round(single / 60, 1), 'stored': len(backend.calendar('primary'))}
+
+
+def export_run(events: int, seed: int) -> Dict:
+    """Export a fake calendar of `events` events through BotHandlers.write_ics_export"""
+    rng = random.Random(seed)
+    backend = FakeCalendarBackend()
+    calendar = backend.calendar('primary')
+    first = config.TIMEZONE.localize(datetime(2024, 1, 1, 8))
+    for index in range(events):
+        start = first + timedelta(days=rng.randrange(730), hours=rng.randrange(10))
+        calendar[f"e{index}"] = {
+            'id': f"e{index}", 'iCalUID': f"e{index}@google.com", 'status': 'confirmed',
+            'updated': '2024-01-01T00:00:00.000Z', 'summary': f"Rapat {index}",
+            'description': ' '.join(rng.choice(WORDS) for _ in range(20)),
+            'start': {'dateTime': start.isoformat(), 'timeZone': config.TIMEZONE_STR},
+            'end': {'dateTime': (start + timedelta(hours=1)).isoformat(), 'timeZone': config.TIMEZONE_STR},
+        }
+    # The fake's first page sorts the whole calendar, slower than a call deadline at 50k events under tracemalloc
+    config.CALENDAR_TIMEOUT_MIN = config.CALENDAR_TIMEOUT_MAX = 120
+    handlers = BotHandlers()
+    handlers.calendar_service = GoogleCalendarService(service=backend)
+    path = tempfile.mktemp(suffix='.ics')
+    started = time.perf_counter()
+    written = handlers.write_ics_export(path, first, first + timedelta(days=731))
+    elapsed = time.perf_counter() - started
+
+    # Memory pass; includes the fake's own page of up to 2500 events
+    tracemalloc.start()
+    handlers.write_ics_export(path, first, first + timedelta(days=731))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = os.path.getsize(path)
+    os.remove(path)
+    handlers.calendar_service.fanout.shutdown()
+    return {'events': written, 'seconds': round(elapsed, 3), 'events_per_second': round(written / elapsed),
+            'bytes': size, 'calendar_requests': backend.calls, 'peak_kib': round(peak / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, nargs='+', default=[1000, 10000, 50000], help='events per file')
+    parser.add_argument('--call-latency', type=float, default=0.2,
+                        help='seconds per Calendar round trip (modeled, not slept)')
+    parser.add_argument('--batch-item-latency', type=float, default=0.02,
+                        help='extra seconds per event inside a batch request (modeled)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/ics-<time>.json)')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-ics-')
+    results = []
+    print(f"{'events':>7} {'file':>9} {'parse/s':>9} {'peak':>10} {'requests':>9} {'batched':>9} "
+          f"{'1 per event':>12} {'export/s':>9} {'peak':>10}")
+    for count in args.events:
+        path = os.path.join(directory, f"{count}.ics")
+        write_sample(path, count, args.seed)
+        result = {'events': count, 'file_bytes': os.path.getsize(path),
+                  'parse': parse_run(path), 'import': import_run(path, args), 'export': export_run(count, args.seed)}
+        results.append(result)
+        parse, imported, exported = result['parse'], result['import'], result['export']
+        print(f"{count:>7} {result['file_bytes'] / 1e6:>7.1f}MB {parse['events_per_second']:>9,} "
+              f"{parse['peak_kib']:>7.0f}KiB {imported['calendar_requests']:>9,} "
+              f"{imported['modeled_batched_minutes']:>7.1f}m {imported['modeled_one_per_event_minutes']:>10.1f}m "
+              f"{exported['events_per_second']:>9,} {exported['peak_kib']:>7.0f}KiB")
+    shutil.rmtree(directory)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"ics-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                   'files': results}, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
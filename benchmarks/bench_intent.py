@@ -0,0 +1,74 @@
+"""
+Intent and emoji benchmark
+Compares get_event_emoji against the previous loop that rebuilt the emoji
+map on every call, times the local intent check, and checks that write
+requests naming a day are not answered as a view.
+
+Run from the project root:
+    python -m benchmarks.bench_intent
+"""
+import timeit
+from bot.handlers import BotHandlers
+from utils.helpers import EVENT_EMOJI_MAP, get_event_emoji
+
+TITLES = [
+    'Meeting Project ABC',
+    'Makan siang dengan client',
+    'Ulang tahun Budi',
+    'Sprint review & retro',
+    'Zoom call dengan vendor',
+    'Belajar untuk ujian akhir',
+    'Konser musik di GBK',
+    'Weekly sync',
+    'Berangkat ke bandara naik pesawat pagi',
+    'Interview kandidat backend engineer untuk tim platform',
+]
+
+MESSAGES = [
+    'lihat jadwal hari ini dong',
+    'apa saja agenda minggu ini?',
+    'meeting dengan tim besok jam 2 siang',
+    'beri tips produktivitas',
+]
+
+# (message, intent answered locally)
+INTENT_CASES = [
+    ('jadwal hari ini', 'view_today'),
+    ('apa saja agenda minggu ini?', 'view_week'),
+    ('kapan saya kosong minggu ini', 'free_slots'),
+    ('buat acara hari ini makan siang dengan Budi', None),
+    ('hapus acara hari ini yang rapat', None),
+    ('jadwal minggu ini tolong pindahkan rapat ke jumat', None),
+]
+
+
+def legacy_get_event_emoji(event_title):
+    """get_event_emoji as it was before the emoji map moved to module level"""
+    title_lower = event_title.lower()
+    emoji_map = dict(EVENT_EMOJI_MAP)  # Rebuilt on every call, as before
+    for keyword, emoji in emoji_map.items():
+        if keyword in title_lower:
+            return emoji
+    return '📅'
+
+
+def _bench(label, func, inputs, number):
+    seconds = timeit.timeit(lambda: [func(text) for text in inputs], number=number)
+    per_call = seconds / (number * len(inputs)) * 1e6
+    print(f"{label:<32} {per_call:8.2f} µs/call")
+
+
+def main(number=5000):
+    mismatches = [title for title in TITLES
+                  if legacy_get_event_emoji(title) != get_event_emoji(title)]
+    print(f"Result mismatches vs legacy: {len(mismatches)}")
+    misrouted = [text for text, intent in INTENT_CASES if BotHandlers.local_intent(text) != intent]
+    print(f"Misrouted intent cases: {len(misrouted)} {misrouted if misrouted else ''}")
+
+    _bench("legacy get_event_emoji", legacy_get_event_emoji, TITLES, number)
+    _bench("get_event_emoji", get_event_emoji, TITLES, number)
+    _bench("local_intent", BotHandlers.local_intent, MESSAGES, number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""
+Recurrence benchmark
+Compares events.list with singleEvents=True (the server sends every
+occurrence of a recurring event) against singleEvents=False (it sends the
+rule once, with the occurrences that were moved or cancelled, and the
+service expands it): payload bytes (plain and gzip) and client time to
+parse, compact and expand, for a week view, a month and the search sync
+window.
+
+Run from the project root:
+    python -m benchmarks.bench_recurrence
+    python -m benchmarks.bench_recurrence --series 40 --singles-per-week 20
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+import config
+from benchmarks.bench_field_masks import apply_mask, full_event, list_response, parse_mask
+from services.event_cache import compact_event
+from services.google_calendar import LIST_MASK, GoogleCalendarService, _start_key
+from utils.recurrence import expand, original_key
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# Typical work series: standups, 1:1s, fortnightly syncs, monthly reviews
+RULES = (
+    'RRULE:FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR',
+    'RRULE:FREQ=WEEKLY',
+    'RRULE:FREQ=WEEKLY;INTERVAL=2;BYDAY=TH',
+    'RRULE:FREQ=MONTHLY;BYDAY=1MO',
+    'RRULE:FREQ=MONTHLY;BYDAY=-1FR',
+)
+EXCEPTION_RATE = 0.05
+
+
+def build_calendar(rng: random.Random, today: datetime, series: int, singles_per_week: int,
+                   attendees: int) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Recurring events (full API shape), their exceptions and one-off events around `today`"""
+    first = today - timedelta(days=config.SEARCH_SYNC_PAST_DAYS + 365)
+    last = today + timedelta(days=config.SEARCH_SYNC_FUTURE_DAYS)
+    masters, exceptions, singles = [], [], []
+    for index in range(series):
+        start = first + timedelta(days=index % 7, hours=8 + index % 9)
+        master = full_event(rng, index, start, attendees)
+        master['recurrence'] = [RULES[index % len(RULES)]]
+        masters.append(master)
+        for instance in expand(master, first, last):
+            if rng.random() >= EXCEPTION_RATE:
+                continue
+            if rng.random() < 0.5:
+                exceptions.append({'kind': 'calendar#event', 'id': instance['id'], 'status': 'cancelled',
+                                   'recurringEventId': master['id'],
+                                   'originalStartTime': instance['originalStartTime']})
+            else:
+                moved = dict(instance, summary=f"{master['summary']} (dipindah)")
+                for key in ('start', 'end'):
+                    when = datetime.fromisoformat(instance[key]['dateTime']) + timedelta(hours=2)
+                    moved[key] = dict(instance[key], dateTime=when.isoformat())
+                exceptions.append(moved)
+    for week in range((last - first).days // 7):
+        for index in range(singles_per_week):
+            start = first + timedelta(weeks=week, days=index % 5, hours=9 + index % 8)
+            singles.append(full_event(rng, 10000 + week * singles_per_week + index, start, attendees))
+    return masters, exceptions, singles
+
+
+def overlaps(event: Dict, start: datetime, end: datetime) -> bool:
+    event_start = datetime.fromisoformat(event['start']['dateTime'])
+    event_end = datetime.fromisoformat(event['end']['dateTime'])
+    return event_start < end and event_end > start
+
+
+def responses(masters: List[Dict], exceptions: List[Dict], singles: List[Dict],
+              start: datetime, end: datetime) -> Tuple[bytes, bytes, int]:
+    """Masked singleEvents=True and singleEvents=False bodies for [start, end), and the occurrence count"""
+    mask = parse_mask(LIST_MASK)
+    changed = {(event['recurringEventId'], event['originalStartTime']['dateTime']) for event in exceptions}
+    live = [event for event in exceptions if event.get('status') != 'cancelled' and overlaps(event, start, end)]
+    in_window = [event for event in singles if overlaps(event, start, end)]
+
+    occurrences = [instance for master in masters for instance in expand(master, start, end)
+                   if (master['id'], instance['originalStartTime']['dateTime']) not in changed]
+    expanded = sorted(occurrences + live + in_window, key=_start_key)
+    # The server also sends the window's cancelled occurrences, so they are not expanded
+    cancelled = [event for event in exceptions if event.get('status') == 'cancelled'
+                 and start <= datetime.fromisoformat(event['originalStartTime']['dateTime']) < end]
+    unexpanded = masters + cancelled + [event for event in exceptions if event.get('status') != 'cancelled'
+                                        and overlaps(event, start, end)] + in_window
+
+    server = json.dumps(apply_mask(list_response(expanded), mask)).encode('utf-8')
+    local = json.dumps(apply_mask(list_response(unexpanded), mask)).encode('utf-8')
+    return server, local, len(expanded)
+
+
+def series_keys(exceptions: List[Dict]) -> Dict[str, frozenset]:
+    """Recurring event id -> original starts of its exceptions, as the series lookup finds them"""
+    keys = {}
+    for event in exceptions:
+        keys.setdefault(event['recurringEventId'], set()).add(original_key(event['originalStartTime']))
+    return {series_id: frozenset(value) for series_id, value in keys.items()}
+
+
+def client_ms(body: bytes, expand_locally: bool, start: datetime, end: datetime, repeats: int,
+              series: Dict[str, frozenset]) -> Tuple[float, int]:
+    """
+    Median ms to parse, compact and (singleEvents=False) expand a response,
+    and the events it yields. The series' exceptions are already cached
+    (their lookup is one batch request per EVENT_CACHE_TTL, not per list).
+    """
+    timings = []
+    for _ in range(repeats):
+        service = GoogleCalendarService(service=object())
+        for series_id, keys in series.items():
+            service.series_cache.put('primary', series_id, keys)
+        started = time.perf_counter()
+        items = []
+        for item in json.loads(body)['items']:
+            event = compact_event(item)
+            event['calendarId'] = 'primary'
+            items.append(event)
+        if expand_locally:
+            items = service._expand_series('primary', items, start, end)
+        timings.append(time.perf_counter() - started)
+        service.fanout.shutdown()
+    return statistics.median(timings) * 1000, len(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--series', type=int, default=20, help='recurring events on the calendar')
+    parser.add_argument('--singles-per-week', type=int, default=10, help='one-off events per week')
+    parser.add_argument('--attendees', type=int, default=8, help='maximum attendees per event')
+    parser.add_argument('--repeats', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/recurrence-<time>.json)')
+    args = parser.parse_args()
+
+    today = config.TIMEZONE.localize(datetime(2024, 6, 3))
+    rng = random.Random(args.seed)
+    masters, exceptions, singles = build_calendar(rng, today, args.series, args.singles_per_week, args.attendees)
+    series = dict.fromkeys((master['id'] for master in masters), frozenset())
+    series.update(series_keys(exceptions))
+    windows = (
+        ('week', today, today + timedelta(days=7)),
+        ('month', today, today + timedelta(days=30)),
+        ('sync', today - timedelta(days=config.SEARCH_SYNC_PAST_DAYS),
+         today + timedelta(days=config.SEARCH_SYNC_FUTURE_DAYS)),
+    )
+
+    print(f"{args.series} recurring events, {len(exceptions)} exceptions, {args.singles_per_week} one-off events a week\n")
+    print(f"{'window':>7} {'events':>7} {'bytes server':>13} {'local':>10} {'gzip server':>12} {'local':>8} "
+          f"{'client server':>14} {'local':>9}")
+    results = []
+    for name, start, end in windows:
+        server, local, count = responses(masters, exceptions, singles, start, end)
+        server_ms, server_events = client_ms(server, False, start, end, args.repeats, series)
+        local_ms, local_events = client_ms(local, True, start, end, args.repeats, series)
+        if server_events != local_events:
+            raise SystemExit(f"{name}: local expansion gave {local_events} events, the server {server_events}")
+        result = {'window': name, 'days': (end - start).days, 'events': count}
+        for key, body, ms in (('server', server, server_ms), ('local', local, local_ms)):
+            result[key] = {'bytes': len(body), 'gzip_bytes': len(gzip.compress(body)), 'client_ms': round(ms, 3)}
+        results.append(result)
+        print(f"{name:>7} {count:>7} {len(server):>13,} {len(local):>10,} {result['server']['gzip_bytes']:>12,} "
+              f"{result['local']['gzip_bytes']:>8,} {server_ms:>12.2f}ms {local_ms:>7.2f}ms")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"recurrence-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                   'windows': results}, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
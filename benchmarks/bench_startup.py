@@ -0,0 +1,132 @@
+"""
+Startup benchmark
+Cold-starts the bot in fresh interpreters (python -X importtime) and reports
+how long `import main` and build_application() take, broken down by the
+packages the import time goes to.
+
+Run from the project root:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --top 15
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child; prints its own timings as the last line of stdout
+CHILD_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.build_application(main.default_builder())
+built = time.perf_counter()
+print(json.dumps({'import_main': imported - started, 'build_application': built - imported}))
+"""
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# Namespace packages whose sub-packages are separate distributions
+NAMESPACES = ('google',)
+
+
+def package_of(module: str) -> str:
+    parts = module.split('.')
+    if parts[0] in NAMESPACES and len(parts) > 1:
+        return '.'.join(parts[:2])
+    return parts[0]
+
+
+def parse_importtime(stderr: str) -> List[dict]:
+    """Rows of `python -X importtime` output: module, self and cumulative ms, nesting depth"""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            rows.append({
+                'module': match.group(4),
+                'self_ms': int(match.group(1)) / 1000,
+                'cumulative_ms': int(match.group(2)) / 1000,
+                'depth': (len(match.group(3)) - 1) // 2,
+            })
+    return rows
+
+
+def run_once(python: str) -> dict:
+    env = dict(os.environ)
+    # build_application() only needs a syntactically valid token; nothing is sent
+    env.setdefault('TELEGRAM_BOT_TOKEN', '123456:STARTUP-BENCH')
+    env.setdefault('GEMINI_API_KEY', 'startup-bench')
+    completed = subprocess.run(
+        [python, '-X', 'importtime', '-c', CHILD_SCRIPT],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    rows = parse_importtime(completed.stderr)
+    by_package: Dict[str, float] = defaultdict(float)
+    for row in rows:
+        by_package[package_of(row['module'])] += row['self_ms']
+    return {
+        'import_main_ms': timings['import_main'] * 1000,
+        'build_application_ms': timings['build_application'] * 1000,
+        'modules': len(rows),
+        'by_package': dict(by_package),
+        # Modules main imports directly, with everything they pulled in
+        'direct': {row['module']: row['cumulative_ms'] for row in rows if row['depth'] == 1},
+    }
+
+
+def median_map(runs: List[dict], key: str) -> Dict[str, float]:
+    names = set().union(*(run[key] for run in runs))
+    return {name: statistics.median(run[key].get(name, 0.0) for run in runs) for name in names}
+
+
+def print_table(title: str, values: Dict[str, float], top: int):
+    print(f"\n{title}")
+    for name, ms in sorted(values.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {name:<40} {ms:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=12, help='rows per breakdown')
+    parser.add_argument('--python', default=sys.executable)
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/startup-<time>.json)')
+    args = parser.parse_args()
+
+    # The first run warms the OS file cache and writes .pyc files
+    run_once(args.python)
+    runs = [run_once(args.python) for _ in range(args.runs)]
+
+    import_ms = statistics.median(run['import_main_ms'] for run in runs)
+    build_ms = statistics.median(run['build_application_ms'] for run in runs)
+    print(f"{args.runs} cold starts, median of each")
+    print(f"  import main                              {import_ms:>9.1f} ms  ({runs[0]['modules']} modules)")
+    print(f"  build_application()                      {build_ms:>9.1f} ms")
+    by_package = median_map(runs, 'by_package')
+    direct = median_map(runs, 'direct')
+    print_table('Import time by package (self time)', by_package, args.top)
+    print_table('Direct imports of main (cumulative)', direct, args.top)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+                   'import_main_ms': round(import_ms, 1), 'build_application_ms': round(build_ms, 1),
+                   'by_package': {name: round(ms, 2) for name, ms in by_package.items()},
+                   'direct': {name: round(ms, 2) for name, ms in direct.items()}}, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,478 @@
+"""
+Benchmark fakes
+In-process stand-ins for the Calendar API, Gemini and Telegram with configurable latency
+"""
+import asyncio
+import itertools
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+import httplib2
+import pytz
+from googleapiclient.errors import HttpError
+from telegram.request import BaseRequest, RequestData
+import config
+
+
+def _parse(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _event_bounds(event: Dict):
+    start, end = event['start'], event['end']
+    if 'dateTime' in start:
+        return _parse(start['dateTime']), _parse(end['dateTime'])
+    day_start = config.TIMEZONE.localize(datetime.fromisoformat(start['date']))
+    day_end = config.TIMEZONE.localize(datetime.fromisoformat(end['date']))
+    return day_start, day_end
+
+
+class FakeRequest:
+    """Mimics googleapiclient's HttpRequest: nothing happens until execute()"""
+
+    def __init__(self, backend: 'FakeCalendarBackend', func):
+        self.backend = backend
+        self.func = func
+
+    def execute(self, http=None, num_retries=0):
+        self.backend.calls += 1
+        if self.backend.outage is not None:
+            time.sleep(self.backend.outage)
+            raise ConnectionError('Calendar outage (fake)')
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        with self.backend.lock:
+            return self.func()
+
+
+class FakeBatch:
+    """Mimics googleapiclient's BatchHttpRequest: every added call in one round trip"""
+
+    def __init__(self, backend: 'FakeCalendarBackend', callback=None):
+        self.backend = backend
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request: FakeRequest, callback=None, request_id=None):
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self, http=None):
+        self.backend.calls += 1
+        if self.backend.outage is not None:
+            time.sleep(self.backend.outage)
+            raise ConnectionError('Calendar outage (fake)')
+        latency = self.backend.latency + self.backend.batch_item_latency * len(self.requests)
+        if latency:
+            time.sleep(latency)
+        for index, (request_id, request, callback) in enumerate(self.requests):
+            response = error = None
+            if self.backend.batch_limit is not None and index >= self.backend.batch_limit:
+                error = HttpError(httplib2.Response({'status': 403}),
+                                  b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}')
+            else:
+                try:
+                    with self.backend.lock:
+                        response = request.func()
+                except HttpError as refused:
+                    error = refused
+            callback(request_id, response, error)
+
+
+def _with_offset(value: Dict) -> Dict:
+    """An API time as the API returns it: dateTime with its UTC offset"""
+    if 'dateTime' not in value or _parse(value['dateTime']).tzinfo is not None:
+        return value
+    zone = pytz.timezone(value.get('timeZone') or config.TIMEZONE_STR)
+    return dict(value, dateTime=zone.localize(_parse(value['dateTime'])).isoformat())
+
+
+class _FakeEvents:
+    def __init__(self, backend: 'FakeCalendarBackend'):
+        self.backend = backend
+
+    def list(self, calendarId, timeMin=None, timeMax=None, maxResults=250,
+             singleEvents=True, orderBy=None, pageToken=None, iCalUID=None, **kwargs):
+        def run():
+            if iCalUID is not None:
+                # A whole series (the fake does not expand recurrences): every event with the UID
+                return {'items': [dict(event) for event in self.backend.calendar(calendarId).values()
+                                  if event.get('iCalUID') == iCalUID]}
+            query = (calendarId, timeMin, timeMax)
+            cached = self.backend.last_list
+            if pageToken and cached and cached[0] == query:
+                # A later page of the same listing; re-sorting a 50k event calendar per page is quadratic
+                items = cached[1]
+            else:
+                items = self._matching(calendarId, timeMin, timeMax)
+                self.backend.last_list = (query, items)
+
+            offset = int(pageToken or 0)
+            page = items[offset:offset + maxResults]
+            result = {'items': [dict(event) for event in page]}
+            if offset + maxResults < len(items):
+                result['nextPageToken'] = str(offset + maxResults)
+            return result
+        return FakeRequest(self.backend, run)
+
+    def _matching(self, calendar_id, time_min, time_max):
+        time_min = _parse(time_min) if time_min else None
+        time_max = _parse(time_max) if time_max else None
+        items = []
+        for event in self.backend.calendar(calendar_id).values():
+            start, end = _event_bounds(event)
+            if time_min and end <= time_min:
+                continue
+            if time_max and start >= time_max:
+                continue
+            items.append(event)
+        items.sort(key=lambda event: _event_bounds(event)[0])
+        return items
+
+    def insert(self, calendarId, body, **kwargs):
+        def run():
+            event = dict(body)
+            event.setdefault('id', self.backend.next_id())
+            event.setdefault('status', 'confirmed')
+            if event['id'] in self.backend.calendar(calendarId):
+                # Like Calendar: a client-chosen id can only be inserted once
+                raise HttpError(httplib2.Response({'status': 409}), b'The requested identifier already exists.')
+            self.backend.calendar(calendarId)[event['id']] = event
+            return dict(event)
+        return FakeRequest(self.backend, run)
+
+    def import_(self, calendarId, body, **kwargs):
+        def run():
+            event = dict(body, start=_with_offset(body['start']), end=_with_offset(body['end']))
+            event.setdefault('status', 'confirmed')
+            # Matched by iCalUID (and the occurrence it changes), like Calendar's events.import
+            key = (calendarId, event['iCalUID'], json.dumps(event.get('originalStartTime'), sort_keys=True))
+            event['id'] = self.backend.imported.get(key) or self.backend.next_id()
+            self.backend.imported[key] = event['id']
+            self.backend.calendar(calendarId)[event['id']] = event
+            return {'id': event['id']}
+        return FakeRequest(self.backend, run)
+
+    def get(self, calendarId, eventId, **kwargs):
+        return FakeRequest(self.backend, lambda: dict(self.backend.calendar(calendarId)[eventId]))
+
+    def update(self, calendarId, eventId, body, **kwargs):
+        def run():
+            event = dict(body, id=eventId)
+            self.backend.calendar(calendarId)[eventId] = event
+            return dict(event)
+        return FakeRequest(self.backend, run)
+
+    def patch(self, calendarId, eventId, body, **kwargs):
+        def run():
+            event = self.backend.calendar(calendarId)[eventId]
+            event.update(body)
+            return dict(event)
+        return FakeRequest(self.backend, run)
+
+    def delete(self, calendarId, eventId, **kwargs):
+        def run():
+            self.backend.calendar(calendarId).pop(eventId, None)
+            return ''
+        return FakeRequest(self.backend, run)
+
+
+class _FakeFreeBusy:
+    def __init__(self, backend: 'FakeCalendarBackend'):
+        self.backend = backend
+
+    def query(self, body):
+        def run():
+            time_min, time_max = _parse(body['timeMin']), _parse(body['timeMax'])
+            calendars = {}
+            for item in body.get('items', []):
+                busy = []
+                for event in self.backend.calendar(item['id']).values():
+                    if event.get('transparency') == 'transparent':
+                        continue
+                    start, end = _event_bounds(event)
+                    if start < time_max and end > time_min:
+                        busy.append({'start': start.isoformat(), 'end': end.isoformat()})
+                calendars[item['id']] = {'busy': sorted(busy, key=lambda slot: slot['start'])}
+            return {'calendars': calendars}
+        return FakeRequest(self.backend, run)
+
+
+class _FakeCalendarList:
+    def __init__(self, backend: 'FakeCalendarBackend'):
+        self.backend = backend
+
+    def list(self, **kwargs):
+        def run():
+            return {'items': [
+                {'id': calendar_id, 'summary': calendar_id, 'primary': calendar_id == 'primary'}
+                for calendar_id in self.backend.calendars
+            ]}
+        return FakeRequest(self.backend, run)
+
+
+class FakeCalendarBackend:
+    def __init__(self, latency: float = 0.0):
+        """
+        Drop-in for the object returned by googleapiclient's build('calendar', 'v3').
+        Every execute() sleeps `latency` seconds, blocking like the real client.
+        Setting `outage` to N makes every call hang N seconds and then fail.
+        A batch request takes `latency` plus `batch_item_latency` per call in
+        it; with `batch_limit`, calls after the first N of a batch are
+        refused as rate limited (403).
+        """
+        self.latency = latency
+        self.batch_item_latency = 0.0
+        self.batch_limit: Optional[int] = None
+        self.outage: Optional[float] = None
+        self.calendars: Dict[str, Dict[str, Dict]] = {'primary': {}}
+        self.imported: Dict[tuple, str] = {}
+        # (query, sorted events) of the last events.list, reused for its later pages
+        self.last_list = None
+        self.calls = 0
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def next_id(self) -> str:
+        return f"fake{next(self._ids):08d}"
+
+    def calendar(self, calendar_id: str) -> Dict[str, Dict]:
+        return self.calendars.setdefault(calendar_id, {})
+
+    def seed(self, start: datetime, days: int = 7, per_day: int = 4, calendar_id: str = 'primary'):
+        """Fill `days` days from `start` with one-hour events spread over working hours"""
+        events = self.calendar(calendar_id)
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        for offset in range(days):
+            for slot in range(per_day):
+                event_start = config.TIMEZONE.normalize(day + timedelta(days=offset, hours=9 + slot * 2))
+                event_id = self.next_id()
+                events[event_id] = {
+                    'id': event_id,
+                    'status': 'confirmed',
+                    'summary': f"Rapat tim {offset}-{slot}",
+                    'location': 'Ruang meeting',
+                    'start': {'dateTime': event_start.isoformat(), 'timeZone': config.TIMEZONE_STR},
+                    'end': {'dateTime': (event_start + timedelta(hours=1)).isoformat(),
+                            'timeZone': config.TIMEZONE_STR},
+                }
+
+    def events(self):
+        return _FakeEvents(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def freebusy(self):
+        return _FakeFreeBusy(self)
+
+    def calendarList(self):
+        return _FakeCalendarList(self)
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiModel:
+    _MESSAGE_RE = re.compile(r'Pesan dari user: "(.*?)"', re.S)
+    _HOUR_RE = re.compile(r'\b(\d{1,2})(?:[:.](\d{2}))?\b')
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Stand-in for genai.GenerativeModel. Messages with an hour in them come
+        back as a create_event JSON for tomorrow; everything else as chat text.
+        Setting `outage` to N makes every call hang N seconds and then fail.
+        """
+        self.latency = latency
+        self.outage: Optional[float] = None
+        self.calls = 0
+
+    def generate_content(self, prompt: str, **kwargs) -> FakeResponse:
+        self.calls += 1
+        if self.outage is not None:
+            time.sleep(self.outage)
+            raise ConnectionError('Gemini outage (fake)')
+        if self.latency:
+            time.sleep(self.latency)
+
+        match = self._MESSAGE_RE.search(prompt)
+        hour = self._HOUR_RE.search(match.group(1)) if match else None
+        if not hour:
+            return FakeResponse("Tentu! Coba kelompokkan rapat di pagi hari dan sisakan waktu fokus di sore hari.")
+
+        start_hour = int(hour.group(1)) % 24
+        if start_hour < 7:
+            start_hour += 12
+        day = (datetime.now(config.TIMEZONE) + timedelta(days=1)).strftime('%Y-%m-%d')
+        return FakeResponse(json.dumps({
+            'action': 'create_event',
+            'title': 'Meeting dari chat',
+            'start_date': day,
+            'start_time': f"{start_hour:02d}:{hour.group(2) or '00'}",
+            'end_date': day,
+            'end_time': f"{min(start_hour + 1, 23):02d}:{hour.group(2) or '00'}",
+            'location': '',
+            'description': '',
+        }))
+
+
+class FakeBotAPI(BaseRequest):
+    BOT_USER = {'id': 1000000, 'is_bot': True, 'first_name': 'Calendar Bot', 'username': 'fake_calendar_bot'}
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Telegram Bot API stand-in for python-telegram-bot's request layer.
+        Pass it to ApplicationBuilder.request(); every call except getMe
+        awaits `latency` seconds and succeeds.
+        """
+        self.latency = latency
+        self.calls: Dict[str, int] = {}
+        self.last_text: Dict[int, str] = {}
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+        if endpoint == 'getMe':
+            result = self.BOT_USER
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            result = True
+            if endpoint in ('sendMessage', 'editMessageText'):
+                chat_id = int(params.get('chat_id', 0))
+                self.last_text[chat_id] = params.get('text', '')
+                result = {
+                    'message_id': next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': self.BOT_USER,
+                    'text': params.get('text', ''),
+                }
+        return 200, json.dumps({'ok': True, 'result': result}).encode('utf-8')
+
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.0):
+        """Shared sink for everything the bot sends; each send awaits `latency` seconds"""
+        self.latency = latency
+        self.sent = 0
+        self.bytes_sent = 0
+        self.message_ids = itertools.count(1)
+
+    async def send(self, text: str = ''):
+        self.sent += 1
+        self.bytes_sent += len(text.encode('utf-8'))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeUser:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.first_name = f"User{user_id}"
+        self.username = f"user{user_id}"
+
+
+class FakeChat:
+    def __init__(self, chat_id: int):
+        self.id = chat_id
+
+
+class FakeMessage:
+    def __init__(self, telegram: FakeTelegram, user: FakeUser, text: str = ''):
+        self.telegram = telegram
+        self.from_user = user
+        self.chat = FakeChat(user.id)
+        self.chat_id = user.id
+        self.message_id = next(telegram.message_ids)
+        self.text = text
+        self.replies: List[str] = []
+
+    async def reply_text(self, text: str, **kwargs):
+        self.replies.append(text)
+        await self.telegram.send(text)
+        return FakeMessage(self.telegram, self.from_user, text)
+
+    async def edit_text(self, text: str, **kwargs):
+        self.text = text
+        await self.telegram.send(text)
+
+    async def reply_document(self, document, filename: str = None, caption: str = '', **kwargs):
+        self.replies.append(caption or '')
+        await self.telegram.send(caption or '')
+        self.telegram.bytes_sent += len(document.read())
+
+
+class FakeCallbackQuery:
+    def __init__(self, message: FakeMessage, data: str):
+        self.message = message
+        self.from_user = message.from_user
+        self.data = data
+
+    async def answer(self, *args, **kwargs):
+        await self.message.telegram.send()
+
+    async def edit_message_text(self, text: str, **kwargs):
+        await self.message.telegram.send(text)
+
+    async def edit_message_reply_markup(self, **kwargs):
+        await self.message.telegram.send()
+
+
+class FakeUpdate:
+    def __init__(self, message: FakeMessage, callback_data: Optional[str] = None):
+        self.message = None if callback_data else message
+        self.callback_query = FakeCallbackQuery(message, callback_data) if callback_data else None
+        self.effective_user = message.from_user
+        self.effective_chat = message.chat
+        self.effective_message = message
+
+
+class FakeBot:
+    def __init__(self, telegram: FakeTelegram):
+        self.telegram = telegram
+
+    async def send_chat_action(self, chat_id, action, **kwargs):
+        await self.telegram.send()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.telegram.send(text)
+
+
+class FakeContext:
+    def __init__(self, telegram: FakeTelegram, args: List[str] = None):
+        self.bot = FakeBot(telegram)
+        self.args = args or []
+        self.user_data = {}
+        self.chat_data = {}
+
+
+class FakeClient:
+    def __init__(self, telegram: FakeTelegram, user_id: int):
+        """One simulated chat; builds updates and contexts for handler calls"""
+        self.telegram = telegram
+        self.user = FakeUser(user_id)
+
+    def message(self, text: str):
+        """(update, context) for a text message or command"""
+        args = text.split()[1:] if text.startswith('/') else []
+        return FakeUpdate(FakeMessage(self.telegram, self.user, text)), FakeContext(self.telegram, args)
+
+    def callback(self, data: str):
+        """(update, context) for an inline keyboard press"""
+        return (FakeUpdate(FakeMessage(self.telegram, self.user), callback_data=data),
+                FakeContext(self.telegram))
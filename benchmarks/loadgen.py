@@ -0,0 +1,305 @@
+"""
+Load generator
+Replays synthetic Telegram updates from many simulated users into the real
+Application (all handlers and ConversationHandler states registered by
+main.build_application) and ramps the user count to find the saturation point.
+
+Run from the project root:
+    python -m benchmarks.loadgen
+    python -m benchmarks.loadgen --users 10 100 500 1000 2000 --duration 20 --think-time 5 \
+        --calendar-latency 0.08 --gemini-latency 0.5 --telegram-latency 0.05
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+from telegram import Update
+from telegram.ext import Application, ConversationHandler, TypeHandler
+import config
+import main as bot_main
+from benchmarks.fakes import FakeBotAPI, FakeCalendarBackend, FakeGeminiModel
+from bot.handlers import BotHandlers
+from services.google_calendar import GoogleCalendarService
+from utils import tracing
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+FAKE_TOKEN = '1000000:load-generator-token'
+
+# Handler group that runs after every real handler and marks the update as processed
+DONE_GROUP = 1000
+
+AI_MESSAGES = [
+    'meeting dengan tim besok jam 3 sore',
+    'beri tips produktivitas',
+    'makan siang dengan klien besok jam 12',
+    'kapan saya free hari ini',
+]
+
+
+def add_event_script(rng: random.Random) -> List[str]:
+    """Walks WAITING_EVENT_TITLE ... WAITING_EVENT_LOCATION"""
+    return [
+        '/add_event',
+        f"Sesi fokus {rng.randint(1, 999)}",
+        rng.choice(['besok', 'lusa', 'hari ini']),
+        f"{rng.randint(8, 18):02d}:{rng.choice(['00', '30'])}",
+        rng.choice(['1 jam', '30 menit', '2 jam']),
+        rng.choice(['skip', 'Kantor']),
+    ]
+
+
+def delete_script(rng: random.Random) -> List[str]:
+    """Walks WAITING_DELETE_SELECTION"""
+    return ['/delete_event', '1']
+
+
+def list_week_script(rng: random.Random) -> List[str]:
+    return ['/list_week']
+
+
+def ai_chat_script(rng: random.Random) -> List[str]:
+    return [rng.choice(AI_MESSAGES)]
+
+
+# (script, weight)
+SCRIPT_MIX = [
+    (add_event_script, 3),
+    (list_week_script, 3),
+    (ai_chat_script, 2),
+    (delete_script, 2),
+]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class LoadRun:
+    def __init__(self, users: int, args):
+        """One step of the ramp: a fresh Application, fake back ends and `users` simulated chats"""
+        self.users = users
+        self.args = args
+        self.update_ids = itertools.count(1)
+        self.waiting: Dict[int, asyncio.Future] = {}
+        self.latencies: List[float] = []
+        self.lane_latencies: Dict[str, List[float]] = {}
+        self.timeouts = 0
+        self.sent = 0
+
+        self.backend = FakeCalendarBackend(latency=args.calendar_latency)
+        self.backend.seed(datetime.now(config.TIMEZONE), days=14, per_day=4)
+        self.model = FakeGeminiModel(latency=args.gemini_latency)
+        self.api = FakeBotAPI(latency=args.telegram_latency)
+
+        # build_application registers the module-level handlers
+        handlers = BotHandlers()
+        handlers.calendar_service = GoogleCalendarService(service=self.backend)
+        handlers.ai_service.model = self.model
+        # Writes queued during the run stay out of the project directory
+        handlers.write_queue.open(os.path.join(tempfile.mkdtemp(prefix='loadgen-writes-'), 'pending_writes.jsonl'))
+        bot_main.bot_handlers = handlers
+
+        builder = (Application.builder()
+                   .token(FAKE_TOKEN)
+                   .request(tracing.TracingRequest(self.api) if args.trace else self.api)
+                   .get_updates_request(FakeBotAPI())
+                   .updater(None))
+        if args.concurrent_updates:
+            builder = builder.concurrent_updates(args.concurrent_updates)
+        if args.trace:
+            builder = builder.application_class(tracing.TracedApplication)
+        self.application = bot_main.build_application(builder, lanes=not args.concurrent_updates)
+        self.application.add_handler(TypeHandler(Update, self._mark_done), group=DONE_GROUP)
+        # Same classification as the lane dispatcher, also when it is not installed
+        self.conversations = [handler for handler in self.application.handlers[0]
+                              if isinstance(handler, ConversationHandler)]
+
+    async def _mark_done(self, update: Update, context):
+        future = self.waiting.pop(update.update_id, None)
+        if future and not future.done():
+            future.set_result(None)
+
+    def _make_update(self, user_id: int, text: str) -> Update:
+        message = {
+            'message_id': next(self.update_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"User{user_id}"},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.de_json({'update_id': message['message_id'], 'message': message}, self.application.bot)
+
+    async def send(self, user_id: int, text: str):
+        """Enqueue one update and wait until every handler group has processed it"""
+        update = self._make_update(user_id, text)
+        lane = bot_main.update_lane(update, self.conversations)
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[update.update_id] = future
+        started = time.perf_counter()
+        await self.application.update_queue.put(update)
+        self.sent += 1
+        try:
+            await asyncio.wait_for(future, timeout=self.args.timeout)
+            self.latencies.append(time.perf_counter() - started)
+            self.lane_latencies.setdefault(lane, []).append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            self.waiting.pop(update.update_id, None)
+            self.timeouts += 1
+
+    async def user(self, user_id: int, deadline: float):
+        rng = random.Random(self.args.seed + user_id)
+        scripts, weights = zip(*SCRIPT_MIX)
+        think = self.args.think_time
+        # Spread the first messages so users do not all arrive at once
+        await asyncio.sleep(rng.uniform(0, think))
+        while time.perf_counter() < deadline:
+            for text in rng.choices(scripts, weights)[0](rng):
+                await self.send(user_id, text)
+                # Answer the conflict prompt so the conversation ends cleanly
+                if 'Lanjutkan?' in self.api.last_text.get(user_id, ''):
+                    self.api.last_text.pop(user_id)
+                    await self.send(user_id, 'ya')
+                await asyncio.sleep(rng.expovariate(1 / think) if think else 0)
+
+    async def run(self) -> Dict:
+        async with self.application:
+            await self.application.start()
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            await asyncio.gather(*(self.user(200000 + index, deadline) for index in range(self.users)))
+            elapsed = time.perf_counter() - started
+            await self.application.stop()
+
+        latencies = sorted(self.latencies)
+        return {
+            'users': self.users,
+            'updates': len(latencies),
+            'timeouts': self.timeouts,
+            'seconds': round(elapsed, 2),
+            'updates_per_second': round(len(latencies) / elapsed, 2),
+            # What the users would send if the bot answered instantly
+            'offered_per_second': round(self.users / self.args.think_time, 2) if self.args.think_time else None,
+            'latency_ms': {
+                'p50': round(_percentile(latencies, 0.50) * 1000, 2),
+                'p95': round(_percentile(latencies, 0.95) * 1000, 2),
+                'p99': round(_percentile(latencies, 0.99) * 1000, 2),
+                'max': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            'lane_latency_ms': {
+                lane: {
+                    'p50': round(_percentile(sorted(values), 0.50) * 1000, 2),
+                    'p99': round(_percentile(sorted(values), 0.99) * 1000, 2),
+                }
+                for lane, values in sorted(self.lane_latencies.items())
+            },
+            'calendar_calls': self.backend.calls,
+            'gemini_calls': self.model.calls,
+            'telegram_calls': sum(self.api.calls.values()),
+        }
+
+
+def find_saturation(steps: List[Dict], slo_ms: float, degradation: float):
+    """
+    First step where latency degrades: p99 over the SLO, p50 more than
+    `degradation` times the lightest step's p50, or any timeouts.
+    """
+    baseline = steps[0]['latency_ms']['p50'] if steps else 0.0
+    for step in steps:
+        latency = step['latency_ms']
+        reasons = []
+        if latency['p99'] > slo_ms:
+            reasons.append(f"p99 {latency['p99']:.0f} ms > SLO {slo_ms:.0f} ms")
+        if baseline and latency['p50'] > baseline * degradation:
+            reasons.append(f"p50 {latency['p50']:.0f} ms > {degradation:g}x baseline")
+        if step['timeouts']:
+            reasons.append(f"{step['timeouts']} timeouts")
+        if reasons:
+            return step['users'], '; '.join(reasons)
+    return None, ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 50, 100, 250, 500, 1000],
+                        help='simulated user counts, one ramp step each')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per step')
+    parser.add_argument('--think-time', type=float, default=3.0, help='mean seconds between messages per user')
+    parser.add_argument('--calendar-latency', type=float, default=0.05)
+    parser.add_argument('--gemini-latency', type=float, default=0.3)
+    parser.add_argument('--telegram-latency', type=float, default=0.03)
+    parser.add_argument('--concurrent-updates', type=int, default=0,
+                        help='plain Application.concurrent_updates instead of the lane dispatcher '
+                             '(0 = lanes, like main.py; 1 = sequential)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before an update counts as lost')
+    parser.add_argument('--slo', type=float, default=1000.0, help='p99 latency budget in ms')
+    parser.add_argument('--degradation', type=float, default=5.0,
+                        help='p50 growth over the lightest step that counts as degraded')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--stop-at-saturation', action='store_true', help='skip heavier steps once saturated')
+    parser.add_argument('--output', help='JSON results path (default: benchmarks/results/loadgen-<time>.json)')
+    parser.add_argument('--trace', help='also write per-update traces to this JSONL file')
+    args = parser.parse_args()
+    # Application start/stop lines would interleave with the table
+    logging.getLogger('telegram').setLevel(logging.WARNING)
+    if args.trace:
+        tracing.configure(trace_file=args.trace)
+
+    dispatch = f"concurrent_updates {args.concurrent_updates}" if args.concurrent_updates else 'update lanes'
+    print(f"think {args.think_time}s, latency calendar {args.calendar_latency}s gemini {args.gemini_latency}s "
+          f"telegram {args.telegram_latency}s, {dispatch}\n")
+    print(f"{'users':>6} {'offered/s':>10} {'done/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'timeouts':>9}"
+          f" {'fast p99':>9} {'ai p99':>9}")
+
+    steps = []
+    for users in args.users:
+        result = asyncio.run(LoadRun(users, args).run())
+        steps.append(result)
+        latency = result['latency_ms']
+        print(f"{users:>6} {result['offered_per_second'] or 0:>10.1f} {result['updates_per_second']:>8.1f} "
+              f"{latency['p50']:>9.1f} {latency['p95']:>9.1f} {latency['p99']:>9.1f} {result['timeouts']:>9}"
+              + ''.join(f" {result['lane_latency_ms'].get(lane, {}).get('p99', 0.0):>9.1f}"
+                        for lane in (bot_main.FAST_LANE, bot_main.AI_LANE)))
+        if args.stop_at_saturation and find_saturation(steps, args.slo, args.degradation)[0]:
+            break
+
+    saturated_at, reason = find_saturation(steps, args.slo, args.degradation)
+    healthy = [step['users'] for step in steps if saturated_at is None or step['users'] < saturated_at]
+    if saturated_at is None:
+        print(f"\nNo saturation up to {steps[-1]['users']} users")
+    else:
+        print(f"\nSaturated at {saturated_at} users ({reason}); "
+              f"last healthy step: {healthy[-1] if healthy else 'none'} users")
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"loadgen-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'settings': {key: value for key, value in vars(args).items() if key != 'output'},
+            'steps': steps,
+            'saturated_at': saturated_at,
+            'saturation_reason': reason,
+            'max_healthy_users': healthy[-1] if healthy else None,
+        }, f, indent=2)
+    print(f"Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Admission
+Per-user token buckets, duplicate suppression and load shedding for AI-bound messages
+"""
+import time
+from typing import Dict, Optional, Tuple
+from utils.metrics import counter
+
+SHED_UPDATES = counter(
+    'bot_ai_shed_total', 'AI-bound messages answered locally instead of reaching Gemini', ('reason',))
+
+RATE_LIMITED = 'rate_limited'
+DUPLICATE = 'duplicate'
+OVERLOADED = 'overloaded'
+
+# Local replies, so a shed message costs one sendMessage and nothing else
+SHED_REPLIES = {
+    RATE_LIMITED: "⏳ Terlalu banyak pesan ke AI dalam waktu singkat. Tunggu sebentar lalu coba lagi.\n"
+                  "Perintah seperti /list_events dan /add_event tetap bisa dipakai.",
+    DUPLICATE: "⏳ Pesan yang sama baru saja dikirim dan sedang/sudah diproses.",
+    OVERLOADED: "⏳ AI sedang sibuk melayani banyak user. Coba lagi beberapa saat lagi, "
+                "atau gunakan /add_event untuk membuat jadwal langsung.",
+}
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class AdmissionControl:
+    def __init__(self, rate_per_minute: float, burst: int, duplicate_window: float,
+                 max_queue: int, max_users: int = 10000):
+        """
+        Decides whether an AI-bound message may go to Gemini. A user gets
+        `burst` messages at once, refilled at `rate_per_minute`; the same
+        text again within `duplicate_window` seconds is dropped; nothing new
+        is admitted while `max_queue` AI updates are already waiting.
+        """
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.max_queue = max_queue
+        self.max_users = max_users
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._recent: Dict[int, Tuple[str, float]] = {}
+
+    def _bucket(self, user_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_users:
+                self._prune(now)
+            bucket = self._buckets[user_id] = TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def _prune(self, now: float):
+        """Forget users whose bucket has refilled and who sent nothing recently"""
+        for user_id, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * self.rate >= self.burst:
+                del self._buckets[user_id]
+        for user_id, (_, sent) in list(self._recent.items()):
+            if now - sent > self.duplicate_window:
+                del self._recent[user_id]
+
+    def check(self, user_id: int, text: str, queue_depth: int) -> Optional[str]:
+        """None when the message is admitted, otherwise the reason it is shed"""
+        now = time.monotonic()
+        normalized = ' '.join(text.lower().split())
+        recent = self._recent.get(user_id)
+        if recent and recent[0] == normalized and now - recent[1] < self.duplicate_window:
+            reason = DUPLICATE
+        elif queue_depth >= self.max_queue:
+            reason = OVERLOADED
+        else:
+            bucket = self._bucket(user_id, now)
+            if bucket.tokens < 1:
+                reason = RATE_LIMITED
+            else:
+                bucket.tokens -= 1
+                self._recent[user_id] = (normalized, now)
+                return None
+        SHED_UPDATES.inc(reason=reason)
+        return reason
@@ -0,0 +1,221 @@
+"""
+Cluster
+Webhook ingress that shards updates by user id over several bot worker processes
+"""
+import asyncio
+import importlib
+import json
+import logging
+import multiprocessing
+import sys
+import threading
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+from urllib.parse import urlparse
+from telegram import Update
+import config
+from services.state_store import get_store
+from utils.metrics import counter, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+INGRESS_UPDATES = counter(
+    'bot_ingress_updates_total', 'Webhook updates forwarded to workers', ('worker',))
+WORKER_RESTARTS = counter(
+    'bot_worker_restarts_total', 'Worker processes restarted after exiting', ('worker',))
+
+# Update fields whose payload names the user in 'from' (or 'user' for poll answers)
+SENDER_FIELDS = (
+    'message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member',
+    'chat_join_request', 'channel_post', 'edited_channel_post',
+)
+
+
+def update_user_id(update: dict) -> int:
+    """Id of the user (or chat) an update belongs to; 0 when there is none"""
+    for field in SENDER_FIELDS:
+        payload = update.get(field)
+        if payload:
+            sender = payload.get('from') or payload.get('user') or payload.get('chat')
+            if sender:
+                return sender['id']
+    return 0
+
+
+def shard_for(user_id: int, workers: int) -> int:
+    """Stable worker index for a user, the same in every process and run"""
+    return zlib.crc32(str(user_id).encode()) % workers
+
+
+def _load_callable(path: str) -> Callable:
+    module, _, name = path.partition(':')
+    return getattr(importlib.import_module(module), name)
+
+
+async def _run_worker(index: int, inbox, builder_factory: Optional[str], workers: int):
+    import main as bot_main
+
+    bot_main.start_observability(metrics_port=config.METRICS_PORT + 1 + index)
+    builder = _load_callable(builder_factory)() if builder_factory else bot_main.default_builder()
+    application = bot_main.build_application(builder.updater(None))
+    loop = asyncio.get_running_loop()
+
+    # A user always lands on the same worker, so its queued writes stay with it
+    bot_main.bot_handlers.write_queue.open(f"{config.WRITE_QUEUE_FILE}.{index}")
+    # and its daily digest is scheduled by that worker only
+    bot_main.bot_handlers.digests.owns = lambda user_id: shard_for(user_id, workers) == index
+    async with application:
+        await bot_main.post_init(application)
+        await application.start()
+        logger.info(f"Worker {index} ready")
+        while True:
+            payload = await loop.run_in_executor(None, inbox.get)
+            if payload is None:
+                break
+            await application.update_queue.put(Update.de_json(json.loads(payload), application.bot))
+        await application.stop()
+
+
+def worker_main(index: int, inbox, builder_factory: str = None, workers: int = 1):
+    """Entry point of a worker process: a full Application fed from `inbox`"""
+    logging.basicConfig(format=f"[worker {index}] {config.LOG_FORMAT}", level=config.LOG_LEVEL, force=True)
+    try:
+        asyncio.run(_run_worker(index, inbox, builder_factory, workers))
+    except KeyboardInterrupt:
+        pass
+
+
+class ClusterIngress:
+    def __init__(self, workers: int, builder_factory: str = None):
+        """
+        Owns the worker processes and one queue per worker. All updates of a
+        user go to the same worker, so per-user order is preserved and the
+        worker's in-memory state stays authoritative for that user.
+        `builder_factory` ("module:function") replaces main.default_builder in
+        the workers, e.g. to run them against fake back ends.
+        """
+        self.workers = workers
+        self.builder_factory = builder_factory
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=worker_main,
+            args=(index, self.queues[index], self.builder_factory, self.workers),
+            name=f"bot-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.workers):
+            self._start_worker(index)
+        logger.info(f"Started {self.workers} workers")
+
+    def dispatch(self, payload: bytes) -> int:
+        """Queue one raw update for its user's worker; returns the worker index"""
+        index = shard_for(update_user_id(json.loads(payload)), self.workers)
+        process = self.processes[index]
+        if not self._stopping and (process is None or not process.is_alive()):
+            with self._lock:
+                process = self.processes[index]
+                if process is None or not process.is_alive():
+                    # Its queue is kept, so nothing already routed to it is lost
+                    logger.warning(f"Worker {index} is not running; restarting it")
+                    WORKER_RESTARTS.inc(worker=str(index))
+                    self._start_worker(index)
+        self.queues[index].put(payload)
+        INGRESS_UPDATES.inc(worker=str(index))
+        return index
+
+    def stop(self, timeout: float = 30.0):
+        self._stopping = True
+        for inbox in self.queues:
+            inbox.put(None)
+        for process in self.processes:
+            if process:
+                process.join(timeout)
+
+
+def make_webhook_handler(ingress: ClusterIngress, path: str, secret: str):
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path.split('?')[0] != path:
+                self.send_error(404)
+                return
+            if secret and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret:
+                self.send_error(403)
+                return
+            payload = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            try:
+                ingress.dispatch(payload)
+            except (ValueError, KeyError, TypeError):
+                self.send_error(400)
+                return
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+def set_webhook(url: str, secret: str):
+    """Point Telegram at the ingress"""
+    body = {'url': url, 'allowed_updates': Update.ALL_TYPES}
+    if secret:
+        body['secret_token'] = secret
+    request = urllib.request.Request(
+        f"https://api.telegram.org/bot{config.TELEGRAM_BOT_TOKEN}/setWebhook",
+        data=json.dumps(body).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        result = json.loads(response.read())
+    if not result.get('ok'):
+        raise Exception(f"setWebhook failed: {result.get('description')}")
+
+
+def serve_ingress(ingress: ClusterIngress, host: str, port: int, path: str, secret: str) -> ThreadingHTTPServer:
+    """Start the workers and accept webhook posts from a daemon thread"""
+    ingress.start()
+    server = ThreadingHTTPServer((host, port), make_webhook_handler(ingress, path, secret))
+    threading.Thread(target=server.serve_forever, name='webhook-ingress', daemon=True).start()
+    logger.info(f"Webhook ingress listening on {host}:{port}{path}")
+    return server
+
+
+def run_cluster(workers: int):
+    """Run the webhook ingress in this process and `workers` bot processes behind it"""
+    if not config.WEBHOOK_URL:
+        logger.error("WORKERS > 1 needs WEBHOOK_URL (the public HTTPS address of the ingress)")
+        sys.exit(1)
+    if not get_store().shared:
+        logger.warning("STATE_BACKEND_URL is memory://: conversations survive only as long as their "
+                       "worker, and workers will not see each other's calendar writes")
+    if config.METRICS_ENABLED:
+        start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
+
+    ingress = ClusterIngress(workers)
+    path = urlparse(config.WEBHOOK_URL).path or '/'
+    server = serve_ingress(ingress, config.WEBHOOK_LISTEN, config.WEBHOOK_PORT, path, config.WEBHOOK_SECRET)
+    set_webhook(config.WEBHOOK_URL, config.WEBHOOK_SECRET)
+    logger.info(f"Webhook set to {config.WEBHOOK_URL}; {workers} workers running. Press Ctrl+C to stop.")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        ingress.stop()
@@ -0,0 +1,311 @@
+"""
+Digest
+Opt-in daily agenda message: calendars prefetched ahead of the send times, messages paced out
+"""
+import asyncio
+import functools
+import heapq
+import json
+import logging
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from telegram.error import Forbidden, RetryAfter
+import config
+from services.state_store import get_store
+from utils.metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+# Store hash of subscriptions: user id -> {"chat_id", "time": "HH:MM"}
+SUBSCRIBERS_KEY = 'digest:subscribers'
+
+# Prefetches land in this share of the lead window; the rest is slack before the send time
+PREFETCH_SPREAD = 0.9
+# Longest sleep of the scheduler, so a wall clock jump (NTP, suspend) is noticed
+MAX_SLEEP = 60.0
+# Sends of one message before it is given up on after flood control (RetryAfter)
+SEND_ATTEMPTS = 3
+
+DIGEST_SUBSCRIBERS = gauge(
+    'bot_digest_subscribers', 'Users with a daily digest scheduled in this process')
+DIGEST_MESSAGES = counter(
+    'bot_digest_messages_total', 'Daily digests by outcome (sent, failed, blocked: the user '
+    'blocked the bot and was unsubscribed)', ('result',))
+DIGEST_PREFETCHES = counter(
+    'bot_digest_prefetches_total', 'Calendar days listed ahead of digest send times', ('result',))
+DIGEST_QUEUED = gauge(
+    'bot_digest_queued', 'Digests due and waiting for the rate-limited sender')
+DIGEST_DELAY = histogram(
+    'bot_digest_delay_seconds', 'How long after its chosen time a digest went out',
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0))
+
+
+def next_send(clock: str, after: datetime) -> datetime:
+    """First moment after `after` the local clock (config.TIMEZONE) reads `clock` ("HH:MM")"""
+    hour, minute = (int(part) for part in clock.split(':'))
+    day = after.astimezone(config.TIMEZONE).date()
+    while True:
+        moment = config.TIMEZONE.localize(datetime(day.year, day.month, day.day, hour, minute))
+        if moment > after:
+            return moment
+        day += timedelta(days=1)
+
+
+def stagger(calendar_id: str, window: datetime) -> float:
+    """Stable fraction in [0, 1) placing a calendar's prefetch within a lead window"""
+    return zlib.crc32(f"{calendar_id}@{window.isoformat()}".encode()) / 2 ** 32
+
+
+class RateLimitedSender:
+    def __init__(self,
+                 send: Callable[[int, str], Awaitable[object]],
+                 rate: float,
+                 blocked: Callable[[int], None] = None):
+        """
+        Sends queued messages one after another, at most `rate` a second
+        (Telegram takes about 30 a second from a bot before flood control).
+        A message's text is built by its `compose()` just before it goes
+        out, so a long queue still sends current agendas. A RetryAfter
+        pauses the whole queue for as long as Telegram asks; a chat that
+        blocked the bot is reported to `blocked(chat_id)`.
+        """
+        self.send = send
+        self.interval = 1.0 / rate
+        self.blocked = blocked
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._next_at = 0.0
+
+    def start(self) -> asyncio.Task:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def submit(self, chat_id: int, compose: Callable[[], Awaitable[str]], due: datetime):
+        """Queue a message for `chat_id`; `due` is when it was meant to go out"""
+        self._queue.put_nowait((chat_id, compose, due))
+        DIGEST_QUEUED.inc()
+
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def run(self):
+        while True:
+            chat_id, compose, due = await self._queue.get()
+            DIGEST_QUEUED.dec()
+            now = time.monotonic()
+            if self._next_at > now:
+                await asyncio.sleep(self._next_at - now)
+            self._next_at = max(now, self._next_at) + self.interval
+            try:
+                await self._deliver(chat_id, compose, due)
+            except Exception:
+                DIGEST_MESSAGES.inc(result='failed')
+                logger.exception(f"Could not send digest to chat {chat_id}")
+
+    async def _deliver(self, chat_id: int, compose: Callable[[], Awaitable[str]], due: datetime):
+        text = await compose()
+        for _ in range(SEND_ATTEMPTS):
+            try:
+                await self.send(chat_id, text)
+            except RetryAfter as error:
+                logger.warning(f"Flood control: digests paused for {error.retry_after}s")
+                await asyncio.sleep(float(error.retry_after))
+                self._next_at = time.monotonic() + self.interval
+                continue
+            except Forbidden:
+                DIGEST_MESSAGES.inc(result='blocked')
+                if self.blocked:
+                    self.blocked(chat_id)
+                return
+            DIGEST_MESSAGES.inc(result='sent')
+            DIGEST_DELAY.observe(max(0.0, time.time() - due.timestamp()))
+            return
+        DIGEST_MESSAGES.inc(result='failed')
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+class DigestScheduler:
+    def __init__(self,
+                 calendars: Callable[[int], List[str]],
+                 prefetch: Callable[[str, date], Awaitable[None]],
+                 message: Callable[[int, date], Awaitable[str]],
+                 owns: Callable[[int], bool] = None):
+        """
+        Sends each subscriber their agenda every day at their chosen local
+        time. In the config.DIGEST_LEAD seconds before a send time, every
+        calendar the subscribers due then show (`calendars(user_id)`) is
+        listed once with `prefetch(calendar_id, day)`, at a moment spread
+        over the window by a hash of the calendar, so 07:00 for everyone is
+        a handful of list calls between 06:45 and 06:59 and not one per user
+        at 07:00. At the send time `message(user_id, day)` renders the
+        agenda from those listings, through a RateLimitedSender.
+        Subscriptions are kept in the state store; only the users `owns`
+        accepts (a worker's shard) are scheduled here. A digest whose time
+        passed while the bot was down is not sent late.
+        """
+        self.calendars = calendars
+        self.prefetch = prefetch
+        self.message = message
+        self.owns = owns or (lambda user_id: True)
+        self.sender: Optional[RateLimitedSender] = None
+        self.subscribers: Dict[int, Dict] = {}
+        self._next: Dict[int, datetime] = {}
+        # (send time, user id) and (lead window start, send time, user id); stale entries are skipped
+        self._sends: List[Tuple[datetime, int]] = []
+        self._prepares: List[Tuple[datetime, datetime, int]] = []
+        # (calendar id, day) -> planned prefetch time, and the prefetches not started yet
+        self._planned: Dict[Tuple[str, date], datetime] = {}
+        self._fetches: List[Tuple[datetime, str, date]] = []
+        self._running = set()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def subscription(self, user_id: int) -> Optional[Dict]:
+        return self.subscribers.get(user_id)
+
+    def subscribe(self, user_id: int, chat_id: int, clock: str):
+        """Send `user_id` their agenda in `chat_id` every day at `clock` ("HH:MM")"""
+        subscription = {'chat_id': chat_id, 'time': clock}
+        get_store().hset(SUBSCRIBERS_KEY, str(user_id), json.dumps(subscription))
+        self._add(user_id, subscription, datetime.now(config.TIMEZONE))
+        self.wake()
+
+    def unsubscribe(self, user_id: int) -> bool:
+        """Stop the user's digest; False when there was none"""
+        if self.subscribers.pop(user_id, None) is None:
+            return False
+        get_store().hdel(SUBSCRIBERS_KEY, str(user_id))
+        self._next.pop(user_id, None)
+        DIGEST_SUBSCRIBERS.set(len(self.subscribers))
+        return True
+
+    def unsubscribe_chat(self, chat_id: int):
+        """The chat blocked the bot: stop every digest sent there"""
+        for user_id, subscription in list(self.subscribers.items()):
+            if subscription['chat_id'] == chat_id:
+                self.unsubscribe(user_id)
+
+    def load(self, now: datetime = None):
+        """Schedule the stored subscriptions this process owns"""
+        now = now or datetime.now(config.TIMEZONE)
+        for field, value in get_store().hgetall(SUBSCRIBERS_KEY).items():
+            user_id = int(field)
+            if self.owns(user_id):
+                self._add(user_id, json.loads(value), now)
+        if self.subscribers:
+            logger.info(f"{len(self.subscribers)} daily digests scheduled")
+
+    def _add(self, user_id: int, subscription: Dict, now: datetime):
+        self.subscribers[user_id] = subscription
+        self._schedule(user_id, now)
+        DIGEST_SUBSCRIBERS.set(len(self.subscribers))
+
+    def _schedule(self, user_id: int, after: datetime):
+        send_at = next_send(self.subscribers[user_id]['time'], after)
+        self._next[user_id] = send_at
+        heapq.heappush(self._sends, (send_at, user_id))
+        heapq.heappush(self._prepares, (send_at - timedelta(seconds=config.DIGEST_LEAD), send_at, user_id))
+
+    def due(self, now: datetime) -> Tuple[List[Tuple[str, date]], List[Tuple[int, datetime]], Optional[datetime]]:
+        """
+        Advance the schedule to `now`: the (calendar id, day) listings to
+        prefetch now, the (user id, send time) digests due now, and when
+        something is due next (None: nothing scheduled)
+        """
+        lead = timedelta(seconds=config.DIGEST_LEAD)
+        while self._prepares and self._prepares[0][0] <= now:
+            window, send_at, user_id = heapq.heappop(self._prepares)
+            if self._next.get(user_id) != send_at:
+                continue
+            for calendar_id in self.calendars(user_id):
+                key = (calendar_id, send_at.date())
+                planned = self._planned.get(key)
+                # A listing made in this send time's window is fresh enough for it
+                if planned is None or planned < window:
+                    fetch_at = window + lead * PREFETCH_SPREAD * stagger(calendar_id, window)
+                    self._planned[key] = fetch_at
+                    heapq.heappush(self._fetches, (fetch_at, calendar_id, key[1]))
+
+        fetches = []
+        while self._fetches and self._fetches[0][0] <= now:
+            fetch_at, calendar_id, day = heapq.heappop(self._fetches)
+            if self._planned.get((calendar_id, day)) == fetch_at:
+                fetches.append((calendar_id, day))
+
+        sends = []
+        while self._sends and self._sends[0][0] <= now:
+            send_at, user_id = heapq.heappop(self._sends)
+            if self._next.get(user_id) != send_at:
+                continue
+            sends.append((user_id, send_at))
+            self._schedule(user_id, send_at)
+
+        yesterday = now.date() - timedelta(days=1)
+        for key in [key for key in self._planned if key[1] < yesterday]:
+            del self._planned[key]
+
+        heads = [heap[0][0] for heap in (self._prepares, self._fetches, self._sends) if heap]
+        return fetches, sends, min(heads) if heads else None
+
+    def start(self, sender: RateLimitedSender) -> asyncio.Task:
+        self.sender = sender
+        self._wake = asyncio.Event()
+        self.load()
+        sender.start()
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def wake(self):
+        """The subscriptions changed: look at the schedule again now"""
+        if self._wake:
+            self._wake.set()
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            now = datetime.now(config.TIMEZONE)
+            fetches, sends, next_at = self.due(now)
+            for calendar_id, day in fetches:
+                task = asyncio.create_task(self._prefetch(calendar_id, day))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+            for user_id, send_at in sends:
+                self.sender.submit(self.subscribers[user_id]['chat_id'],
+                                   functools.partial(self.message, user_id, send_at.date()), send_at)
+            wait = MAX_SLEEP if next_at is None else min(MAX_SLEEP, (next_at - now).total_seconds())
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, wait))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _prefetch(self, calendar_id: str, day: date):
+        try:
+            await self.prefetch(calendar_id, day)
+        except Exception as error:
+            # The digest lists the calendar itself when it is sent
+            DIGEST_PREFETCHES.inc(result='failed')
+            logger.warning(f"Digest prefetch of calendar {calendar_id} for {day} failed: {error}")
+            return
+        DIGEST_PREFETCHES.inc(result='fetched')
+
+    async def stop(self):
+        for task in (self._task, *self._running):
+            if task:
+                task.cancel()
+        if self._task:
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self.sender:
+            await self.sender.stop()
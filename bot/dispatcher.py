@@ -0,0 +1,205 @@
+"""
+Dispatcher
+Update processor that runs cheap and AI-bound updates in separate concurrency lanes
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+import config
+from utils.metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+FAST_LANE = 'fast'
+AI_LANE = 'ai'
+
+LANE_WAITING = gauge(
+    'bot_lane_waiting_updates', 'Updates queued for a free slot in their lane', ('lane',))
+LANE_ACTIVE = gauge(
+    'bot_lane_active_updates', 'Updates being processed in a lane', ('lane',))
+LANE_WAIT = histogram(
+    'bot_lane_wait_seconds', 'Time an update queued before its lane had a free slot', ('lane',),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+CHAT_QUEUES = gauge(
+    'bot_chat_queues', 'Chats with updates queued or in progress')
+CHAT_BACKLOG_DROPPED = counter(
+    'bot_chat_backlog_dropped_total', 'Updates dropped because their chat already had a full backlog')
+
+_shed_reason: ContextVar[Optional[str]] = ContextVar('shed_reason', default=None)
+
+
+def shed_reason() -> Optional[str]:
+    """Why the update being handled was shed by admission control, or None"""
+    return _shed_reason.get()
+
+
+# Blocking calls of a lane run on its own threads: Gemini calls sized like the AI
+# lane, Calendar calls like the HTTP pool (more threads would only queue for a client)
+LANE_THREADS = {AI_LANE: config.AI_LANE_CONCURRENCY, FAST_LANE: config.CALENDAR_HTTP_POOL_SIZE}
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+async def run_blocking(lane: str, func: Callable, *args, **kwargs):
+    """
+    Run a blocking call on `lane`'s thread pool so it does not stall the
+    event loop (and every other lane with it). The trace context is copied.
+    """
+    executor = _executors.get(lane)
+    if executor is None:
+        executor = _executors[lane] = ThreadPoolExecutor(
+            max_workers=LANE_THREADS.get(lane, 4), thread_name_prefix=f"lane-{lane}")
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+class LaneUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, limits: Dict[str, int], classify: Callable[[object], str] = None,
+                 max_backlog: int = 20, max_pending: int = 10000):
+        """
+        Updates of different chats run concurrently; updates of one chat run
+        strictly one after another in arrival order, so ConversationHandler
+        steps never overtake each other. A chat with `max_backlog` updates
+        queued or running drops further ones.
+        `limits` maps lane name -> concurrent updates in that lane; the first
+        lane is the default. `classify(update)` picks the lane and may be set
+        after construction (the handlers it inspects are built later).
+        `max_pending` is PTB's own overall limit: it only bounds memory here,
+        because a lane that is full must not take slots from the others.
+        `admit(update, lane)` returns None or a reason to shed the update:
+        a shed update skips the lane queue and runs at once with the reason
+        in shed_reason(), so handlers can answer it without the slow call.
+        """
+        super().__init__(max_pending)
+        self.limits = dict(limits)
+        self.default_lane = next(iter(self.limits))
+        self.classify = classify
+        self.admit: Callable[[object, str], Optional[str]] = None
+        self.waiting = {lane: 0 for lane in self.limits}
+        self.active = {lane: 0 for lane in self.limits}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.max_backlog = max_backlog
+        self._backlog: Dict[int, int] = {}
+        self._tails: Dict[int, asyncio.Future] = {}
+
+    @staticmethod
+    def chat_key(update: object) -> Optional[int]:
+        """Ordering key of an update: its chat, else its user, else None (unordered)"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat:
+            return update.effective_chat.id
+        if update.effective_user:
+            return update.effective_user.id
+        return None
+
+    def lane_for(self, update: object) -> str:
+        if self.classify is None:
+            return self.default_lane
+        try:
+            lane = self.classify(update)
+        except Exception:
+            logger.exception("Could not classify update; using the default lane")
+            return self.default_lane
+        return lane if lane in self.limits else self.default_lane
+
+    def queue_depth(self, lane: str) -> int:
+        """Updates waiting in `lane` right now (not counting those running)"""
+        return self.waiting.get(lane, 0)
+
+    def _lane_semaphore(self, lane: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(lane)
+        if semaphore is None:
+            semaphore = self._semaphores[lane] = asyncio.Semaphore(self.limits[lane])
+        return semaphore
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = self.chat_key(update)
+        if key is None:
+            await self._process_in_lane(update, coroutine)
+            return
+
+        backlog = self._backlog.get(key, 0)
+        if backlog >= self.max_backlog:
+            coroutine.close()
+            CHAT_BACKLOG_DROPPED.inc()
+            logger.warning(f"Dropped update {getattr(update, 'update_id', '?')}: "
+                           f"chat {key} already has {backlog} updates queued")
+            return
+
+        # Chain behind the chat's previous update. This runs before the first
+        # await, and PTB starts one task per update in arrival order.
+        previous = self._tails.get(key)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[key] = done
+        self._backlog[key] = backlog + 1
+        CHAT_QUEUES.set(len(self._backlog))
+        try:
+            if previous is not None:
+                try:
+                    # wait() rather than await, so a cancelled waiter leaves the chain intact
+                    await asyncio.wait((previous,))
+                except asyncio.CancelledError:
+                    coroutine.close()
+                    raise
+            await self._process_in_lane(update, coroutine)
+        finally:
+            done.set_result(None)
+            remaining = self._backlog[key] - 1
+            if remaining:
+                self._backlog[key] = remaining
+            else:
+                # Nothing is chained behind this update, so it is still the tail
+                del self._backlog[key]
+                del self._tails[key]
+            CHAT_QUEUES.set(len(self._backlog))
+
+    async def _process_in_lane(self, update: object, coroutine: Awaitable[Any]) -> None:
+        # Classified only now: a conversation step is recognised once the
+        # chat's previous update has moved the conversation along
+        lane = self.lane_for(update)
+        reason = self.admit(update, lane) if self.admit else None
+        if reason:
+            token = _shed_reason.set(reason)
+            try:
+                await coroutine
+            finally:
+                _shed_reason.reset(token)
+            return
+
+        semaphore = self._lane_semaphore(lane)
+        queued = time.perf_counter()
+        self.waiting[lane] += 1
+        LANE_WAITING.set(self.waiting[lane], lane=lane)
+        try:
+            await semaphore.acquire()
+        except asyncio.CancelledError:
+            coroutine.close()
+            raise
+        finally:
+            self.waiting[lane] -= 1
+            LANE_WAITING.set(self.waiting[lane], lane=lane)
+        LANE_WAIT.observe(time.perf_counter() - queued, lane=lane)
+
+        self.active[lane] += 1
+        LANE_ACTIVE.set(self.active[lane], lane=lane)
+        try:
+            await coroutine
+        finally:
+            self.active[lane] -= 1
+            LANE_ACTIVE.set(self.active[lane], lane=lane)
+            semaphore.release()
+
+    async def initialize(self) -> None:
+        # Created inside the running loop (Python 3.8/3.9 semaphores bind to it)
+        self._semaphores = {lane: asyncio.Semaphore(limit) for lane, limit in self.limits.items()}
+
+    async def shutdown(self) -> None:
+        pass
+
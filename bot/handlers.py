@@ -4,13 +4,54 @@ Handles all bot commands and interactions
 """
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from datetime import datetime, timedelta
-import re
+from telegram.helpers import escape_markdown
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List
+import itertools
+import logging
+import os
+import tempfile
+import time
 import config
 from services.google_calendar import GoogleCalendarService
 from services.gemini_ai import GeminiAIService
-from bot.keyboards import get_main_menu, get_calendar_menu, get_confirm_keyboard, get_quick_reply_keyboard
-from utils.helpers import format_event, parse_datetime_input
+from services.state_store import StateMap
+from services.write_queue import (
+    CREATE,
+    DELETE,
+    DUPLICATE_WRITES,
+    UPDATE,
+    WriteQueue,
+    WriteReplayer,
+    apply_write,
+    event_id_for,
+    is_retryable
+)
+from bot.admission import SHED_REPLIES
+from bot.digest import DigestScheduler, RateLimitedSender
+from bot.dispatcher import AI_LANE, FAST_LANE, run_blocking, shed_reason
+from bot.keyboards import (
+    get_main_menu,
+    get_calendar_menu,
+    get_confirm_keyboard,
+    get_conflict_keyboard,
+    get_calendar_selection_keyboard,
+    get_quick_reply_keyboard
+)
+from utils.helpers import (
+    format_event,
+    parse_datetime_input,
+    parse_time_input,
+    parse_duration_input,
+    format_duration,
+    get_event_bounds,
+    classify_intent,
+    mentions_action
+)
+from utils.ics import read_events, write_calendar
+from utils.metrics import track_handler
+
+logger = logging.getLogger(__name__)
 
 # Conversation states
 WAITING_EVENT_TITLE = 1
@@ -22,11 +63,32 @@ WAITING_EVENT_CONFIRM = 6
 WAITING_DELETE_SELECTION = 7
 WAITING_AI_CHAT = 8
 
+# Appended to the reply when a write is queued because Calendar is unreachable
+QUEUED_NOTE = (
+    "⏳ Google Calendar sedang tidak bisa dihubungi. Permintaan ini sudah dicatat "
+    "dan akan diproses otomatis; kamu akan dapat pesan setelah selesai."
+)
+
+# Events created per user that a repeated request is answered with, without calling Calendar
+RECENT_CREATES = 20
+
 class BotHandlers:
     def __init__(self):
         self.calendar_service = None
         self.ai_service = GeminiAIService()
-        self.user_data = {}
+        self.user_data = StateMap('user_data')
+        self.pending_events = StateMap('pending_events')
+        # user id -> {calendar id: name} shown in the today/week views; kept without expiry
+        self.calendar_selection = StateMap('calendar_selection', ttl=0)
+        # Calendar writes, logged before they are sent (see services.write_queue)
+        self.write_queue = WriteQueue()
+        self.write_replayer = None
+        # user id -> {event id: {'id', 'htmlLink'}} of the last RECENT_CREATES creates
+        self.recent_creates = StateMap('recent_creates')
+        # Users with a .ics import running (one at a time each)
+        self.ics_imports = set()
+        # Daily agenda messages (/digest); sending starts with start_digests()
+        self.digests = DigestScheduler(self.digest_calendars, self.prefetch_day, self.digest_message)
     
     def init_calendar_service(self):
         """Initialize calendar service when needed"""
@@ -39,6 +101,125 @@ class BotHandlers:
                 return False
         return True
     
+    @staticmethod
+    def request_event_id(message) -> str:
+        """
+        Event id of the event `message` asks for: the same when Telegram
+        redelivers the update or a handler runs again for it (same chat,
+        message id and text), a new one when the message is edited
+        """
+        return event_id_for(message.chat_id, message.message_id, message.text or '')
+    
+    @staticmethod
+    def create_key(user_id, params: Dict) -> str:
+        """
+        Content key of a create: the same for the same user asking for the
+        same title, start, end and place, whichever message it came in.
+        Catches a request sent again as a new message (new message id).
+        """
+        def text(name):
+            return ' '.join((params.get(name) or '').split()).casefold()
+        return event_id_for(user_id, text('summary'), params['start'].isoformat(), params['end'].isoformat(),
+                            text('location'))
+    
+    def recent_create(self, user_id, event_id: str, key: str = None):
+        """
+        The event created for `event_id` lately, or for the same content
+        (`key`) within config.DUPLICATE_CREATE_WINDOW seconds, or None
+        """
+        recent = self.recent_creates.get(str(user_id), {})
+        if event_id in recent or not key:
+            return recent.get(event_id)
+        since = time.time() - config.DUPLICATE_CREATE_WINDOW
+        return next((event for event in recent.values()
+                     if event.get('key') == key and event.get('at', 0) >= since), None)
+    
+    def remember_create(self, user_id, event: Dict, key: str = None):
+        recent = self.recent_creates.get(str(user_id), {})
+        recent[event['id']] = {'id': event['id'], 'htmlLink': event.get('htmlLink'), 'key': key, 'at': time.time()}
+        while len(recent) > RECENT_CREATES:
+            del recent[next(iter(recent))]
+        self.recent_creates[str(user_id)] = recent
+    
+    async def submit_write(self, user_id: int, chat_id: int, kind: str, **params):
+        """
+        Log a calendar write, then apply it at once. Returns the result, or
+        None when Calendar is unreachable: the write stays in the queue and
+        the replayer applies it later and tells the user. Errors a retry
+        cannot fix are raised as before. A create repeated with the same
+        event id, or with the same content shortly after (create_key), is
+        answered from the recent creates or the queue, without another
+        insert.
+        """
+        if kind == CREATE:
+            params['content_key'] = self.create_key(user_id, params)
+            event = self.recent_create(user_id, params['event_id'], params['content_key'])
+            if event:
+                DUPLICATE_WRITES.inc(caught='recent')
+                return event
+            if self.write_queue.is_pending(CREATE, params['event_id'], params['content_key']):
+                DUPLICATE_WRITES.inc(caught='pending')
+                return None
+        
+        # The log is fsynced: its file I/O runs on the lane, not on the loop
+        op = await run_blocking(FAST_LANE, self.write_queue.add, kind, user_id, chat_id, **params)
+        try:
+            result = await run_blocking(FAST_LANE, apply_write, self.calendar_service, op)
+        except Exception as error:
+            if not is_retryable(error):
+                await run_blocking(FAST_LANE, self.write_queue.done, op['id'], 'failed')
+                raise
+            await run_blocking(FAST_LANE, self.write_queue.release, op['id'], error)
+            if self.write_replayer:
+                self.write_replayer.wake()
+            return None
+        await run_blocking(FAST_LANE, self.write_queue.done, op['id'])
+        if kind == CREATE:
+            self.remember_create(user_id, result, params['content_key'])
+        return result
+    
+    async def replay_write(self, op: Dict):
+        """Apply a queued write (the replayer's `apply`)"""
+        if not self.init_calendar_service():
+            raise ConnectionError("Google Calendar belum terhubung")
+        result = await run_blocking(FAST_LANE, apply_write, self.calendar_service, op)
+        if op['kind'] == CREATE:
+            self.remember_create(op['user_id'], result, op['params'].get('content_key'))
+        return result
+    
+    @staticmethod
+    def write_notification(op: Dict, result, error: Exception = None) -> str:
+        """Message telling the user how a queued write ended"""
+        params = op['params']
+        summary = params.get('summary') or 'Untitled'
+        if error is None:
+            if op['kind'] == CREATE:
+                start = datetime.fromisoformat(params['start'])
+                text = f"✅ Jadwal yang tertunda sudah ditambahkan!\n\n📅 {summary}\n📆 {start.strftime('%d/%m/%Y %H:%M')}"
+                if isinstance(result, dict) and result.get('htmlLink'):
+                    text += f"\n🔗 {result['htmlLink']}"
+                return text
+            if op['kind'] == UPDATE:
+                return f"✅ Perubahan jadwal '{summary}' yang tertunda sudah disimpan."
+            return f"✅ Jadwal '{summary}' sudah dihapus."
+        
+        action = {CREATE: 'ditambahkan', UPDATE: 'diubah', DELETE: 'dihapus'}.get(op['kind'], 'disimpan')
+        if is_retryable(error):
+            hours = round(config.WRITE_QUEUE_MAX_AGE / 3600)
+            return (f"❌ Jadwal '{summary}' tidak bisa {action}: Google Calendar tidak bisa "
+                    f"dihubungi selama {hours} jam. Silakan coba lagi.")
+        return f"❌ Jadwal '{summary}' gagal {action}: {error}"
+    
+    def start_write_replayer(self, bot) -> WriteReplayer:
+        """Start applying queued writes in the background; users hear back through `bot`"""
+        async def notify(op, result, error):
+            await bot.send_message(op['chat_id'], self.write_notification(op, result, error))
+        
+        self.write_replayer = WriteReplayer(self.write_queue, self.replay_write, notify)
+        self.write_replayer.start()
+        return self.write_replayer
+    
+    @track_handler
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /start command"""
         user = update.effective_user
@@ -62,6 +243,7 @@ class BotHandlers:
             reply_markup=get_quick_reply_keyboard()
         )
     
+    @track_handler
     async def help(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /help command - FIXED VERSION"""
         # Split into multiple messages to avoid markdown parsing issues
@@ -76,6 +258,11 @@ class BotHandlers:
             "/add_event - Tambah jadwal step by step\n"
             "/list_events - Lihat jadwal hari ini\n"
             "/list_week - Lihat jadwal minggu ini\n"
+            "/free - Lihat waktu kosong (contoh: /free besok)\n"
+            "/search - Cari jadwal (contoh: /search rapat)\n"
+            "/calendars - Pilih kalender yang ditampilkan\n"
+            "/export - Unduh jadwal sebagai file .ics\n"
+            "/digest - Ringkasan jadwal harian (contoh: /digest 07:00)\n"
             "/delete_event - Hapus jadwal\n"
             "/ai - Chat dengan AI Assistant"
         )
@@ -123,7 +310,10 @@ class BotHandlers:
             "• Saran produktivitas\n\n"
             "*Contoh:*\n"
             "/ai analisis jadwal minggu ini\n"
-            "/ai beri tips produktivitas"
+            "/ai beri tips produktivitas\n\n"
+            "📥 *IMPOR & EKSPOR:*\n"
+            "• Kirim file .ics (dari Google, Outlook, Apple) untuk mengimpor jadwalnya\n"
+            "• /export atau /export 01/01/2025 31/12/2025 untuk mengunduh file .ics"
         )
         
         # Message 5: Tips
@@ -143,6 +333,7 @@ class BotHandlers:
         await update.message.reply_text(help_text_4, parse_mode='Markdown')
         await update.message.reply_text(help_text_5, parse_mode='Markdown')
     
+    @track_handler
     async def connect_calendar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle calendar connection"""
         await update.message.reply_text("🔄 Menghubungkan dengan Google Calendar...")
@@ -159,6 +350,7 @@ class BotHandlers:
                 "Silakan ikuti panduan setup di README."
             )
     
+    @track_handler
     async def add_event_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start adding new event conversation"""
         if not self.init_calendar_service():
@@ -177,6 +369,7 @@ class BotHandlers:
         
         return WAITING_EVENT_TITLE
     
+    @track_handler
     async def receive_event_title(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Receive event title"""
         user_id = update.effective_user.id
@@ -201,6 +394,7 @@ class BotHandlers:
         
         return WAITING_EVENT_DATE
     
+    @track_handler
     async def receive_event_date(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Receive event date"""
         user_id = update.effective_user.id
@@ -234,41 +428,31 @@ class BotHandlers:
             )
             return WAITING_EVENT_DATE
     
+    @track_handler
     async def receive_event_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Receive event time"""
         user_id = update.effective_user.id
         time_input = update.message.text
         
         try:
-            # Parse time
-            time_parts = re.findall(r'\d+', time_input)
-            if len(time_parts) >= 2:
-                hour = int(time_parts[0])
-                minute = int(time_parts[1])
-                
-                # Handle PM
-                if 'pm' in time_input.lower() or 'sore' in time_input.lower() or 'malam' in time_input.lower():
-                    if hour < 12:
-                        hour += 12
-                
-                self.user_data[user_id]['event_hour'] = hour
-                self.user_data[user_id]['event_minute'] = minute
-                
-                await update.message.reply_text(
-                    f"✅ Waktu mulai: *{hour:02d}:{minute:02d}*\n\n"
-                    "Langkah 4 dari 5:\n"
-                    "*Berapa lama durasi acara?*\n\n"
-                    "Contoh:\n"
-                    "• _1 jam_\n"
-                    "• _30 menit_\n"
-                    "• _2 jam 30 menit_",
-                    parse_mode='Markdown'
-                )
-                
-                return WAITING_EVENT_DURATION
-            else:
-                raise ValueError("Invalid time format")
-        except Exception as e:
+            hour, minute = parse_time_input(time_input)
+            
+            self.user_data[user_id]['event_hour'] = hour
+            self.user_data[user_id]['event_minute'] = minute
+            
+            await update.message.reply_text(
+                f"✅ Waktu mulai: *{hour:02d}:{minute:02d}*\n\n"
+                "Langkah 4 dari 5:\n"
+                "*Berapa lama durasi acara?*\n\n"
+                "Contoh:\n"
+                "• _1 jam_\n"
+                "• _30 menit_\n"
+                "• _2 jam 30 menit_",
+                parse_mode='Markdown'
+            )
+            
+            return WAITING_EVENT_DURATION
+        except ValueError:
             await update.message.reply_text(
                 "❌ Format waktu tidak valid!\n\n"
                 "Contoh format yang benar:\n"
@@ -280,29 +464,14 @@ class BotHandlers:
             )
             return WAITING_EVENT_TIME
     
+    @track_handler
     async def receive_event_duration(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Receive event duration"""
         user_id = update.effective_user.id
         duration_input = update.message.text.lower()
         
         try:
-            # Parse duration
-            hours = 0
-            minutes = 0
-            
-            if 'jam' in duration_input:
-                hours_match = re.search(r'(\d+)\s*jam', duration_input)
-                if hours_match:
-                    hours = int(hours_match.group(1))
-            
-            if 'menit' in duration_input:
-                minutes_match = re.search(r'(\d+)\s*menit', duration_input)
-                if minutes_match:
-                    minutes = int(minutes_match.group(1))
-            
-            if hours == 0 and minutes == 0:
-                # Default 1 hour
-                hours = 1
+            hours, minutes = parse_duration_input(duration_input)
             
             self.user_data[user_id]['duration_hours'] = hours
             self.user_data[user_id]['duration_minutes'] = minutes
@@ -335,15 +504,15 @@ class BotHandlers:
             )
             return WAITING_EVENT_DURATION
     
+    @track_handler
     async def receive_event_location(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Receive event location and create event"""
+        """Receive event location, check for conflicts and create event"""
         user_id = update.effective_user.id
         location = update.message.text
         
         if location.lower() != 'skip':
             self.user_data[user_id]['event_location'] = location
         
-        # Create the event
         try:
             data = self.user_data[user_id]
             
@@ -358,18 +527,78 @@ class BotHandlers:
                 minutes=data['duration_minutes']
             )
             
-            # Create event in Google Calendar
-            event = self.calendar_service.create_event(
+            data['event_start'] = start_datetime
+            data['event_end'] = end_datetime
+        except Exception as e:
+            await update.message.reply_text(
+                f"❌ Gagal membuat jadwal: {str(e)}"
+            )
+            return ConversationHandler.END
+        
+        conflicts, suggestion = await run_blocking(FAST_LANE, self.check_conflicts, start_datetime, end_datetime)
+        if conflicts:
+            data['suggested_slot'] = suggestion
+            await update.message.reply_text(
+                self.format_conflict_warning(conflicts, suggestion) +
+                "\n\n*Lanjutkan?*\n"
+                "• Ketik *ya* untuk tetap menyimpan\n" +
+                ("• Ketik *geser* untuk memakai waktu yang disarankan\n" if suggestion else "") +
+                "• Ketik *batal* untuk membatalkan",
+                parse_mode='Markdown'
+            )
+            return WAITING_EVENT_CONFIRM
+        
+        return await self.create_conversation_event(update, user_id)
+    
+    @track_handler
+    async def receive_event_confirm(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the answer to a schedule conflict warning"""
+        user_id = update.effective_user.id
+        answer = update.message.text.lower().strip()
+        data = self.user_data.get(user_id, {})
+        
+        if answer in ('ya', 'yes', 'y'):
+            return await self.create_conversation_event(update, user_id)
+        
+        if answer == 'geser' and data.get('suggested_slot'):
+            data['event_start'], data['event_end'] = data['suggested_slot']
+            return await self.create_conversation_event(update, user_id)
+        
+        if answer in ('batal', 'cancel'):
+            self.user_data.pop(user_id, None)
+            await update.message.reply_text(
+                "❌ Pembuatan jadwal dibatalkan.",
+                reply_markup=get_quick_reply_keyboard()
+            )
+            return ConversationHandler.END
+        
+        await update.message.reply_text(
+            "Ketik *ya*, *geser* atau *batal*.",
+            parse_mode='Markdown'
+        )
+        return WAITING_EVENT_CONFIRM
+    
+    async def create_conversation_event(self, update: Update, user_id: int):
+        """Create the event collected by the /add_event conversation"""
+        try:
+            data = self.user_data[user_id]
+            start_datetime = data['event_start']
+            end_datetime = data['event_end']
+            
+            # Create event in Google Calendar (or queue it while Calendar is down)
+            event = await self.submit_write(
+                user_id, update.effective_chat.id, CREATE,
                 summary=data['event_title'],
-                start_time=start_datetime,
-                end_time=end_datetime,
+                start=start_datetime,
+                end=end_datetime,
                 location=data.get('event_location', ''),
-                description=f"Created via Telegram Bot by {update.effective_user.first_name}"
+                description=f"Created via Telegram Bot by {update.effective_user.first_name}",
+                event_id=self.request_event_id(update.message)
             )
             
             # Send confirmation
             confirmation = (
-                "✅ *JADWAL BERHASIL DITAMBAHKAN!*\n\n"
+                ("✅ *JADWAL BERHASIL DITAMBAHKAN!*\n\n" if event else "📝 *JADWAL DICATAT*\n\n") +
                 f"📅 *Judul:* {data['event_title']}\n"
                 f"📆 *Tanggal:* {start_datetime.strftime('%A, %d %B %Y')}\n"
                 f"⏰ *Waktu:* {start_datetime.strftime('%H:%M')} - {end_datetime.strftime('%H:%M')}\n"
@@ -378,7 +607,10 @@ class BotHandlers:
             if data.get('event_location'):
                 confirmation += f"📍 *Lokasi:* {data['event_location']}\n"
             
-            confirmation += f"\n🔗 [Lihat di Google Calendar]({event.get('htmlLink', '#')})"
+            if event:
+                confirmation += f"\n🔗 [Lihat di Google Calendar]({event.get('htmlLink', '#')})"
+            else:
+                confirmation += f"\n{QUEUED_NOTE}"
             
             await update.message.reply_text(
                 confirmation,
@@ -397,6 +629,38 @@ class BotHandlers:
         
         return ConversationHandler.END
     
+    def check_conflicts(self, start_datetime: datetime, end_datetime: datetime):
+        """
+        Return (conflicting events, suggested free (start, end) or None).
+        Conflict checks are best-effort: lookup errors never block creation.
+        """
+        try:
+            conflicts = self.calendar_service.find_conflicts(start_datetime, end_datetime)
+            if not conflicts:
+                return [], None
+            return conflicts, self.calendar_service.suggest_free_slot(start_datetime, end_datetime)
+        except Exception as e:
+            print(f"Error checking conflicts: {e}")
+            return [], None
+    
+    def format_conflict_warning(self, conflicts, suggestion) -> str:
+        """Build the warning shown before creating a conflicting event"""
+        message = "⚠️ *JADWAL BENTROK!*\n\nWaktu ini bertabrakan dengan:\n"
+        for event in conflicts:
+            message += format_event(event) + "\n"
+        
+        if suggestion:
+            slot_start, slot_end = suggestion
+            message += (
+                f"\n💡 Waktu kosong terdekat: *{slot_start.strftime('%d/%m %H:%M')}"
+                f" - {slot_end.strftime('%H:%M')}*"
+            )
+        else:
+            message += "\n💡 Tidak ada waktu kosong lain di hari yang sama."
+        
+        return message
+    
+    @track_handler
     async def list_events(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """List today's events"""
         if not self.init_calendar_service():
@@ -406,7 +670,8 @@ class BotHandlers:
             return
         
         try:
-            events = self.calendar_service.get_todays_events()
+            selection = self.selected_calendars(update.effective_user.id)
+            events = await run_blocking(FAST_LANE, self.calendar_service.get_todays_events, list(selection))
             
             if not events:
                 await update.message.reply_text(
@@ -416,7 +681,7 @@ class BotHandlers:
             else:
                 message = "📅 *Jadwal Hari Ini:*\n\n"
                 for event in events:
-                    message += format_event(event) + "\n"
+                    message += self.format_listed_event(event, selection) + "\n"
                 
                 await update.message.reply_text(
                     message,
@@ -428,6 +693,7 @@ class BotHandlers:
                 f"❌ Error mengambil jadwal: {str(e)}"
             )
     
+    @track_handler
     async def list_week_events(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """List this week's events"""
         if not self.init_calendar_service():
@@ -437,7 +703,8 @@ class BotHandlers:
             return
         
         try:
-            events = self.calendar_service.get_week_events()
+            selection = self.selected_calendars(update.effective_user.id)
+            events = await run_blocking(FAST_LANE, self.calendar_service.get_week_events, list(selection))
             
             if not events:
                 await update.message.reply_text(
@@ -448,14 +715,16 @@ class BotHandlers:
                 current_date = None
                 
                 for event in events:
-                    event_date = event.get('start', {}).get('dateTime', '')[:10]
+                    # All-day events (common on shared/holiday calendars) only have a date
+                    start = event.get('start', {})
+                    event_date = (start.get('dateTime') or start.get('date', ''))[:10]
                     
                     if event_date != current_date:
                         current_date = event_date
                         date_obj = datetime.strptime(event_date, '%Y-%m-%d')
                         message += f"\n*{date_obj.strftime('%A, %d %B %Y')}*\n"
                     
-                    message += format_event(event) + "\n"
+                    message += self.format_listed_event(event, selection) + "\n"
                 
                 # Split message if too long
                 if len(message) > 4000:
@@ -477,6 +746,408 @@ class BotHandlers:
                 f"❌ Error mengambil jadwal: {str(e)}"
             )
     
+    def selected_calendars(self, user_id: int) -> Dict[str, str]:
+        """Calendars (id -> name) the user's today/week views show; only primary until /calendars"""
+        return self.calendar_selection.get(str(user_id)) or {'primary': 'Utama'}
+    
+    @staticmethod
+    def format_listed_event(event: Dict, selection: Dict[str, str]) -> str:
+        """format_event, naming the calendar when events of several are listed together"""
+        formatted = format_event(event)
+        if len(selection) > 1:
+            formatted += f"\n  🗂️ {selection.get(event.get('calendarId', 'primary'), '')}"
+        return formatted
+    
+    @track_handler
+    async def calendars(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /calendars - choose the calendars shown by the today/week views"""
+        if not self.init_calendar_service():
+            await update.message.reply_text(
+                "❌ Calendar belum terhubung. Gunakan /connect_calendar terlebih dahulu."
+            )
+            return
+        
+        try:
+            calendars = await run_blocking(FAST_LANE, self.calendar_service.list_calendars)
+        except Exception as e:
+            await update.message.reply_text(f"❌ Error mengambil daftar kalender: {str(e)}")
+            return
+        
+        selection = self.selected_calendars(update.effective_user.id)
+        await update.message.reply_text(
+            "🗂️ *PILIH KALENDER*\n\n"
+            "Jadwal dari kalender yang dicentang ditampilkan bersama di\n"
+            "/list_events dan /list_week. Ketuk untuk memilih/membatalkan.",
+            parse_mode='Markdown',
+            reply_markup=get_calendar_selection_keyboard(calendars, selection)
+        )
+    
+    @track_handler
+    async def toggle_calendar(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the /calendars toggle buttons"""
+        query = update.callback_query
+        user_id = str(query.from_user.id)
+        selection = dict(self.selected_calendars(user_id))
+        
+        if query.data == 'calsel_done':
+            names = ', '.join(selection.values())
+            await query.edit_message_text(f"✅ Kalender yang ditampilkan: {names}")
+            return
+        
+        if not self.init_calendar_service():
+            return
+        calendars = await run_blocking(FAST_LANE, self.calendar_service.list_calendars)
+        index = int(query.data.split('_', 1)[1])
+        if index >= len(calendars):
+            await query.message.reply_text("❌ Daftar kalender berubah. Ketik /calendars lagi.")
+            return
+        
+        calendar = calendars[index]
+        if calendar['id'] in selection:
+            if len(selection) == 1:
+                await query.message.reply_text("ℹ️ Minimal satu kalender harus dipilih.")
+                return
+            del selection[calendar['id']]
+        else:
+            selection[calendar['id']] = calendar['summary']
+        self.calendar_selection[user_id] = selection
+        
+        await query.edit_message_reply_markup(
+            reply_markup=get_calendar_selection_keyboard(calendars, selection)
+        )
+    
+    @track_handler
+    async def free_slots(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /free [tanggal] - list free time without asking the AI"""
+        date_text = ' '.join(context.args) if context.args else ''
+        await self.reply_free_slots(update, date_text)
+    
+    async def reply_free_slots(self, update: Update, date_text: str = ''):
+        """Reply with the free slots of the day described by date_text (default today)"""
+        if not self.init_calendar_service():
+            await update.message.reply_text(
+                "❌ Calendar belum terhubung. Gunakan /connect_calendar terlebih dahulu."
+            )
+            return
+        
+        try:
+            day = parse_datetime_input(date_text) if date_text else datetime.now(config.TIMEZONE)
+        except ValueError:
+            day = datetime.now(config.TIMEZONE)
+        
+        try:
+            slots = await run_blocking(FAST_LANE, self.calendar_service.get_free_slots, day)
+            
+            message = f"🟢 *Waktu Kosong - {day.strftime('%A, %d %B %Y')}*\n\n"
+            if not slots:
+                message += "Tidak ada waktu kosong tersisa di hari ini."
+            for slot_start, slot_end in slots:
+                minutes = int((slot_end - slot_start).total_seconds() // 60)
+                message += (
+                    f"• *{slot_start.strftime('%H:%M')} - {slot_end.strftime('%H:%M')}*"
+                    f" ({format_duration(minutes)})\n"
+                )
+            
+            await update.message.reply_text(message, parse_mode='Markdown')
+        except Exception as e:
+            await update.message.reply_text(
+                f"❌ Error mengambil waktu kosong: {str(e)}"
+            )
+    
+    @track_handler
+    async def search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /search - search events in the local index"""
+        query = ' '.join(context.args) if context.args else ''
+        
+        if not query:
+            await update.message.reply_text(
+                "🔍 *CARI JADWAL*\n\n"
+                "Ketik kata kunci setelah /search\n"
+                "Contoh: _/search rapat anggaran_",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if not self.init_calendar_service():
+            await update.message.reply_text(
+                "❌ Calendar belum terhubung. Gunakan /connect_calendar terlebih dahulu."
+            )
+            return
+        
+        try:
+            events = await run_blocking(FAST_LANE, self.calendar_service.search_events, query)
+            
+            if not events:
+                await update.message.reply_text(f"🔍 Tidak ada jadwal yang cocok dengan '{query}'.")
+                return
+            
+            # The query is the user's text: "_", "*", "`" or "[" in it would break the Markdown reply
+            message = f"🔍 *Hasil pencarian:* {escape_markdown(query)}\n\n"
+            for event in events:
+                bounds = get_event_bounds(event)
+                if bounds:
+                    message += f"*{bounds[0].strftime('%d/%m/%Y')}*\n"
+                message += format_event(event) + "\n\n"
+            
+            await update.message.reply_text(
+                message,
+                parse_mode='Markdown',
+                disable_web_page_preview=True
+            )
+        except Exception as e:
+            await update.message.reply_text(
+                f"❌ Error mencari jadwal: {str(e)}"
+            )
+    
+    @track_handler
+    async def import_ics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle a .ics file: import its events in the background, reporting progress in the chat"""
+        document = update.message.document
+        user_id = update.effective_user.id
+        
+        if not self.init_calendar_service():
+            await update.message.reply_text(
+                "❌ Calendar belum terhubung. Gunakan /connect_calendar terlebih dahulu."
+            )
+            return
+        
+        if document.file_size and document.file_size > config.ICS_MAX_FILE_SIZE:
+            await update.message.reply_text(
+                f"❌ File terlalu besar. Maksimal {config.ICS_MAX_FILE_SIZE // (1024 * 1024)} MB; "
+                f"pecah file .ics menjadi beberapa bagian."
+            )
+            return
+        
+        if user_id in self.ics_imports:
+            await update.message.reply_text("⏳ Impor sebelumnya masih berjalan. Tunggu sampai selesai.")
+            return
+        
+        self.ics_imports.add(user_id)
+        handle, path = tempfile.mkstemp(suffix='.ics')
+        os.close(handle)
+        try:
+            status = await update.message.reply_text(f"📥 Mengunduh {document.file_name or 'file .ics'}...")
+            telegram_file = await document.get_file()
+            await telegram_file.download_to_drive(path)
+        except Exception as e:
+            self.ics_imports.discard(user_id)
+            os.remove(path)
+            await update.message.reply_text(f"❌ Gagal mengunduh file: {str(e)}")
+            return
+        
+        # Runs after this handler returns: the chat's next updates are not held up for the whole import
+        context.application.create_task(self.run_ics_import(user_id, status, path), update=update)
+    
+    def import_ics_batch(self, events: Iterator[Dict], counts: Dict[str, int]) -> int:
+        """Parse and import the next ICS_BATCH_SIZE events (on a lane thread); 0 once none are left"""
+        batch = list(itertools.islice(events, config.ICS_BATCH_SIZE))
+        if batch:
+            errors = self.calendar_service.import_events(batch)
+            failed = sum(error is not None for error in errors)
+            counts['imported'] += len(batch) - failed
+            counts['failed'] += failed
+        return len(batch)
+    
+    async def run_ics_import(self, user_id: int, status, path: str) -> Dict[str, int]:
+        """
+        Import the events of a downloaded .ics file one batch request at a
+        time. The file is parsed as it is read (one batch of events in
+        memory, whatever its size), on a lane thread like the Calendar calls,
+        and `status` is edited with the progress every ICS_PROGRESS_INTERVAL
+        seconds. The file is deleted afterwards.
+        """
+        counts = {'imported': 0, 'failed': 0}
+        skipped: List[str] = []
+        started = reported = time.monotonic()
+        error = None
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                events = read_events(f, skipped)
+                while await run_blocking(FAST_LANE, self.import_ics_batch, events, counts):
+                    if time.monotonic() - reported >= config.ICS_PROGRESS_INTERVAL:
+                        reported = time.monotonic()
+                        await self._edit_status(
+                            status,
+                            f"📥 Mengimpor jadwal... {counts['imported']} masuk"
+                            + (f", {counts['failed']} gagal" if counts['failed'] else "")
+                        )
+        except Exception as e:
+            error = e
+        finally:
+            os.remove(path)
+            self.ics_imports.discard(user_id)
+            if counts['imported']:
+                await run_blocking(FAST_LANE, self.calendar_service.imported)
+        
+        text = (
+            f"{'❌ Impor berhenti' if error else '✅ Impor selesai'} "
+            f"({round(time.monotonic() - started)} detik)\n\n"
+            f"📅 Masuk: {counts['imported']}\n"
+        )
+        if counts['failed']:
+            text += f"⚠️ Ditolak Google Calendar: {counts['failed']}\n"
+        if skipped:
+            text += f"⏭️ Dilewati (tidak valid): {len(skipped)}\n"
+        if error:
+            text += (f"\nError: {error}\nKirim file yang sama lagi untuk melanjutkan; "
+                     f"jadwal yang sudah masuk tidak akan dobel.")
+        await self._edit_status(status, text)
+        return dict(counts, skipped=len(skipped))
+    
+    @staticmethod
+    async def _edit_status(status, text: str):
+        """Update a progress message; Telegram refusing an edit (unchanged text, deleted message) is ignored"""
+        try:
+            await status.edit_text(text)
+        except Exception as e:
+            logger.warning(f"Could not update progress message: {e}")
+    
+    def write_ics_export(self, path: str, time_min: datetime, time_max: datetime) -> int:
+        """Write the events of [time_min, time_max) to an .ics file page by page (on a lane thread)"""
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            return write_calendar(f, self.calendar_service.export_events(time_min, time_max))
+    
+    @track_handler
+    async def export(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /export [dari] [sampai] - send the events of a date range as an .ics file"""
+        if not self.init_calendar_service():
+            await update.message.reply_text(
+                "❌ Calendar belum terhubung. Gunakan /connect_calendar terlebih dahulu."
+            )
+            return
+        
+        today = datetime.now(config.TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        args = context.args or []
+        try:
+            time_min = parse_datetime_input(args[0]) if args else \
+                today - timedelta(days=config.SEARCH_SYNC_PAST_DAYS)
+            time_max = parse_datetime_input(args[1]) + timedelta(days=1) if len(args) > 1 else \
+                today + timedelta(days=config.SEARCH_SYNC_FUTURE_DAYS)
+            if time_max <= time_min:
+                raise ValueError("end before start")
+        except ValueError:
+            await update.message.reply_text(
+                "📤 *EKSPOR JADWAL*\n\n"
+                "Format: /export [dari] [sampai]\n"
+                "Contoh: _/export 01/01/2025 31/12/2025_\n"
+                "Tanpa tanggal: 6 bulan terakhir sampai 1 tahun ke depan.",
+                parse_mode='Markdown'
+            )
+            return
+        
+        last_day = time_max - timedelta(days=1)
+        handle, path = tempfile.mkstemp(suffix='.ics')
+        os.close(handle)
+        try:
+            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='upload_document')
+            count = await run_blocking(FAST_LANE, self.write_ics_export, path, time_min, time_max)
+            if not count:
+                await update.message.reply_text(
+                    f"📭 Tidak ada jadwal dari {time_min.strftime('%d/%m/%Y')} sampai {last_day.strftime('%d/%m/%Y')}."
+                )
+                return
+            with open(path, 'rb') as f:
+                await update.message.reply_document(
+                    document=f,
+                    filename=f"jadwal-{time_min.strftime('%Y%m%d')}-{last_day.strftime('%Y%m%d')}.ics",
+                    caption=(f"📤 {count} jadwal, {time_min.strftime('%d/%m/%Y')} - "
+                             f"{last_day.strftime('%d/%m/%Y')}. Jadwal berulang disimpan sebagai aturannya.")
+                )
+        except Exception as e:
+            await update.message.reply_text(f"❌ Gagal mengekspor jadwal: {str(e)}")
+        finally:
+            os.remove(path)
+    
+    def digest_calendars(self, user_id: int) -> List[str]:
+        return list(self.selected_calendars(user_id))
+    
+    async def prefetch_day(self, calendar_id: str, day: date):
+        """List a calendar's day off the event loop and cache it for the digest and today's view"""
+        if not self.init_calendar_service():
+            raise ConnectionError("Google Calendar belum terhubung")
+        events, complete = await run_blocking(FAST_LANE, self.calendar_service.fetch_day, calendar_id, day)
+        self.calendar_service.store_day(calendar_id, day, events, complete)
+    
+    async def digest_message(self, user_id: int, day: date) -> str:
+        """The digest of `day`, from the prefetched listings (calendars missing one are listed now)"""
+        selection = self.selected_calendars(user_id)
+        # Prefetched up to DIGEST_LEAD before the send time, which the sender may be behind
+        max_age = 2 * config.DIGEST_LEAD
+        for calendar_id in selection:
+            if self.calendar_service is None or \
+                    self.calendar_service.cached_day(calendar_id, day, max_age) is None:
+                await self.prefetch_day(calendar_id, day)
+        events = await run_blocking(FAST_LANE, self.calendar_service.get_day_events, day, list(selection),
+                                    max_age=max_age)
+        
+        message = f"☀️ *Agenda Hari Ini - {day.strftime('%A, %d %B %Y')}*\n\n"
+        if not events:
+            message += "Tidak ada jadwal hari ini. Santai dan nikmati hari Anda! 😊\n"
+        for event in events:
+            message += self.format_listed_event(event, selection) + "\n"
+        return message + "\n_Berhenti: /digest off_"
+    
+    def start_digests(self, bot) -> DigestScheduler:
+        """Schedule the stored digests and send them through `bot`, paced at DIGEST_SEND_RATE"""
+        async def send(chat_id, text):
+            await bot.send_message(chat_id, text, parse_mode='Markdown', disable_web_page_preview=True)
+        
+        sender = RateLimitedSender(send, config.DIGEST_SEND_RATE, blocked=self.digests.unsubscribe_chat)
+        self.digests.start(sender)
+        return self.digests
+    
+    @track_handler
+    async def digest(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /digest [HH:MM|off] - the daily agenda message"""
+        user_id = update.effective_user.id
+        argument = ' '.join(context.args) if context.args else ''
+        
+        if not argument:
+            subscription = self.digests.subscription(user_id)
+            status = (f"Aktif, setiap hari jam *{subscription['time']}*." if subscription
+                      else "Belum aktif.")
+            await update.message.reply_text(
+                "☀️ *RINGKASAN JADWAL HARIAN*\n\n"
+                f"{status}\n\n"
+                "Bot mengirim jadwal hari ini setiap pagi, tanpa perlu membuka /list_events.\n"
+                "• _/digest 07:00_ - aktifkan atau ganti jam\n"
+                "• _/digest off_ - matikan",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if argument.lower() in ('off', 'stop', 'mati'):
+            if self.digests.unsubscribe(user_id):
+                await update.message.reply_text("✅ Ringkasan jadwal harian dimatikan.")
+            else:
+                await update.message.reply_text("ℹ️ Ringkasan jadwal harian memang belum aktif.")
+            return
+        
+        try:
+            hour, minute = parse_time_input(argument)
+        except ValueError:
+            await update.message.reply_text(
+                "❌ Format waktu tidak valid!\n\n"
+                "Contoh: _/digest 07:00_ atau _/digest jam 6 pagi_",
+                parse_mode='Markdown'
+            )
+            return
+        
+        if not self.init_calendar_service():
+            await update.message.reply_text(
+                "❌ Calendar belum terhubung. Gunakan /connect_calendar terlebih dahulu."
+            )
+            return
+        
+        clock = f"{hour:02d}:{minute:02d}"
+        self.digests.subscribe(user_id, update.effective_chat.id, clock)
+        await update.message.reply_text(
+            f"✅ Jadwal hari ini akan dikirim setiap hari jam *{clock}* ({config.TIMEZONE_STR}).\n"
+            "Matikan dengan /digest off.",
+            parse_mode='Markdown'
+        )
+    
+    @track_handler
     async def delete_event_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start delete event conversation"""
         if not self.init_calendar_service():
@@ -487,7 +1158,7 @@ class BotHandlers:
         
         try:
             # Get upcoming events
-            events = self.calendar_service.list_events(max_results=10)
+            events = await run_blocking(FAST_LANE, self.calendar_service.list_events, max_results=10)
             
             if not events:
                 await update.message.reply_text(
@@ -530,6 +1201,7 @@ class BotHandlers:
             )
             return ConversationHandler.END
     
+    @track_handler
     async def receive_delete_selection(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle delete selection"""
         user_id = update.effective_user.id
@@ -550,11 +1222,17 @@ class BotHandlers:
                 event = events[index]
                 event_id = event['id']
                 
-                # Delete the event
-                self.calendar_service.delete_event(event_id)
+                # Delete the event (or queue it while Calendar is down)
+                deleted = await self.submit_write(
+                    user_id, update.effective_chat.id, DELETE,
+                    event_id=event_id,
+                    calendar_id=event.get('calendarId', 'primary'),
+                    summary=event.get('summary', 'Untitled')
+                )
                 
                 await update.message.reply_text(
-                    f"✅ Jadwal '{event.get('summary', 'Untitled')}' berhasil dihapus!",
+                    f"✅ Jadwal '{event.get('summary', 'Untitled')}' berhasil dihapus!" if deleted else
+                    f"📝 Penghapusan jadwal '{event.get('summary', 'Untitled')}' dicatat.\n\n{QUEUED_NOTE}",
                     reply_markup=get_quick_reply_keyboard()
                 )
             else:
@@ -575,6 +1253,7 @@ class BotHandlers:
         
         return ConversationHandler.END
     
+    @track_handler
     async def ai_chat(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle AI chat"""
         message = update.message.text
@@ -597,14 +1276,31 @@ class BotHandlers:
             )
             return
         
+        # Admission control shed it (rate limit, duplicate, AI overloaded)
+        reason = shed_reason()
+        if reason:
+            await update.message.reply_text(SHED_REPLIES[reason])
+            return
+        
         # Send typing action
         await context.bot.send_chat_action(
             chat_id=update.effective_chat.id,
             action='typing'
         )
         
+        # Schedule analysis requests get local stats plus one compact AI call
+        if classify_intent(message) == 'analyze' and self.init_calendar_service():
+            try:
+                events = await run_blocking(FAST_LANE, self.calendar_service.get_week_events)
+                await update.message.reply_text(
+                    await run_blocking(AI_LANE, self.ai_service.suggest_schedule_optimization, events)
+                )
+            except Exception as e:
+                await update.message.reply_text(f"❌ Error menganalisis jadwal: {str(e)}")
+            return
+        
         # Check if message contains schedule information
-        result = self.ai_service.parse_schedule_from_text(message, user_id)
+        result = await run_blocking(AI_LANE, self.ai_service.parse_schedule_from_text, message, user_id)
         
         if result['type'] == 'schedule' and self.init_calendar_service():
             # Extract schedule data
@@ -623,24 +1319,26 @@ class BotHandlers:
                     end_datetime = datetime.combine(end_date, end_time)
                     end_datetime = config.TIMEZONE.localize(end_datetime)
                     
-                    # Create event
-                    event = self.calendar_service.create_event(
-                        summary=data['title'],
-                        start_time=start_datetime,
-                        end_time=end_datetime,
-                        location=data.get('location', ''),
-                        description=data.get('description', '')
-                    )
-                    
-                    response = (
-                        "✅ *AI mendeteksi jadwal dan berhasil menambahkan!*\n\n"
-                        f"📅 {data['title']}\n"
-                        f"📆 {start_datetime.strftime('%d/%m/%Y %H:%M')}\n"
-                    )
-                    if data.get('location'):
-                        response += f"📍 {data.get('location')}"
+                    conflicts, suggestion = await run_blocking(
+                        FAST_LANE, self.check_conflicts, start_datetime, end_datetime)
+                    if conflicts:
+                        # Hold the event until the user picks an option
+                        self.pending_events[user_id] = {
+                            'data': data,
+                            'start': start_datetime,
+                            'end': end_datetime,
+                            'suggested_slot': suggestion,
+                            'event_id': self.request_event_id(update.message)
+                        }
+                        await update.message.reply_text(
+                            self.format_conflict_warning(conflicts, suggestion),
+                            parse_mode='Markdown',
+                            reply_markup=get_conflict_keyboard(bool(suggestion))
+                        )
+                        return
                     
-                    await update.message.reply_text(response, parse_mode='Markdown')
+                    await self.create_ai_event(update.message, int(user_id), data, start_datetime, end_datetime,
+                                               self.request_event_id(update.message))
                 except Exception as e:
                     await update.message.reply_text(
                         f"AI mendeteksi jadwal, tapi gagal membuat: {str(e)}\n\n"
@@ -651,10 +1349,91 @@ class BotHandlers:
             response = result.get('message', 'Maaf, tidak bisa memproses permintaan Anda.')
             await update.message.reply_text(response)
     
+    async def create_ai_event(self, message, user_id: int, data: dict,
+                              start_datetime: datetime, end_datetime: datetime, event_id: str):
+        """
+        Create an event extracted by the AI (or queue it) and confirm it in
+        the chat. `event_id` comes from the user's message (request_event_id)
+        """
+        event = await self.submit_write(
+            user_id, message.chat_id, CREATE,
+            summary=data['title'],
+            start=start_datetime,
+            end=end_datetime,
+            location=data.get('location', ''),
+            description=data.get('description', ''),
+            event_id=event_id
+        )
+        
+        response = (
+            ("✅ *AI mendeteksi jadwal dan berhasil menambahkan!*\n\n" if event else
+             "📝 *AI mendeteksi jadwal dan mencatatnya.*\n\n") +
+            f"📅 {data['title']}\n"
+            f"📆 {start_datetime.strftime('%d/%m/%Y %H:%M')}\n"
+        )
+        if data.get('location'):
+            response += f"📍 {data.get('location')}\n"
+        if not event:
+            response += f"\n{QUEUED_NOTE}"
+        
+        await message.reply_text(response, parse_mode='Markdown')
+    
+    @track_handler
+    async def resolve_event_conflict(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle the conflict keyboard shown for AI-detected events"""
+        query = update.callback_query
+        user_id = str(query.from_user.id)
+        pending = self.pending_events.pop(user_id, None)
+        
+        if not pending:
+            await query.message.reply_text("❌ Tidak ada jadwal yang menunggu konfirmasi.")
+            return
+        
+        if query.data == 'conflict_cancel':
+            await query.message.reply_text("❌ Pembuatan jadwal dibatalkan.")
+            return
+        
+        start_datetime, end_datetime = pending['start'], pending['end']
+        if query.data == 'conflict_shift' and pending['suggested_slot']:
+            start_datetime, end_datetime = pending['suggested_slot']
+        
+        try:
+            # Keyed by the message that asked for the event, not by this button tap
+            event_id = pending.get('event_id') or self.request_event_id(query.message)
+            await self.create_ai_event(query.message, int(user_id), pending['data'], start_datetime, end_datetime,
+                                       event_id)
+        except Exception as e:
+            await query.message.reply_text(f"❌ Gagal membuat jadwal: {str(e)}")
+    
+    @staticmethod
+    def local_intent(text: str):
+        """
+        Intent of a plain "show my schedule" question answered without the
+        AI, or None. Anything with numbers in it may carry a date/time and
+        goes to the AI, and so does anything asking to create, delete or
+        move an event even if it names a day ("hapus acara hari ini ...").
+        """
+        if any(char.isdigit() for char in text) or mentions_action(text):
+            return None
+        intent = classify_intent(text)
+        return intent if intent in ('free_slots', 'view_today', 'view_week') else None
+    
+    @track_handler
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle regular messages (AI chat)"""
+        text = update.message.text
+        
+        intent = self.local_intent(text)
+        if intent == 'free_slots':
+            return await self.reply_free_slots(update, text)
+        if intent == 'view_today':
+            return await self.list_events(update, context)
+        if intent == 'view_week':
+            return await self.list_week_events(update, context)
+        
         await self.ai_chat(update, context)
     
+    @track_handler
     async def cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Cancel current operation"""
         await update.message.reply_text(
@@ -59,6 +59,21 @@ def get_confirm_keyboard():
     
     return InlineKeyboardMarkup(keyboard)
 
+def get_conflict_keyboard(has_suggestion=True):
+    """Get keyboard for resolving a schedule conflict"""
+    keyboard = [
+        [InlineKeyboardButton("✅ Tetap Simpan", callback_data='conflict_keep')]
+    ]
+    
+    if has_suggestion:
+        keyboard.append([
+            InlineKeyboardButton("🔀 Pakai Waktu Kosong", callback_data='conflict_shift')
+        ])
+    
+    keyboard.append([InlineKeyboardButton("❌ Batal", callback_data='conflict_cancel')])
+    
+    return InlineKeyboardMarkup(keyboard)
+
 def get_quick_reply_keyboard():
     """Get quick reply keyboard for common actions"""
     keyboard = [
@@ -78,6 +93,19 @@ def get_quick_reply_keyboard():
     
     return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
 
+def get_calendar_selection_keyboard(calendars, selected):
+    """Toggle buttons for /calendars; callback data carries the calendar's position in the list"""
+    keyboard = [
+        [InlineKeyboardButton(
+            f"{'✅' if calendar['id'] in selected else '⬜'} {calendar['summary']}",
+            callback_data=f"calsel_{index}"
+        )]
+        for index, calendar in enumerate(calendars)
+    ]
+    keyboard.append([InlineKeyboardButton("✔️ Selesai", callback_data='calsel_done')])
+    
+    return InlineKeyboardMarkup(keyboard)
+
 def get_time_selection_keyboard():
     """Get time selection keyboard"""
     keyboard = []
@@ -0,0 +1,87 @@
+"""
+Persistence
+Stores ConversationHandler states in the shared state store
+"""
+import asyncio
+import json
+from typing import Dict, Optional, Tuple
+from telegram.ext import BasePersistence, PersistenceInput
+
+ConversationKey = Tuple[int, ...]
+
+
+class StorePersistence(BasePersistence):
+    def __init__(self, store, update_interval: float = 60):
+        """
+        Only conversation states are persisted here; the handlers keep their
+        own per-user state in StateMaps, and user/chat/bot_data are unused.
+        """
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+
+    @staticmethod
+    def _key(name: str) -> str:
+        return f"conversation:{name}"
+
+    @staticmethod
+    async def _run(func, *args):
+        """Store calls block on the network, so they run off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def get_conversations(self, name: str) -> Dict[ConversationKey, object]:
+        return {
+            tuple(json.loads(field)): json.loads(value)
+            for field, value in (await self._run(self.store.hgetall, self._key(name))).items()
+        }
+
+    async def update_conversation(self, name: str, key: ConversationKey, new_state: Optional[object]) -> None:
+        field = json.dumps(list(key))
+        if new_state is None:
+            await self._run(self.store.hdel, self._key(name), field)
+        else:
+            await self._run(self.store.hset, self._key(name), field, json.dumps(new_state))
+
+    async def get_user_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_chat_data(self) -> Dict[int, Dict]:
+        return {}
+
+    async def get_bot_data(self) -> Dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_user_data(self, user_id: int, data: Dict) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        pass
@@ -24,6 +24,21 @@ GOOGLE_CREDENTIALS_FILE = 'credentials.json'
 GOOGLE_TOKEN_FILE = 'token.json'
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
+# Scheduling Configuration
+EVENT_CACHE_TTL = int(os.getenv('EVENT_CACHE_TTL', '300'))  # seconds
+ACTIVE_HOURS_START = int(os.getenv('ACTIVE_HOURS_START', '7'))  # earliest suggested hour
+ACTIVE_HOURS_END = int(os.getenv('ACTIVE_HOURS_END', '22'))  # latest suggested hour
+WORK_HOURS_START = int(os.getenv('WORK_HOURS_START', '9'))  # used by schedule analytics
+WORK_HOURS_END = int(os.getenv('WORK_HOURS_END', '17'))
+FREE_SLOT_MIN_MINUTES = int(os.getenv('FREE_SLOT_MIN_MINUTES', '30'))
+# Calendars checked together by /free (comma separated calendar IDs)
+FREE_BUSY_CALENDARS = [cal.strip() for cal in os.getenv('FREE_BUSY_CALENDARS', 'primary').split(',') if cal.strip()]
+
+# Local search index: window of events kept in sync and how often it is refreshed
+SEARCH_SYNC_PAST_DAYS = int(os.getenv('SEARCH_SYNC_PAST_DAYS', '180'))
+SEARCH_SYNC_FUTURE_DAYS = int(os.getenv('SEARCH_SYNC_FUTURE_DAYS', '365'))
+SEARCH_SYNC_TTL = int(os.getenv('SEARCH_SYNC_TTL', '900'))  # seconds
+
 # Bot Commands
 COMMANDS = {
     'start': 'Mulai bot dan lihat menu utama',
@@ -32,11 +47,94 @@ COMMANDS = {
     'list_events': 'Lihat jadwal hari ini',
     'list_week': 'Lihat jadwal minggu ini',
     'delete_event': 'Hapus jadwal',
+    'free': 'Lihat waktu kosong',
+    'search': 'Cari jadwal',
+    'calendars': 'Pilih kalender yang ditampilkan',
+    'export': 'Unduh jadwal sebagai file .ics',
+    'digest': 'Ringkasan jadwal harian',
     'ai': 'Chat dengan AI Assistant',
     'reminder': 'Set reminder',
     'connect_calendar': 'Hubungkan dengan Google Calendar'
 }
 
+# Metrics Configuration (Prometheus text format at http://HOST:PORT/metrics)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9090'))
+
+# Event loop watchdog: logs stack traces of callbacks blocking longer than the threshold
+LOOP_WATCHDOG_ENABLED = os.getenv('LOOP_WATCHDOG_ENABLED', 'false').lower() == 'true'
+LOOP_WATCHDOG_THRESHOLD = float(os.getenv('LOOP_WATCHDOG_THRESHOLD', '0.25'))  # seconds
+
+# Tracing: one trace per update with spans for handlers, Calendar, Gemini and Telegram calls
+TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')  # empty to disable the file exporter
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', '')  # e.g. http://localhost:4318/v1/traces
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))  # fraction of updates traced
+
+# Scaling: WORKERS > 1 runs a webhook ingress that shards users by id over worker processes
+WORKERS = int(os.getenv('WORKERS', '1'))
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # public HTTPS URL Telegram posts updates to
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # checked against X-Telegram-Bot-Api-Secret-Token
+# Shared state (conversations, pending events, chat history, cache invalidation):
+# memory:// keeps it in process, redis://host:port/db shares it between workers
+STATE_BACKEND_URL = os.getenv('STATE_BACKEND_URL', 'memory://')
+STATE_TTL = int(os.getenv('STATE_TTL', str(7 * 24 * 3600)))  # seconds per user entry
+
+# Update lanes: commands, buttons and conversation steps never wait behind AI-bound messages
+UPDATE_LANES_ENABLED = os.getenv('UPDATE_LANES_ENABLED', 'true').lower() == 'true'
+FAST_LANE_CONCURRENCY = int(os.getenv('FAST_LANE_CONCURRENCY', '32'))  # updates processed at once
+AI_LANE_CONCURRENCY = int(os.getenv('AI_LANE_CONCURRENCY', '4'))
+# Updates of one chat always run in order; more than this many queued per chat are dropped
+CHAT_BACKLOG_LIMIT = int(os.getenv('CHAT_BACKLOG_LIMIT', '20'))
+
+# AI admission (needs the lanes): per-user token bucket, duplicate suppression and
+# shedding while the AI lane is backed up; shed messages get a short local reply
+AI_RATE_PER_MINUTE = float(os.getenv('AI_RATE_PER_MINUTE', '6'))
+AI_BURST = int(os.getenv('AI_BURST', '3'))
+AI_DUPLICATE_WINDOW = float(os.getenv('AI_DUPLICATE_WINDOW', '30'))  # seconds
+AI_MAX_QUEUE = int(os.getenv('AI_MAX_QUEUE', '16'))  # waiting AI-lane updates
+# Circuit breakers: fail fast while Calendar/Gemini are down; call deadlines adapt to
+# observed latency (3x p99) within [MIN, MAX] seconds
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))  # consecutive failures
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))  # seconds open before a probe
+CALENDAR_TIMEOUT_MIN = float(os.getenv('CALENDAR_TIMEOUT_MIN', '2'))
+CALENDAR_TIMEOUT_MAX = float(os.getenv('CALENDAR_TIMEOUT_MAX', '20'))
+GEMINI_TIMEOUT_MIN = float(os.getenv('GEMINI_TIMEOUT_MIN', '5'))
+GEMINI_TIMEOUT_MAX = float(os.getenv('GEMINI_TIMEOUT_MAX', '60'))
+# Calendar API transport: keep-alive clients checked out per call, so up to this many
+# Calendar calls run in parallel; gzip asks Google for compressed responses
+CALENDAR_HTTP_POOL_SIZE = int(os.getenv('CALENDAR_HTTP_POOL_SIZE', '4'))
+CALENDAR_HTTP_GZIP = os.getenv('CALENDAR_HTTP_GZIP', 'true').lower() == 'true'
+# Extra attempts for event inserts on 5xx/429/connection errors; safe because the bot's
+# event ids are deterministic, so a repeated insert cannot create a duplicate
+CALENDAR_WRITE_RETRIES = int(os.getenv('CALENDAR_WRITE_RETRIES', '1'))
+# A create from the same user with the same title, start, end and place within this many
+# seconds (the request sent again as a new message) is answered with the first event
+DUPLICATE_CREATE_WINDOW = float(os.getenv('DUPLICATE_CREATE_WINDOW', '120'))
+# Calendar writes are logged here before they are sent; while Calendar is unreachable they
+# stay queued and are retried in the background with backoff (RETRY_MIN doubling up to
+# RETRY_MAX seconds), and given up after MAX_AGE seconds. With WORKERS > 1 each worker
+# keeps its own file (suffix .<worker>)
+WRITE_QUEUE_FILE = os.getenv('WRITE_QUEUE_FILE', 'pending_writes.jsonl')
+WRITE_RETRY_MIN = float(os.getenv('WRITE_RETRY_MIN', '5'))
+WRITE_RETRY_MAX = float(os.getenv('WRITE_RETRY_MAX', '600'))
+WRITE_QUEUE_MAX_AGE = float(os.getenv('WRITE_QUEUE_MAX_AGE', str(3 * 24 * 3600)))
+# .ics import: events per batch request (Calendar allows 50), resends of rate-limited
+# events, largest file accepted (the Bot API only hands out files up to 20 MB) and
+# seconds between progress messages
+ICS_BATCH_SIZE = int(os.getenv('ICS_BATCH_SIZE', '50'))
+ICS_IMPORT_RETRIES = int(os.getenv('ICS_IMPORT_RETRIES', '3'))
+ICS_MAX_FILE_SIZE = int(os.getenv('ICS_MAX_FILE_SIZE', str(20 * 1024 * 1024)))
+ICS_PROGRESS_INTERVAL = float(os.getenv('ICS_PROGRESS_INTERVAL', '5'))
+# Daily agenda digest (/digest HH:MM): each calendar is listed once per send time, at a
+# moment spread over the LEAD seconds before it, and digests go out at most SEND_RATE a
+# second (Telegram allows a bot about 30 messages a second)
+DIGEST_LEAD = float(os.getenv('DIGEST_LEAD', '900'))
+DIGEST_SEND_RATE = float(os.getenv('DIGEST_SEND_RATE', '20'))
+
 # Logging Configuration
 LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 LOG_LEVEL = 'INFO'
@@ -2,15 +2,19 @@
 Telegram Calendar Bot with AI Assistant
 Main application file - FIXED VERSION
 """
+import asyncio
 import logging
 import sys
 from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
+    ApplicationBuilder,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
     CallbackQueryHandler,
+    TypeHandler,
     filters,
     ContextTypes
 )
@@ -23,9 +27,24 @@ from bot.handlers import (
     WAITING_EVENT_TIME,
     WAITING_EVENT_DURATION,
     WAITING_EVENT_LOCATION,
+    WAITING_EVENT_CONFIRM,
     WAITING_DELETE_SELECTION
 )
+from bot.admission import AdmissionControl
+from bot.dispatcher import AI_LANE, FAST_LANE, LaneUpdateProcessor
 from bot.keyboards import get_main_menu, get_quick_reply_keyboard
+from bot.persistence import StorePersistence
+from services.state_store import collect_changes, get_store, load_all, write_changes
+from utils import date_parser, tracing
+from utils.circuit_breaker import CircuitOpenError
+from utils.loop_watchdog import LoopWatchdog
+from utils.metrics import (
+    REGISTRY,
+    gauge,
+    monitor_event_loop_lag,
+    start_metrics_server,
+    track_handler
+)
 
 # Configure logging
 logging.basicConfig(
@@ -37,6 +56,11 @@ logger = logging.getLogger(__name__)
 # Initialize handlers
 bot_handlers = BotHandlers()
 
+# Handler groups of the shared-state load and flush, around all regular handlers
+STATE_LOAD_GROUP = -100
+STATE_FLUSH_GROUP = 100
+
+@track_handler
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks - SIMPLIFIED VERSION"""
     query = update.callback_query
@@ -107,36 +131,75 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         bot_handlers.ai_service.clear_chat_history(user_id)
         await query.message.reply_text("✅ AI chat history cleared!")
     
+    elif query.data.startswith('conflict_'):
+        await bot_handlers.resolve_event_conflict(update, context)
+    
+    elif query.data.startswith('calsel_'):
+        await bot_handlers.toggle_calendar(update, context)
+    
     elif query.data == 'main_menu':
         await query.edit_message_text(
             "📱 Menu Utama",
             reply_markup=get_main_menu()
         )
 
+async def ai_mode_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Explain how to talk to the AI assistant"""
+    await update.message.reply_text(
+        "🤖 *AI Assistant Mode*\n\n"
+        "Silakan ketik pesan Anda.\n"
+        "Contoh: Meeting besok jam 2 siang",
+        parse_mode='Markdown'
+    )
+
+# Quick reply keyboard button text -> handler (exact match, one dict probe).
+# bot_handlers is looked up per call so a replaced instance takes effect.
+QUICK_BUTTON_ACTIONS = {
+    "📅 Tambah Jadwal": lambda update, context: bot_handlers.add_event_start(update, context),
+    "📋 Lihat Hari Ini": lambda update, context: bot_handlers.list_events(update, context),
+    "🗓️ Lihat Minggu": lambda update, context: bot_handlers.list_week_events(update, context),
+    "🗑️ Hapus Jadwal": lambda update, context: bot_handlers.delete_event_start(update, context),
+    "🤖 Chat AI": ai_mode_info,
+    "📚 Bantuan": lambda update, context: bot_handlers.help(update, context),
+}
+
+@track_handler
 async def quick_button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle quick reply keyboard buttons"""
-    text = update.message.text
+    action = QUICK_BUTTON_ACTIONS.get(update.message.text)
     
-    if text == "📅 Tambah Jadwal":
-        return await bot_handlers.add_event_start(update, context)
-    elif text == "📋 Lihat Hari Ini":
-        await bot_handlers.list_events(update, context)
-    elif text == "🗓️ Lihat Minggu":
-        await bot_handlers.list_week_events(update, context)
-    elif text == "🗑️ Hapus Jadwal":  # TAMBAHKAN INI
-        return await bot_handlers.delete_event_start(update, context)
-    elif text == "🤖 Chat AI":
-        await update.message.reply_text(
-            "🤖 *AI Assistant Mode*\n\n"
-            "Silakan ketik pesan Anda.\n"
-            "Contoh: Meeting besok jam 2 siang",
-            parse_mode='Markdown'
-        )
-    elif text == "📚 Bantuan":
-        await bot_handlers.help(update, context)
-    else:
-        # Treat as AI chat for schedule detection
-        await bot_handlers.handle_message(update, context)
+    if action:
+        return await action(update, context)
+    
+    # Treat as AI chat for schedule detection
+    await bot_handlers.handle_message(update, context)
+
+# Commands whose handler waits on Gemini
+AI_COMMANDS = {'ai'}
+
+def update_lane(update: object, conversations) -> str:
+    """
+    Lane of an update: free text outside a conversation and /ai go to
+    Gemini (slow lane); commands, buttons and conversation steps are fast
+    """
+    if not isinstance(update, Update) or update.message is None or not update.message.text:
+        return FAST_LANE
+    text = update.message.text
+    if text.startswith('/'):
+        command = text[1:].split(maxsplit=1)[0].split('@')[0] if len(text) > 1 else ''
+        return AI_LANE if command in AI_COMMANDS else FAST_LANE
+    if text in QUICK_BUTTON_ACTIONS or bot_handlers.local_intent(text):
+        return FAST_LANE
+    if any(conversation.check_update(update) for conversation in conversations):
+        return FAST_LANE
+    return AI_LANE
+
+def admit_update(update: object, lane: str, processor: LaneUpdateProcessor, admission: AdmissionControl):
+    """Shed reason for an AI-lane update (see bot.admission), None to let it queue"""
+    if lane != AI_LANE:
+        return None
+    sender = update.effective_user or update.effective_chat
+    return admission.check(sender.id, update.message.text, processor.queue_depth(AI_LANE))
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle errors"""
@@ -144,6 +207,12 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     try:
         if update and update.effective_message:
+            if isinstance(context.error, CircuitOpenError):
+                await update.effective_message.reply_text(
+                    f"⚠️ Layanan {context.error.name} sedang gangguan. "
+                    f"Coba lagi dalam {max(1, round(context.error.retry_in))} detik."
+                )
+                return
             await update.effective_message.reply_text(
                 "❌ Terjadi kesalahan. Silakan coba lagi atau gunakan /help"
             )
@@ -162,18 +231,90 @@ async def post_init(application: Application) -> None:
     print(f"📍 Timezone: {config.TIMEZONE_STR}")
     print("="*50)
     print("Bot is running! Press Ctrl+C to stop.\n")
-
-def main():
-    """Start the bot"""
-    if not config.TELEGRAM_BOT_TOKEN:
-        logger.error("TELEGRAM_BOT_TOKEN not set!")
-        sys.exit(1)
     
-    if not config.GEMINI_API_KEY:
-        logger.warning("GEMINI_API_KEY not set")
+    if config.LOOP_WATCHDOG_ENABLED:
+        # The watchdog's heartbeat also feeds the loop lag metrics
+        watchdog = LoopWatchdog(threshold=config.LOOP_WATCHDOG_THRESHOLD)
+        watchdog.start()
+        application.bot_data['loop_watchdog'] = watchdog
+    elif config.METRICS_ENABLED:
+        application.bot_data['loop_lag_task'] = asyncio.create_task(monitor_event_loop_lag())
+    
+    # Build the Gemini client off the loop now that the bot is up, so the
+    # first AI message does not pay for importing google.generativeai
+    asyncio.get_running_loop().run_in_executor(None, lambda: bot_handlers.ai_service.model)
     
-    # Create application
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
+    # Apply calendar writes queued while Calendar was unreachable, including
+    # those still pending from before a restart
+    if not bot_handlers.write_queue.is_open:
+        bot_handlers.write_queue.open(config.WRITE_QUEUE_FILE)
+    application.bot_data['write_replayer'] = bot_handlers.start_write_replayer(application.bot)
+    
+    # Daily agenda digests, listed ahead of their send times and paced out
+    application.bot_data['digest_scheduler'] = bot_handlers.start_digests(application.bot)
+
+PARSER_MEMO = gauge(
+    'bot_parser_memo_lookups', 'Date/time parser memo lookups by result', ('parser', 'result'))
+
+def collect_parser_memo():
+    """Copy the parser lru_cache statistics into gauges before each scrape"""
+    for parser, info in date_parser.cache_info().items():
+        PARSER_MEMO.set(info.hits, parser=parser, result='hit')
+        PARSER_MEMO.set(info.misses, parser=parser, result='miss')
+
+def default_builder() -> ApplicationBuilder:
+    """Builder for the real Telegram API, with tracing and shared persistence when configured"""
+    builder = Application.builder().token(config.TELEGRAM_BOT_TOKEN)
+    if config.TRACING_ENABLED:
+        # Same pool size PTB uses by default, wrapped so sends become spans
+        builder = builder.request(tracing.TracingRequest(HTTPXRequest(connection_pool_size=256)))
+    if get_store().shared:
+        builder = builder.persistence(StorePersistence(get_store()))
+    return builder
+
+async def load_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Load the sender's per-user state from the shared store off the loop, before the handlers read it"""
+    if update.effective_user:
+        await asyncio.get_running_loop().run_in_executor(None, load_all, (update.effective_user.id,))
+
+async def flush_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Write per-user state and conversation states changed by this update to the shared store"""
+    # Serialised here, where handlers mutate the values; only the store I/O runs off the loop
+    changes = collect_changes()
+    if any(deleted or changed for _, deleted, changed in changes):
+        await asyncio.get_running_loop().run_in_executor(None, write_changes, changes)
+    if context.application.persistence:
+        await context.application.update_persistence()
+
+def build_application(builder: ApplicationBuilder = None, lanes: bool = None) -> Application:
+    """
+    Create the Application with every handler registered. Pass a
+    preconfigured builder (token, request objects) to run the bot against
+    something other than the real Telegram API, e.g. the load generator.
+    `lanes` (default config.UPDATE_LANES_ENABLED) installs the lane
+    dispatcher, which runs chats concurrently but each chat's updates in
+    order; leave it off to keep the builder's own concurrent_updates
+    (unordered, so only for comparisons).
+    """
+    if builder is None:
+        builder = default_builder()
+    if lanes is None:
+        lanes = config.UPDATE_LANES_ENABLED
+    if config.TRACING_ENABLED:
+        builder = builder.application_class(tracing.TracedApplication)
+    if lanes:
+        processor = LaneUpdateProcessor({
+            FAST_LANE: config.FAST_LANE_CONCURRENCY,
+            AI_LANE: config.AI_LANE_CONCURRENCY,
+        }, max_backlog=config.CHAT_BACKLOG_LIMIT)
+        builder = builder.concurrent_updates(processor)
+    application = builder.build()
+    if not lanes and application.update_processor.max_concurrent_updates > 1:
+        # Only the lane dispatcher keeps one chat's updates in order
+        logger.warning("Concurrent updates without update lanes: steps of one conversation may "
+                       "overtake each other")
+    # Conversation states survive restarts and move between workers with a shared store
+    persistent = application.persistence is not None
     
     # Conversation handlers
     add_event_conv = ConversationHandler(
@@ -197,9 +338,14 @@ def main():
             WAITING_EVENT_LOCATION: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, bot_handlers.receive_event_location)
             ],
+            WAITING_EVENT_CONFIRM: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, bot_handlers.receive_event_confirm)
+            ],
         },
         fallbacks=[CommandHandler('cancel', bot_handlers.cancel)],
-        per_message=False
+        per_message=False,
+        name='add_event',
+        persistent=persistent
     )
     
     delete_event_conv = ConversationHandler(
@@ -213,16 +359,30 @@ def main():
         ],
     },
     fallbacks=[CommandHandler('cancel', bot_handlers.cancel)],
-    per_message=False
+    per_message=False,
+    name='delete_event',
+    persistent=persistent
     )
     
+    if lanes:
+        processor.classify = lambda update: update_lane(update, (add_event_conv, delete_event_conv))
+        admission = AdmissionControl(
+            config.AI_RATE_PER_MINUTE, config.AI_BURST, config.AI_DUPLICATE_WINDOW, config.AI_MAX_QUEUE)
+        processor.admit = lambda update, lane: admit_update(update, lane, processor, admission)
+    
     # Register handlers
     application.add_handler(CommandHandler("start", bot_handlers.start))
     application.add_handler(CommandHandler("help", bot_handlers.help))
     application.add_handler(CommandHandler("connect_calendar", bot_handlers.connect_calendar))
     application.add_handler(CommandHandler("list_events", bot_handlers.list_events))
     application.add_handler(CommandHandler("list_week", bot_handlers.list_week_events))
+    application.add_handler(CommandHandler("free", bot_handlers.free_slots))
+    application.add_handler(CommandHandler("search", bot_handlers.search))
+    application.add_handler(CommandHandler("calendars", bot_handlers.calendars))
     application.add_handler(CommandHandler("ai", bot_handlers.ai_chat))
+    application.add_handler(CommandHandler("export", bot_handlers.export))
+    application.add_handler(CommandHandler("digest", bot_handlers.digest))
+    application.add_handler(MessageHandler(filters.Document.FileExtension('ics'), bot_handlers.import_ics))
     
     # Add conversation handlers FIRST
     application.add_handler(add_event_conv)
@@ -234,12 +394,45 @@ def main():
     # Finally message handler
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, quick_button_handler))
     
+    # Runs after every other handler group
+    if get_store().shared:
+        application.add_handler(TypeHandler(Update, load_state), group=STATE_LOAD_GROUP)
+        application.add_handler(TypeHandler(Update, flush_state), group=STATE_FLUSH_GROUP)
+    
     # Error handler
     application.add_error_handler(error_handler)
     
     # Post init
     application.post_init = post_init
     
+    return application
+
+def start_observability(metrics_port: int = None):
+    """Start the metrics endpoint and tracing exporters when enabled"""
+    if config.METRICS_ENABLED:
+        REGISTRY.add_collector(collect_parser_memo)
+        start_metrics_server(config.METRICS_HOST, metrics_port or config.METRICS_PORT)
+    
+    if config.TRACING_ENABLED:
+        tracing.configure(config.TRACE_FILE, config.TRACE_OTLP_ENDPOINT, config.TRACE_SAMPLE_RATE)
+
+def main():
+    """Start the bot"""
+    if not config.TELEGRAM_BOT_TOKEN:
+        logger.error("TELEGRAM_BOT_TOKEN not set!")
+        sys.exit(1)
+    
+    if not config.GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY not set")
+    
+    if config.WORKERS > 1:
+        from bot.cluster import run_cluster
+        run_cluster(config.WORKERS)
+        return
+    
+    start_observability()
+    application = build_application()
+    
     logger.info("Starting bot...")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
@@ -0,0 +1,234 @@
+"""
+Event Cache
+In-memory cache of calendar events with a per-calendar interval index
+"""
+import functools
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import config
+from utils.helpers import get_event_bounds, is_busy_event
+from utils.interval_index import IntervalIndex
+from utils.search_index import SearchIndex
+
+
+# The event keys the bot reads (format_event, conflict checks, the search
+# index, recurrence expansion); start/end keep only their date, dateTime
+# and the time zone a recurring event repeats in
+EVENT_FIELDS = ('id', 'status', 'summary', 'location', 'description', 'transparency',
+                'recurrence', 'recurringEventId')
+TIME_FIELDS = ('start', 'end', 'originalStartTime')
+TIME_KEYS = ('date', 'dateTime', 'timeZone')
+
+
+def compact_event(event: Dict) -> Dict:
+    """Projection of an API event onto the fields the bot uses"""
+    compact = {key: event[key] for key in EVENT_FIELDS if key in event}
+    for key in TIME_FIELDS:
+        if key in event:
+            compact[key] = {name: value for name, value in event[key].items() if name in TIME_KEYS}
+    return compact
+
+
+def _local_day(value: datetime) -> date:
+    return value.astimezone(config.TIMEZONE).date()
+
+
+def _day_start(day: date) -> datetime:
+    return config.TIMEZONE.localize(datetime(day.year, day.month, day.day))
+
+
+def _locked(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class EventCache:
+    def __init__(self, ttl: int = None):
+        """
+        Events keyed by calendar and id; busy ones also go into an IntervalIndex
+        and every event's text goes into a shared SearchIndex. Handlers call
+        Calendar from lane threads, hence the lock around every method.
+        """
+        self.ttl = config.EVENT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.RLock()
+        self.search_index = SearchIndex()
+        self._events: Dict[str, Dict[str, Dict]] = {}
+        self._indexes: Dict[str, IntervalIndex] = {}
+        self._loaded_days: Dict[str, Dict[date, float]] = {}
+
+    def _calendar(self, calendar_id: str) -> Tuple[Dict[str, Dict], IntervalIndex]:
+        if calendar_id not in self._events:
+            self._events[calendar_id] = {}
+            self._indexes[calendar_id] = IntervalIndex()
+            self._loaded_days[calendar_id] = {}
+        return self._events[calendar_id], self._indexes[calendar_id]
+
+    @_locked
+    def put(self, calendar_id: str, event: Dict):
+        """Insert or replace a single event"""
+        events, index = self._calendar(calendar_id)
+        event_id = event.get('id')
+        if not event_id:
+            return
+
+        if event.get('status') == 'cancelled':
+            self.discard(calendar_id, event_id)
+            return
+
+        events[event_id] = event
+        self.search_index.add((calendar_id, event_id), {
+            'summary': event.get('summary', ''),
+            'location': event.get('location', ''),
+            'description': event.get('description', ''),
+        })
+        bounds = get_event_bounds(event)
+        if bounds and is_busy_event(event):
+            index.add(bounds[0], bounds[1], event_id)
+        else:
+            index.remove(event_id)
+
+    @_locked
+    def discard(self, calendar_id: str, event_id: str):
+        """Forget a single event"""
+        events, index = self._calendar(calendar_id)
+        events.pop(event_id, None)
+        index.remove(event_id)
+        self.search_index.remove((calendar_id, event_id))
+
+    @_locked
+    def store_window(self,
+                     calendar_id: str,
+                     time_min: datetime,
+                     time_max: datetime,
+                     events: List[Dict],
+                     complete: bool = True):
+        """
+        Cache the result of a list call. When the result is complete, every
+        whole local day inside [time_min, time_max) is marked as loaded and
+        busy events no longer returned for that range are dropped.
+        """
+        _, index = self._calendar(calendar_id)
+
+        if complete:
+            first_day = _local_day(time_min)
+            if _day_start(first_day) < time_min:
+                first_day += timedelta(days=1)
+            last_day = _local_day(time_max)  # Exclusive
+
+            if first_day < last_day:
+                returned = {event.get('id') for event in events}
+                range_start, range_end = _day_start(first_day), _day_start(last_day)
+                for _, _, event_id in index.overlapping(range_start, range_end):
+                    if event_id not in returned:
+                        self.discard(calendar_id, event_id)
+
+                now = time.monotonic()
+                day = first_day
+                while day < last_day:
+                    self._loaded_days[calendar_id][day] = now
+                    day += timedelta(days=1)
+
+        for event in events:
+            self.put(calendar_id, event)
+
+    @_locked
+    def invalidate(self, calendar_id: str = None):
+        """Mark days as stale so the next lookup refetches them"""
+        calendars = [calendar_id] if calendar_id else list(self._loaded_days)
+        for cal in calendars:
+            self._loaded_days.get(cal, {}).clear()
+
+    @_locked
+    def missing_ranges(self, calendar_id: str, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Day-aligned ranges within [start, end) that are not cached or are stale"""
+        self._calendar(calendar_id)
+        loaded = self._loaded_days[calendar_id]
+        now = time.monotonic()
+
+        ranges = []
+        day = _local_day(start)
+        last_day = _local_day(end - timedelta(microseconds=1))
+        while day <= last_day:
+            loaded_at = loaded.get(day)
+            if loaded_at is None or now - loaded_at > self.ttl:
+                day_start = _day_start(day)
+                day_end = _day_start(day + timedelta(days=1))
+                if ranges and ranges[-1][1] == day_start:
+                    ranges[-1] = (ranges[-1][0], day_end)
+                else:
+                    ranges.append((day_start, day_end))
+            day += timedelta(days=1)
+        return ranges
+
+    @_locked
+    def overlapping(self, calendar_id: str, start: datetime, end: datetime) -> List[Dict]:
+        """Busy events overlapping [start, end), ordered by start"""
+        events, index = self._calendar(calendar_id)
+        return [events[event_id] for _, _, event_id in index.overlapping(start, end)]
+
+    @_locked
+    def nearest_free_slot(self,
+                          calendar_id: str,
+                          start: datetime,
+                          duration: timedelta,
+                          not_before: datetime = None,
+                          not_after: datetime = None) -> Optional[datetime]:
+        """Closest free start time for an event of the given duration"""
+        _, index = self._calendar(calendar_id)
+        return index.nearest_free_slot(start, duration, not_before, not_after)
+
+    @_locked
+    def search(self, query: str, limit: int = None) -> List[Dict]:
+        """Cached events matching a text query, best match first"""
+        results = []
+        for calendar_id, event_id in self.search_index.search(query):
+            event = self._events.get(calendar_id, {}).get(event_id)
+            if event:
+                results.append(event)
+                if limit and len(results) >= limit:
+                    break
+        return results
+
+
+class SeriesCache:
+    def __init__(self, ttl: int = None):
+        """
+        Occurrences of recurring events that have an exception (moved, edited
+        or cancelled), by calendar and recurring event id, as
+        utils.recurrence.original_key values. They come from a listing of
+        the whole series, not of one window, so an occurrence moved far away
+        is never expanded back at its original time, and are kept for `ttl`
+        seconds across windows. Exceptions seen since then (in a window
+        listing, or made by the bot) are added to them.
+        Shared by the fan-out threads, hence the lock.
+        """
+        self.ttl = config.EVENT_CACHE_TTL if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, str], Tuple[float, FrozenSet]] = {}
+
+    def get(self, calendar_id: str, series_id: str) -> Optional[FrozenSet]:
+        """Exception keys of a series listed less than `ttl` seconds ago, or None"""
+        with self._lock:
+            cached = self._series.get((calendar_id, series_id))
+        if cached is None or time.monotonic() - cached[0] > self.ttl:
+            return None
+        return cached[1]
+
+    def put(self, calendar_id: str, series_id: str, keys: FrozenSet):
+        with self._lock:
+            self._series[(calendar_id, series_id)] = (time.monotonic(), keys)
+
+    def add(self, calendar_id: str, series_id: str, key):
+        with self._lock:
+            cached = self._series.get((calendar_id, series_id))
+            if cached is not None:
+                self._series[(calendar_id, series_id)] = (cached[0], cached[1] | {key})
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
@@ -2,27 +2,22 @@
 Gemini AI Service
 Handles AI interactions using Google's Gemini API
 """
-import google.generativeai as genai
 from typing import Dict, List, Optional
 from datetime import datetime
 import config
 import json
+import threading
+from services.state_store import StateMap
+from utils.circuit_breaker import CallTimeoutError, CircuitBreaker, CircuitOpenError
+from utils.date_parser import parse_schedule_locally
+from utils.metrics import track_call
+from utils.schedule_analytics import analyze_schedule, summarize_schedule
 
 class GeminiAIService:
     def __init__(self):
-        """Initialize Gemini AI service"""
-        genai.configure(api_key=config.GEMINI_API_KEY)
-        
-        # Configure the model
-        self.model = genai.GenerativeModel(
-            model_name='gemini-2.5-flash',
-            generation_config={
-                'temperature': 0.7,
-                'top_p': 0.95,
-                'top_k': 40,
-                'max_output_tokens': 2048,
-            }
-        )
+        """Initialize Gemini AI service (the model client is built on first use)"""
+        self._model = None
+        self._model_lock = threading.Lock()
         
         # System prompt for calendar assistant
         self.system_prompt = """
@@ -57,7 +52,63 @@ class GeminiAIService:
         """
         
         # Chat history storage (per user)
-        self.chat_histories = {}
+        self.chat_histories = StateMap('chat_histories')
+        
+        self.breaker = CircuitBreaker(
+            'gemini',
+            failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=config.CIRCUIT_RESET_TIMEOUT,
+            min_timeout=config.GEMINI_TIMEOUT_MIN,
+            max_timeout=config.GEMINI_TIMEOUT_MAX,
+            max_concurrent=config.AI_LANE_CONCURRENCY,
+        )
+    
+    @property
+    def model(self):
+        """
+        The Gemini model client. google.generativeai is imported here rather
+        than at module load: the import alone takes about half a second.
+        """
+        if self._model is None:
+            # Several AI lane threads may ask at once; build it only once
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=config.GEMINI_API_KEY)
+                    self._model = genai.GenerativeModel(
+                        model_name='gemini-2.5-flash',
+                        generation_config={
+                            'temperature': 0.7,
+                            'top_p': 0.95,
+                            'top_k': 40,
+                            'max_output_tokens': 2048,
+                        }
+                    )
+        return self._model
+    
+    @model.setter
+    def model(self, model):
+        self._model = model
+    
+    def _generate(self, prompt: str, operation: str):
+        """Call the model through the circuit breaker, recording metrics"""
+        with track_call('gemini', operation):
+            return self.breaker.call(self.model.generate_content, prompt)
+    
+    def parse_locally(self, text: str) -> Dict:
+        """Fallback for parse_schedule_from_text while Gemini is unavailable"""
+        data = parse_schedule_locally(text)
+        if data:
+            return {
+                'type': 'schedule',
+                'data': data,
+                'message': '(AI sedang tidak tersedia, jadwal dibaca tanpa AI)'
+            }
+        return {
+            'type': 'chat',
+            'message': '🤖 AI sedang tidak tersedia. Sebutkan waktu acaranya '
+                       '(mis. "Meeting besok jam 2 siang di kantor") atau gunakan /add_event.'
+        }
     
     def parse_schedule_from_text(self, text: str, user_id: str = None) -> Dict:
         """
@@ -75,7 +126,7 @@ class GeminiAIService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, 'parse_schedule')
             response_text = response.text
             
             # Try to extract JSON if present
@@ -101,6 +152,8 @@ class GeminiAIService:
                 'message': response_text
             }
             
+        except (CircuitOpenError, CallTimeoutError):
+            return self.parse_locally(text)
         except Exception as e:
             return {
                 'type': 'error',
@@ -140,7 +193,7 @@ class GeminiAIService:
         full_prompt = "\n".join(conversation)
         
         try:
-            response = self.model.generate_content(full_prompt)
+            response = self._generate(full_prompt, 'chat')
             response_text = response.text
             
             # Store in history
@@ -179,7 +232,7 @@ class GeminiAIService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, 'reminder')
             return response.text
         except Exception as e:
             return f"⏰ Reminder: {event.get('summary', 'Acara Anda')} akan segera dimulai!"
@@ -188,18 +241,15 @@ class GeminiAIService:
         """
         Analyze schedule and suggest optimizations
         """
-        events_summary = []
-        for event in events:
-            events_summary.append({
-                'title': event.get('summary', ''),
-                'start': event.get('start', {}).get('dateTime', ''),
-                'end': event.get('end', {}).get('dateTime', '')
-            })
+        # Conflicts, load and gaps are computed locally; only the compact
+        # summary goes to the model
+        stats_summary = summarize_schedule(analyze_schedule(events))
         
         prompt = f"""
-        Analisis jadwal berikut dan berikan saran optimasi:
+        Analisis jadwal berikut dan berikan saran optimasi.
+        Statistik jadwal (sudah dihitung, jangan dihitung ulang):
         
-        {json.dumps(events_summary, indent=2)}
+        {stats_summary}
         
         Berikan saran untuk:
         1. Efisiensi waktu
@@ -212,8 +262,10 @@ class GeminiAIService:
         """
         
         try:
-            response = self.model.generate_content(prompt)
+            response = self._generate(prompt, 'schedule_optimization')
             return response.text
+        except (CircuitOpenError, CallTimeoutError):
+            return f"📊 Statistik jadwal (AI sedang tidak tersedia):\n\n{stats_summary}"
         except Exception as e:
             return "Tidak dapat menganalisis jadwal saat ini."
     
@@ -2,25 +2,121 @@
 Google Calendar Service
 Handles all Google Calendar API operations
 """
+import contextvars
+import heapq
+import itertools
+import logging
 import os
 import pickle
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, FrozenSet, Iterator, Optional, Tuple
 from googleapiclient.errors import HttpError
 import config
+from services.event_cache import EVENT_FIELDS, TIME_FIELDS, TIME_KEYS, EventCache, SeriesCache, compact_event
+from services.state_store import get_store
+from utils.circuit_breaker import CircuitBreaker
+from utils.helpers import parse_event_time
+from utils.interval_index import sweep_free_slots
+from utils.metrics import counter, record_cache, track_call
+from utils.recurrence import UnsupportedRecurrence, expand, original_key
+
+logger = logging.getLogger(__name__)
+
+# Partial responses (fields=): only what compact_event keeps comes over the
+# wire, not attendees, conference data, reminders, links, etags...
+# The list, today, week and delete views all render with format_event and
+# fill the event cache, so they share one mask.
+EVENT_MASK = ','.join(EVENT_FIELDS + tuple(f"{key}({','.join(TIME_KEYS)})" for key in TIME_FIELDS))
+# iCalUID is kept for recurring events only, to list the rest of their series
+LIST_MASK = f"nextPageToken,items({EVENT_MASK},iCalUID)"
+# The create confirmation also links to the event
+CREATED_MASK = f"{EVENT_MASK},htmlLink"
+# /export writes events as iCalendar: their UID and last change too
+EXPORT_MASK = f"nextPageToken,items({EVENT_MASK},iCalUID,updated)"
+# A whole series: which occurrences have an exception
+SERIES_MASK = f"nextPageToken,items(recurringEventId,originalStartTime({','.join(TIME_KEYS)}))"
+CALENDAR_LIST_MASK = 'nextPageToken,items(id,summary,summaryOverride,primary)'
+
+# Series listed per batch request when looking up their exceptions
+SERIES_BATCH_SIZE = 50
+# Largest page events.list returns
+LIST_PAGE_SIZE = 2500
+
+DUPLICATE_INSERTS = counter(
+    'bot_calendar_duplicate_inserts_total', 'Creates whose client-chosen event id already existed, '
+    'answered with the existing event')
+IMPORTED_EVENTS = counter(
+    'bot_calendar_import_events_total', 'Events sent with events.import (file imports) by outcome',
+    ('result',))
+RECURRENCE_FALLBACKS = counter(
+    'bot_calendar_recurrence_fallbacks_total', 'List calls whose recurring events were expanded '
+    'by the server because a rule or the exceptions of a series could not be handled locally')
+
+# Sorts events without usable times first
+_NO_START = datetime.min.replace(tzinfo=timezone.utc)
+
+def _start_key(event: Dict) -> datetime:
+    return parse_event_time(event.get('start', {})) or _NO_START
+
+# Bumped by every write so other workers know their event caches are stale
+CACHE_GENERATION_KEY = 'calendar:cache_generation'
+
+def _is_outage(error: BaseException) -> bool:
+    """Whether an error says Calendar is unhealthy (not e.g. a 404 for a deleted event)"""
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500 or error.resp.status == 429
+    return True
+
+def _is_throttled(error: BaseException) -> bool:
+    """Whether one call of a batch was refused for load (rate limit, 5xx) and may go through later"""
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    return status >= 500 or status == 429 or (status == 403 and b'ateLimitExceeded' in (error.content or b''))
 
 class GoogleCalendarService:
-    def __init__(self):
-        self.service = None
+    def __init__(self, service=None):
+        """Pass an already-built API `service` to skip OAuth (e.g. for benchmarks)"""
+        self.service = service
         self.credentials = None
-        self.authenticate()
+        self.cache = EventCache()
+        self.series_cache = SeriesCache()
+        self.free_busy_cache = {}
+        # (calendar id, local day) -> (listed at, every event of the day); see get_day_events
+        self.day_listings = {}
+        self.last_sync = None
+        self.cache_generation = 0
+        self.calendar_list = None  # (fetched at, calendars)
+        # Per-calendar list calls of a merged view run side by side
+        self.fanout = ThreadPoolExecutor(
+            max_workers=config.CALENDAR_HTTP_POOL_SIZE, thread_name_prefix='calendar-fanout')
+        # Per-call keep-alive clients, set up by authenticate()
+        self.http_pool = None
+        # As many worker threads as pooled clients, so calls never wait for one
+        self.breaker = CircuitBreaker(
+            'calendar',
+            failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=config.CIRCUIT_RESET_TIMEOUT,
+            min_timeout=config.CALENDAR_TIMEOUT_MIN,
+            max_timeout=config.CALENDAR_TIMEOUT_MAX,
+            max_concurrent=config.CALENDAR_HTTP_POOL_SIZE,
+            is_failure=_is_outage,
+        )
+        if self.service is None:
+            self.authenticate()
     
     def authenticate(self):
         """Authenticate and create Google Calendar service"""
+        # Imported here: the auth, OAuth flow and discovery modules are slow
+        # to load and only needed once, when the first request needs the API
+        from google.auth.transport.requests import Request
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from googleapiclient.discovery import build
+        from services.http_pool import HttpPool
+        
         creds = None
         
         # Token file stores the user's access and refresh tokens
@@ -51,6 +147,63 @@ class GoogleCalendarService:
         
         self.credentials = creds
         self.service = build('calendar', 'v3', credentials=creds)
+        # The service's own httplib2 client is shared and not thread-safe;
+        # every request goes through a pooled one instead (see _send)
+        self.http_pool = HttpPool(
+            creds,
+            size=config.CALENDAR_HTTP_POOL_SIZE,
+            timeout=config.CALENDAR_TIMEOUT_MAX,
+            gzip=config.CALENDAR_HTTP_GZIP,
+        )
+    
+    def _execute(self, request, method: str, idempotent: bool = True, retries: int = 0):
+        """
+        Execute a googleapiclient request through the circuit breaker,
+        recording metrics. Writes (idempotent=False) are never abandoned
+        at the adaptive deadline, only failed fast while the circuit is open.
+        `retries` lets googleapiclient repeat the request on 5xx/429 and
+        connection errors; only for requests that are safe to repeat.
+        """
+        with track_call('calendar', method):
+            return self.breaker.call(self._send, request, retries, deadline=idempotent)
+    
+    def _send(self, request, retries: int = 0):
+        """Run one API request on a pooled client (or the service's own, when injected)"""
+        # Batch requests take no num_retries
+        options = {'num_retries': retries} if retries else {}
+        if self.http_pool is None:
+            return request.execute(**options)
+        with self.http_pool.client() as http:
+            return request.execute(http=http, **options)
+    
+    def _publish_write(self):
+        """After a write: drop free/busy results and day listings and mark other workers' caches stale"""
+        self.free_busy_cache.clear()
+        self.day_listings.clear()
+        store = get_store()
+        if store.shared:
+            generation = store.incr(CACHE_GENERATION_KEY)
+            if generation != self.cache_generation + 1:
+                # Someone else wrote since we last looked
+                self._invalidate_local()
+            self.cache_generation = generation
+    
+    def _refresh_shared_cache(self):
+        """Invalidate local caches if another worker has written since we last looked"""
+        store = get_store()
+        if not store.shared:
+            return
+        generation = int(store.get(CACHE_GENERATION_KEY) or 0)
+        if generation != self.cache_generation:
+            self._invalidate_local()
+            self.cache_generation = generation
+    
+    def _invalidate_local(self):
+        self.cache.invalidate()
+        self.series_cache.clear()
+        self.free_busy_cache.clear()
+        self.day_listings.clear()
+        self.last_sync = None
     
     def create_event(self, 
                     summary: str, 
@@ -58,9 +211,13 @@ class GoogleCalendarService:
                     end_time: datetime,
                     description: str = None,
                     location: str = None,
-                    attendees: List[str] = None) -> Dict:
+                    attendees: List[str] = None,
+                    event_id: str = None) -> Dict:
         """
-        Create a new calendar event
+        Create a new calendar event. With `event_id` (base32hex, chosen by
+        the caller) creating it again is a no-op that returns the existing
+        event, so such inserts are retried and bounded by the deadline
+        like reads.
         """
         event = {
             'summary': summary,
@@ -83,19 +240,188 @@ class GoogleCalendarService:
         if attendees:
             event['attendees'] = [{'email': email} for email in attendees]
         
+        if event_id:
+            event['id'] = event_id
+        
         try:
-            event = self.service.events().insert(
+            request = self.service.events().insert(
                 calendarId='primary', 
-                body=event
-            ).execute()
+                body=event,
+                fields=CREATED_MASK
+            )
+            try:
+                if event_id:
+                    event = self._execute(request, 'events.insert', retries=config.CALENDAR_WRITE_RETRIES)
+                else:
+                    event = self._execute(request, 'events.insert', idempotent=False)
+            except HttpError as error:
+                if not event_id or error.resp.status != 409:
+                    raise
+                # Created before (a retry whose answer was lost, a redelivered update)
+                DUPLICATE_INSERTS.inc()
+                event = self._execute(self.service.events().get(
+                    calendarId='primary',
+                    eventId=event_id,
+                    fields=CREATED_MASK
+                ), 'events.get')
+            self.cache.put('primary', compact_event(event))
+            self._publish_write()
             return event
         except HttpError as error:
             raise Exception(f'An error occurred: {error}')
     
+    def _list_pages(self, calendar_id: str, time_min: datetime, time_max: datetime,
+                    max_results: int = LIST_PAGE_SIZE, fields: str = LIST_MASK, **params) -> Iterator[Dict]:
+        """Responses of an events.list query, page by page"""
+        page_token = None
+        while True:
+            result = self._execute(self.service.events().list(
+                calendarId=calendar_id,
+                timeMin=time_min.isoformat(),
+                timeMax=time_max.isoformat(),
+                maxResults=max_results,
+                pageToken=page_token,
+                fields=fields,
+                **params
+            ), 'events.list')
+            yield result
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+    
+    def _list_items(self, calendar_id: str, time_min: datetime, time_max: datetime,
+                    max_results: int = LIST_PAGE_SIZE, all_pages: bool = True, **params) -> tuple:
+        """
+        Items of an events.list query, compacted and tagged with the calendar
+        id, and whether they are all of them (only the first page is fetched
+        unless `all_pages`)
+        """
+        items = []
+        for result in self._list_pages(calendar_id, time_min, time_max, max_results, **params):
+            for item in result.get('items', []):
+                event = compact_event(item)
+                event['calendarId'] = calendar_id
+                if 'recurrence' in item and 'iCalUID' in item:
+                    event['iCalUID'] = item['iCalUID']
+                items.append(event)
+            if not all_pages:
+                return items, 'nextPageToken' not in result
+        return items, True
+    
+    def _series_exceptions(self, calendar_id: str, masters: List[Dict]) -> Dict[str, FrozenSet]:
+        """
+        Recurring event id -> original starts of its occurrences that have an
+        exception, wherever they were moved to: from the series cache, the
+        rest listed by iCalUID (the whole series, cancelled occurrences
+        included) in batch requests of SERIES_BATCH_SIZE. Raises UnsupportedRecurrence when a
+        series cannot be listed that way, so the window is left to the server.
+        """
+        known, missing = {}, []
+        for master in masters:
+            keys = self.series_cache.get(calendar_id, master['id'])
+            if keys is None:
+                missing.append(master)
+            else:
+                known[master['id']] = keys
+        record_cache('series', not missing)
+        if not missing:
+            return known
+        
+        fetched = {master['id']: set() for master in missing}
+        failures = []
+        
+        def answered(request_id, response, exception):
+            if exception is not None or response.get('nextPageToken'):
+                failures.append(exception or f"more than {LIST_PAGE_SIZE} exceptions")
+                return
+            for item in response.get('items', []):
+                if item.get('recurringEventId') == request_id and item.get('originalStartTime'):
+                    fetched[request_id].add(original_key(item['originalStartTime']))
+        
+        for first in range(0, len(missing), SERIES_BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=answered)
+            for master in missing[first:first + SERIES_BATCH_SIZE]:
+                if not master.get('iCalUID'):
+                    raise UnsupportedRecurrence(f"series {master['id']} has no iCalUID")
+                batch.add(self.service.events().list(
+                    calendarId=calendar_id,
+                    iCalUID=master['iCalUID'],
+                    showDeleted=True,
+                    maxResults=LIST_PAGE_SIZE,
+                    fields=SERIES_MASK
+                ), request_id=master['id'])
+            self._execute(batch, 'events.list_series')
+        if failures:
+            raise UnsupportedRecurrence(f"exceptions of {len(failures)} series unavailable: {failures[0]}")
+        
+        for series_id, keys in fetched.items():
+            known[series_id] = frozenset(keys)
+            self.series_cache.put(calendar_id, series_id, known[series_id])
+        return known
+    
+    def _expand_series(self, calendar_id: str, items: List[Dict],
+                       time_min: datetime, time_max: datetime) -> List[Dict]:
+        """
+        Turn a singleEvents=False listing into what singleEvents=True returns:
+        recurring events are expanded here, minus their occurrences that have
+        an exception (in this window or not, see _series_exceptions), and the
+        exceptions inside the window (unless cancelled) take their place.
+        """
+        events, series, seen = [], [], {}
+        for event in items:
+            if event.get('recurrence'):
+                if event.get('status') != 'cancelled':
+                    series.append(event)
+                continue
+            if event.get('recurringEventId') and event.get('originalStartTime'):
+                key = original_key(event['originalStartTime'])
+                seen.setdefault(event['recurringEventId'], set()).add(key)
+                self.series_cache.add(calendar_id, event['recurringEventId'], key)
+            if event.get('status') != 'cancelled':
+                events.append(event)
+        
+        exceptions = self._series_exceptions(calendar_id, series) if series else {}
+        for master in series:
+            skip = exceptions[master['id']] | seen.get(master['id'], frozenset())
+            events.extend(expand(master, time_min, time_max, skip=skip))
+        events.sort(key=_start_key)
+        return events
+    
+    def _fetch_events(self, calendar_id: str, time_min: datetime, time_max: datetime,
+                      max_results: int = None) -> tuple:
+        """
+        Events of a calendar in [time_min, time_max) ordered by start, and
+        whether they are all of them. Recurring events come over the wire
+        once, as their rule, and are expanded locally instead of instance by
+        instance (singleEvents=True), which for a daily meeting is one item
+        instead of one per day. Without singleEvents the API cannot order by
+        start, so a capped listing (`max_results`) only takes the rules when
+        the window fits in one page; otherwise, and for rules or series
+        utils.recurrence cannot expand exactly, the server expands them and
+        only the first `max_results` (default: all pages) are fetched.
+        Does not touch the event cache, so it can run on the fan-out threads.
+        """
+        try:
+            try:
+                items, complete = self._list_items(calendar_id, time_min, time_max,
+                                                   all_pages=max_results is None, singleEvents=False)
+                if complete:
+                    return self._expand_series(calendar_id, items, time_min, time_max), True
+            except UnsupportedRecurrence as error:
+                logger.info(f"Calendar {calendar_id}: recurring events expanded by the server ({error})")
+                RECURRENCE_FALLBACKS.inc()
+            return self._list_items(calendar_id, time_min, time_max,
+                                    max_results=max_results or LIST_PAGE_SIZE,
+                                    all_pages=max_results is None,
+                                    singleEvents=True, orderBy='startTime')
+        except HttpError as error:
+            raise Exception(f'An error occurred: {error}')
+    
     def list_events(self, 
                    time_min: datetime = None, 
                    time_max: datetime = None,
-                   max_results: int = 10) -> List[Dict]:
+                   max_results: int = 10,
+                   calendar_id: str = 'primary') -> List[Dict]:
         """
         List calendar events within a time range
         """
@@ -105,37 +431,177 @@ class GoogleCalendarService:
         if not time_max:
             time_max = time_min + timedelta(days=1)
         
+        events, complete = self._fetch_events(calendar_id, time_min, time_max, max_results)
+        self.cache.store_window(calendar_id, time_min, time_max, events, complete=complete)
+        return events[:max_results]
+    
+    def list_events_merged(self,
+                           calendar_ids: List[str],
+                           time_min: datetime,
+                           time_max: datetime,
+                           max_results: int = 10) -> List[Dict]:
+        """
+        Events of several calendars as one list ordered by start. The
+        calendars are fetched concurrently, so N calendars cost about one
+        round trip, and their start-ordered pages are k-way merged. A
+        calendar that fails is left out (logged) unless all of them fail.
+        """
+        if len(calendar_ids) == 1:
+            return self.list_events(time_min, time_max, max_results, calendar_ids[0])
+        
+        streams = [events for events, _ in self._fetch_calendars(calendar_ids, time_min, time_max,
+                                                                 max_results).values()]
+        return list(itertools.islice(heapq.merge(*streams, key=_start_key), max_results))
+    
+    def _fetch_calendars(self, calendar_ids: List[str], time_min: datetime, time_max: datetime,
+                         max_results: int = None) -> Dict[str, tuple]:
+        """
+        calendar id -> (events, complete) of several calendars, fetched on the
+        fan-out threads and cached. Calendars that fail are left out (logged)
+        unless all of them fail.
+        """
+        futures = [
+            # Each thread runs in a copy of this context, so its calls stay in the current trace
+            self.fanout.submit(contextvars.copy_context().run, self._fetch_events,
+                               calendar_id, time_min, time_max, max_results)
+            for calendar_id in calendar_ids
+        ]
+        results, errors = {}, []
+        for calendar_id, future in zip(calendar_ids, futures):
+            try:
+                events, complete = future.result()
+            except Exception as error:
+                logger.warning(f"Could not list events of calendar {calendar_id}: {error}")
+                errors.append(error)
+                continue
+            # Cached as each result comes in (the cache locks itself)
+            self.cache.store_window(calendar_id, time_min, time_max, events, complete=complete)
+            results[calendar_id] = (events, complete)
+        if not results and errors:
+            raise errors[0]
+        return results
+    
+    def list_calendars(self) -> List[Dict]:
+        """
+        Calendars of the account as {'id', 'summary', 'primary'}, primary
+        first (under the id 'primary', like every other call here), cached
+        for EVENT_CACHE_TTL seconds.
+        """
+        cached = self.calendar_list
+        hit = bool(cached) and time.monotonic() - cached[0] <= config.EVENT_CACHE_TTL
+        record_cache('calendar_list', hit)
+        if hit:
+            return cached[1]
+        
+        calendars = []
+        page_token = None
         try:
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=time_min.isoformat(),
-                timeMax=time_max.isoformat(),
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            
-            events = events_result.get('items', [])
-            return events
+            while True:
+                result = self._execute(self.service.calendarList().list(
+                    pageToken=page_token,
+                    fields=CALENDAR_LIST_MASK
+                ), 'calendarList.list')
+                for item in result.get('items', []):
+                    primary = bool(item.get('primary'))
+                    calendars.append({
+                        'id': 'primary' if primary else item['id'],
+                        'summary': item.get('summaryOverride') or item.get('summary') or item['id'],
+                        'primary': primary,
+                    })
+                page_token = result.get('nextPageToken')
+                if not page_token:
+                    break
         except HttpError as error:
             raise Exception(f'An error occurred: {error}')
+        
+        calendars.sort(key=lambda calendar: (not calendar['primary'], calendar['summary'].lower()))
+        self.calendar_list = (time.monotonic(), calendars)
+        return calendars
     
-    def get_todays_events(self) -> List[Dict]:
-        """Get all events for today"""
-        now = datetime.now(config.TIMEZONE)
-        start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day = start_of_day + timedelta(days=1)
+    def get_todays_events(self, calendar_ids: List[str] = None) -> List[Dict]:
+        """Get all events for today, merged across `calendar_ids` (default: primary)"""
+        return self.get_day_events(datetime.now(config.TIMEZONE).date(), calendar_ids)
+    
+    @staticmethod
+    def _day_range(day: date) -> Tuple[datetime, datetime]:
+        start = config.TIMEZONE.localize(datetime(day.year, day.month, day.day))
+        return start, start + timedelta(days=1)
+    
+    def fetch_day(self, calendar_id: str, day: date) -> tuple:
+        """
+        Every event of one local day of a calendar and whether the listing is
+        complete; like _fetch_events it does not touch the caches, so it can
+        run off the event loop. Hand the result to store_day.
+        """
+        return self._fetch_events(calendar_id, *self._day_range(day))
+    
+    def store_day(self, calendar_id: str, day: date, events: List[Dict], complete: bool = True):
+        """Cache a fetch_day result (the event cache, and the day listing when complete)"""
+        self.cache.store_window(calendar_id, *self._day_range(day), events, complete=complete)
+        if complete:
+            self.day_listings[(calendar_id, day)] = (time.monotonic(), events)
+    
+    def cached_day(self, calendar_id: str, day: date, max_age: float = None) -> Optional[List[Dict]]:
+        """A calendar's day listed at most `max_age` seconds ago (default EVENT_CACHE_TTL), or None"""
+        cached = self.day_listings.get((calendar_id, day))
+        max_age = config.EVENT_CACHE_TTL if max_age is None else max_age
+        if cached and time.monotonic() - cached[0] <= max_age:
+            return cached[1]
+        return None
+    
+    def get_day_events(self, day: date, calendar_ids: List[str] = None,
+                       max_results: int = 10, max_age: float = None) -> List[Dict]:
+        """
+        Events of one local day merged across `calendar_ids` (default:
+        primary). A calendar's day listed in the last `max_age` seconds
+        (default EVENT_CACHE_TTL; writes drop the listings) is not fetched
+        again, so everyone opening today's view in the morning costs one
+        events.list per calendar per TTL, and the daily digest's prefetched
+        listings are reused.
+        """
+        calendar_ids = calendar_ids or ['primary']
+        self._refresh_shared_cache()
+        streams, missing = [], []
+        for calendar_id in calendar_ids:
+            events = self.cached_day(calendar_id, day, max_age)
+            if events is None:
+                missing.append(calendar_id)
+            else:
+                streams.append(events)
+        record_cache('day_listing', not missing)
+        
+        if len(missing) == 1:
+            try:
+                events, complete = self.fetch_day(missing[0], day)
+            except Exception as error:
+                if not streams:
+                    raise
+                logger.warning(f"Could not list events of calendar {missing[0]}: {error}")
+            else:
+                self.store_day(missing[0], day, events, complete)
+                streams.append(events)
+        elif missing:
+            try:
+                fetched = self._fetch_calendars(missing, *self._day_range(day))
+            except Exception:
+                if not streams:
+                    raise
+                fetched = {}
+            for calendar_id, (events, complete) in fetched.items():
+                if complete:
+                    self.day_listings[(calendar_id, day)] = (time.monotonic(), events)
+                streams.append(events)
         
-        return self.list_events(start_of_day, end_of_day)
+        return list(itertools.islice(heapq.merge(*streams, key=_start_key), max_results))
     
-    def get_week_events(self) -> List[Dict]:
-        """Get all events for this week"""
+    def get_week_events(self, calendar_ids: List[str] = None) -> List[Dict]:
+        """Get all events for this week, merged across `calendar_ids` (default: primary)"""
         now = datetime.now(config.TIMEZONE)
         start_of_week = now - timedelta(days=now.weekday())
         start_of_week = start_of_week.replace(hour=0, minute=0, second=0, microsecond=0)
         end_of_week = start_of_week + timedelta(days=7)
         
-        return self.list_events(start_of_week, end_of_week, max_results=50)
+        return self.list_events_merged(calendar_ids or ['primary'], start_of_week, end_of_week, max_results=50)
     
     def update_event(self, 
                     event_id: str,
@@ -145,77 +611,244 @@ class GoogleCalendarService:
                     description: str = None,
                     location: str = None) -> Dict:
         """
-        Update an existing calendar event
+        Update an existing calendar event. Only the given fields are sent
+        (a patch), so the event is not fetched first.
         """
+        changes = {}
+        if summary:
+            changes['summary'] = summary
+        
+        if start_time:
+            changes['start'] = {
+                'dateTime': start_time.isoformat(),
+                'timeZone': config.TIMEZONE_STR,
+            }
+        
+        if end_time:
+            changes['end'] = {
+                'dateTime': end_time.isoformat(),
+                'timeZone': config.TIMEZONE_STR,
+            }
+        
+        if description is not None:
+            changes['description'] = description
+        
+        if location is not None:
+            changes['location'] = location
+        
         try:
-            # First, get the existing event
-            event = self.service.events().get(
-                calendarId='primary', 
-                eventId=event_id
-            ).execute()
-            
-            # Update fields if provided
-            if summary:
-                event['summary'] = summary
-            
-            if start_time:
-                event['start'] = {
-                    'dateTime': start_time.isoformat(),
-                    'timeZone': config.TIMEZONE_STR,
-                }
-            
-            if end_time:
-                event['end'] = {
-                    'dateTime': end_time.isoformat(),
-                    'timeZone': config.TIMEZONE_STR,
-                }
-            
-            if description is not None:
-                event['description'] = description
-            
-            if location is not None:
-                event['location'] = location
-            
-            # Update the event
-            updated_event = self.service.events().update(
+            updated_event = compact_event(self._execute(self.service.events().patch(
                 calendarId='primary',
                 eventId=event_id,
-                body=event
-            ).execute()
+                body=changes,
+                fields=EVENT_MASK
+            ), 'events.patch', idempotent=False))
+            self.cache.put('primary', updated_event)
+            if updated_event.get('recurringEventId') and updated_event.get('originalStartTime'):
+                # An occurrence moved by the bot is not expanded at its old time either
+                self.series_cache.add('primary', updated_event['recurringEventId'],
+                                      original_key(updated_event['originalStartTime']))
+            self._publish_write()
             
             return updated_event
         except HttpError as error:
             raise Exception(f'An error occurred: {error}')
     
-    def delete_event(self, event_id: str) -> bool:
+    def delete_event(self, event_id: str, calendar_id: str = 'primary') -> bool:
         """
         Delete a calendar event
         """
         try:
-            self.service.events().delete(
-                calendarId='primary',
+            self._execute(self.service.events().delete(
+                calendarId=calendar_id,
                 eventId=event_id
-            ).execute()
+            ), 'events.delete', idempotent=False)
+            self.cache.discard(calendar_id, event_id)
+            self._publish_write()
             return True
         except HttpError as error:
             raise Exception(f'An error occurred: {error}')
     
-    def search_events(self, query: str, max_results: int = 10) -> List[Dict]:
+    def export_events(self, time_min: datetime, time_max: datetime,
+                      calendar_id: str = 'primary') -> Iterator[Dict]:
         """
-        Search for events by text query
+        Events of a calendar in [time_min, time_max) for an iCalendar export,
+        streamed page by page: recurring events once, as their rule, followed
+        by their moved or cancelled occurrences. Does not touch the event
+        cache, so it can run on a worker thread.
         """
         try:
-            now = datetime.now(config.TIMEZONE)
-            events_result = self.service.events().list(
-                calendarId='primary',
-                timeMin=now.isoformat(),
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime',
-                q=query
-            ).execute()
+            for result in self._list_pages(calendar_id, time_min, time_max, fields=EXPORT_MASK,
+                                           singleEvents=False):
+                yield from result.get('items', [])
+        except HttpError as error:
+            raise Exception(f'An error occurred: {error}')
+    
+    def import_events(self, events: List[Dict], calendar_id: str = 'primary') -> List[Optional[Exception]]:
+        """
+        Import events (API bodies with an iCalUID, see utils.ics) with one
+        batch request, and return each one's error or None. events.import
+        matches events by iCalUID, so importing a file again does not create
+        duplicates. Calls refused for load (rate limits, 5xx) are sent again
+        after a backoff, up to config.ICS_IMPORT_RETRIES times. Does not
+        touch the event cache, so it can run on a worker thread; call
+        imported() when the import is done.
+        """
+        errors: List[Optional[Exception]] = [None] * len(events)
+        pending = list(range(len(events)))
+        for attempt in range(config.ICS_IMPORT_RETRIES + 1):
+            if attempt:
+                time.sleep(2 ** attempt * random.uniform(0.5, 1.0))
+            
+            def answered(request_id, response, exception):
+                errors[int(request_id)] = exception
             
-            events = events_result.get('items', [])
-            return events
+            batch = self.service.new_batch_http_request(callback=answered)
+            for index in pending:
+                batch.add(self.service.events().import_(
+                    calendarId=calendar_id,
+                    body=events[index],
+                    fields='id'
+                ), request_id=str(index))
+            try:
+                # Not abandoned at the deadline: a batch takes as long as its slowest call
+                self._execute(batch, 'events.import', idempotent=False)
+            except HttpError as error:
+                raise Exception(f'An error occurred: {error}')
+            pending = [index for index in pending if _is_throttled(errors[index])]
+            if not pending:
+                break
+        
+        failed = sum(error is not None for error in errors)
+        IMPORTED_EVENTS.inc(len(events) - failed, result='imported')
+        IMPORTED_EVENTS.inc(failed, result='failed')
+        return errors
+    
+    def imported(self):
+        """After an import: the cached views and search index no longer match the calendar"""
+        self._invalidate_local()
+        self._publish_write()
+    
+    def find_conflicts(self, start_time: datetime, end_time: datetime) -> List[Dict]:
+        """
+        Busy events overlapping [start_time, end_time), answered from the
+        event cache. Days not cached yet are fetched in one list call.
+        """
+        self._refresh_shared_cache()
+        missing = self.cache.missing_ranges('primary', start_time, end_time)
+        record_cache('events', not missing)
+        for range_start, range_end in missing:
+            self.list_events(range_start, range_end, max_results=250)
+        
+        return self.cache.overlapping('primary', start_time, end_time)
+    
+    def suggest_free_slot(self, start_time: datetime, end_time: datetime) -> Optional[tuple]:
+        """
+        Nearest free (start, end) slot of the same length on the same day,
+        within active hours and not in the past. Call find_conflicts first
+        so the day is cached.
+        """
+        duration = end_time - start_time
+        day = start_time.astimezone(config.TIMEZONE).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        not_before = max(
+            day + timedelta(hours=config.ACTIVE_HOURS_START),
+            datetime.now(config.TIMEZONE)
+        )
+        not_after = day + timedelta(hours=config.ACTIVE_HOURS_END)
+        
+        slot = self.cache.nearest_free_slot('primary', start_time, duration, not_before, not_after)
+        if slot is None:
+            return None
+        return slot, slot + duration
+    
+    def get_busy_intervals(self, day: datetime, calendar_ids: List[str] = None) -> List[tuple]:
+        """
+        Busy (start, end) intervals of one local day across several calendars,
+        fetched with a single freebusy.query call and cached per day.
+        """
+        calendar_ids = calendar_ids or config.FREE_BUSY_CALENDARS
+        day_start = day.astimezone(config.TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        day_end = day_start + timedelta(days=1)
+        cache_key = (day_start.date(), tuple(sorted(calendar_ids)))
+        
+        self._refresh_shared_cache()
+        cached = self.free_busy_cache.get(cache_key)
+        hit = bool(cached) and time.monotonic() - cached[0] <= config.EVENT_CACHE_TTL
+        record_cache('free_busy', hit)
+        if hit:
+            return cached[1]
+        
+        try:
+            result = self._execute(self.service.freebusy().query(body={
+                'timeMin': day_start.isoformat(),
+                'timeMax': day_end.isoformat(),
+                'timeZone': config.TIMEZONE_STR,
+                'items': [{'id': calendar_id} for calendar_id in calendar_ids]
+            }), 'freebusy.query')
         except HttpError as error:
-            raise Exception(f'An error occurred: {error}')
\ No newline at end of file
+            raise Exception(f'An error occurred: {error}')
+        
+        busy = []
+        for calendar_id, info in result.get('calendars', {}).items():
+            if info.get('errors'):
+                raise Exception(f"An error occurred for calendar {calendar_id}: {info['errors']}")
+            for period in info.get('busy', []):
+                busy.append((
+                    datetime.fromisoformat(period['start'].replace('Z', '+00:00')).astimezone(config.TIMEZONE),
+                    datetime.fromisoformat(period['end'].replace('Z', '+00:00')).astimezone(config.TIMEZONE)
+                ))
+        
+        self.free_busy_cache[cache_key] = (time.monotonic(), busy)
+        return busy
+    
+    def get_free_slots(self,
+                       day: datetime,
+                       calendar_ids: List[str] = None,
+                       min_minutes: int = None) -> List[tuple]:
+        """
+        Free (start, end) slots of one day within active hours, computed
+        locally from freebusy data. Past time today is never offered.
+        """
+        if min_minutes is None:
+            min_minutes = config.FREE_SLOT_MIN_MINUTES
+        
+        day_start = day.astimezone(config.TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        window_start = day_start + timedelta(hours=config.ACTIVE_HOURS_START)
+        window_end = day_start + timedelta(hours=config.ACTIVE_HOURS_END)
+        
+        now = datetime.now(config.TIMEZONE).replace(second=0, microsecond=0)
+        window_start = max(window_start, now)
+        if window_start >= window_end:
+            return []
+        
+        busy = self.get_busy_intervals(day_start, calendar_ids)
+        return sweep_free_slots(busy, window_start, window_end, timedelta(minutes=min_minutes))
+    
+    def sync_events(self) -> int:
+        """
+        Pull every event in the search window (paged) into the local cache
+        and search index. Returns the number of events synced.
+        """
+        now = datetime.now(config.TIMEZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+        time_min = now - timedelta(days=config.SEARCH_SYNC_PAST_DAYS)
+        time_max = now + timedelta(days=config.SEARCH_SYNC_FUTURE_DAYS)
+        
+        events, complete = self._fetch_events('primary', time_min, time_max)
+        self.cache.store_window('primary', time_min, time_max, events, complete=complete)
+        self.last_sync = time.monotonic()
+        return len(events)
+    
+    def search_events(self, query: str, max_results: int = 10) -> List[Dict]:
+        """
+        Search for events by text query against the local index.
+        The index is (re)synced at most every SEARCH_SYNC_TTL seconds.
+        """
+        self._refresh_shared_cache()
+        stale = self.last_sync is None or time.monotonic() - self.last_sync > config.SEARCH_SYNC_TTL
+        record_cache('search_index', not stale)
+        if stale:
+            self.sync_events()
+        
+        return self.cache.search(query, max_results)
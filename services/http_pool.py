@@ -0,0 +1,118 @@
+"""
+HTTP Pool
+Keep-alive, authorized httplib2 clients for googleapiclient, one per concurrent call
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import google_auth_httplib2
+from googleapiclient.http import build_http
+from utils.metrics import counter, gauge, histogram
+
+POOL_REQUESTS = counter(
+    'bot_http_pool_requests_total', 'Requests sent through a pooled client, by whether a live '
+    'keep-alive connection was reused', ('pool', 'connection'))
+POOL_CLIENTS = gauge(
+    'bot_http_pool_clients', 'Clients (each with its own connections) created by a pool', ('pool',))
+POOL_IN_USE = gauge(
+    'bot_http_pool_in_use', 'Pooled clients currently checked out', ('pool',))
+POOL_WAIT = histogram(
+    'bot_http_pool_wait_seconds', 'Time spent waiting for a free pooled client', ('pool',),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+
+
+class PooledHttp(google_auth_httplib2.AuthorizedHttp):
+    """AuthorizedHttp that records connection reuse and sets the gzip headers"""
+
+    def __init__(self, credentials, http, pool_name: str, gzip: bool):
+        super().__init__(credentials, http=http)
+        self.pool_name = pool_name
+        self.gzip = gzip
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        headers = dict(headers or {})
+        agent = headers.get('user-agent', '')
+        if self.gzip:
+            # Google APIs only compress responses for clients that say "gzip" in both
+            headers['accept-encoding'] = 'gzip, deflate'
+            if 'gzip' not in agent:
+                headers['user-agent'] = f"{agent} (gzip)".strip()
+        else:
+            headers['accept-encoding'] = 'identity'
+            agent = agent.replace('(gzip)', '').strip()
+            if agent:
+                headers['user-agent'] = agent
+            else:
+                headers.pop('user-agent', None)
+
+        # Same key httplib2 keeps the connection under
+        parts = urlsplit(uri)
+        connection = self.http.connections.get(f"{parts.scheme}:{parts.netloc}")
+        reused = connection is not None and getattr(connection, 'sock', None) is not None
+        POOL_REQUESTS.inc(pool=self.pool_name, connection='reused' if reused else 'new')
+        return super().request(uri, method, body=body, headers=headers, **kwargs)
+
+
+class HttpPool:
+    def __init__(self, credentials, size: int = 4, timeout: float = None, gzip: bool = True,
+                 name: str = 'calendar'):
+        """
+        Up to `size` authorized clients sharing `credentials`. A client is
+        checked out for one request at a time, so httplib2 (not thread-safe)
+        never sees two threads, and its keep-alive connections are reused by
+        the next request instead of paying a new TLS handshake. `timeout` is
+        the socket timeout of each client.
+        """
+        self.credentials = credentials
+        self.size = size
+        self.timeout = timeout
+        self.gzip = gzip
+        self.name = name
+        # LIFO: the most recently returned client is the one whose connection is still open
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+
+    def _new_client(self) -> PooledHttp:
+        http = build_http()
+        if self.timeout is not None:
+            http.timeout = self.timeout
+        with self._lock:
+            self._created += 1
+            POOL_CLIENTS.set(self._created, pool=self.name)
+        return PooledHttp(self.credentials, http, self.name, self.gzip)
+
+    def _count_in_use(self, delta: int):
+        with self._lock:
+            self._in_use += delta
+            POOL_IN_USE.set(self._in_use, pool=self.name)
+
+    @contextmanager
+    def client(self):
+        """Check out a client for one request (blocks while all `size` are busy)"""
+        started = time.perf_counter()
+        self._slots.acquire()
+        POOL_WAIT.observe(time.perf_counter() - started, pool=self.name)
+        try:
+            http = self._idle.get_nowait()
+        except queue.Empty:
+            http = self._new_client()
+        self._count_in_use(1)
+        try:
+            yield http
+        finally:
+            self._count_in_use(-1)
+            self._idle.put(http)
+            self._slots.release()
+
+    def close(self):
+        """Close the idle clients' connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
@@ -0,0 +1,434 @@
+"""
+State Store
+Key-value backends (in-process or Redis protocol) for state shared between bot workers
+"""
+import hashlib
+import json
+import socket
+import threading
+import time
+import weakref
+from collections.abc import MutableMapping
+from datetime import date, datetime
+from typing import Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+import config
+
+
+class StateStoreError(Exception):
+    pass
+
+
+class MemoryStore:
+    """Process-local store; the default for a single bot process"""
+    shared = False
+
+    def __init__(self):
+        self._data: Dict[str, object] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: bytes, ttl: int = None):
+        with self._lock:
+            self._data[key] = value
+            if ttl:
+                self._expires[key] = time.monotonic() + ttl
+            else:
+                self._expires.pop(key, None)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._live(key) or 0) + 1
+            self._data[key] = str(value).encode()
+            return value
+
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        with self._lock:
+            return dict(self._live(key) or {})
+
+    def hset(self, key: str, field: str, value: bytes):
+        with self._lock:
+            self._data.setdefault(key, {})[field] = value
+
+    def hdel(self, key: str, field: str):
+        with self._lock:
+            self._data.get(key, {}).pop(field, None)
+
+    def close(self):
+        pass
+
+
+class RedisStore:
+    """Minimal Redis (RESP2) client for the handful of commands the bot needs"""
+    shared = True
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', self.db)
+
+    def _disconnect(self):
+        try:
+            if self._sock:
+                self._sock.close()
+        finally:
+            self._sock = None
+            self._reader = None
+
+    @staticmethod
+    def _encode(args) -> bytes:
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise StateStoreError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise StateStoreError(f'Unexpected reply: {line!r}')
+
+    def _call(self, *args):
+        self._sock.sendall(self._encode(args))
+        return self._read()
+
+    def execute(self, *args):
+        """Run one command, reconnecting once if the connection dropped"""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (ConnectionError, OSError) as e:
+                    self._disconnect()
+                    if attempt == 2:
+                        raise StateStoreError(f'Redis at {self.host}:{self.port} unavailable: {e}')
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.execute('GET', key)
+
+    def set(self, key: str, value: bytes, ttl: int = None):
+        if ttl:
+            self.execute('SET', key, value, 'EX', ttl)
+        else:
+            self.execute('SET', key, value)
+
+    def delete(self, key: str):
+        self.execute('DEL', key)
+
+    def incr(self, key: str) -> int:
+        return self.execute('INCR', key)
+
+    def hgetall(self, key: str) -> Dict[str, bytes]:
+        items = self.execute('HGETALL', key) or []
+        return {items[i].decode(): items[i + 1] for i in range(0, len(items), 2)}
+
+    def hset(self, key: str, field: str, value: bytes):
+        self.execute('HSET', key, field, value)
+
+    def hdel(self, key: str, field: str):
+        self.execute('HDEL', key, field)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+
+
+def create_store(url: str):
+    """memory:// or redis://[:password@]host:port/db"""
+    scheme = urlparse(url).scheme
+    if scheme in ('', 'memory'):
+        return MemoryStore()
+    if scheme == 'redis':
+        return RedisStore(url)
+    raise ValueError(f"Unsupported STATE_BACKEND_URL scheme: {scheme}")
+
+
+_store = None
+_maps = []  # weakrefs to every StateMap in this process
+
+# Seconds between sweeps of idle entries out of a StateMap's local cache
+PRUNE_INTERVAL = 60
+# With a shared store, local copies unused this long are dropped (the store keeps them)
+LOCAL_IDLE = 900
+
+
+def get_store():
+    """Process-wide store built from config.STATE_BACKEND_URL"""
+    global _store
+    if _store is None:
+        _store = create_store(config.STATE_BACKEND_URL)
+    return _store
+
+
+def _encode(value):
+    """json.dumps default: datetimes and dates as tagged ISO strings"""
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f"{type(value).__name__} cannot be stored in a StateMap")
+
+
+def _decode(obj: Dict):
+    """json.loads object_hook, the inverse of _encode"""
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        if '__date__' in obj:
+            return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, default=_encode, separators=(',', ':')).encode('utf-8')
+
+
+def loads(data: bytes):
+    return json.loads(data, object_hook=_decode)
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class StateMap(MutableMapping):
+    def __init__(self, namespace: str, ttl: int = None):
+        """
+        Dict-like per-user state. Entries are cached in process memory; with
+        a shared store, misses are loaded from it and entries used since the
+        last flush are written back when their JSON differs from what the
+        store has. Values are stored as JSON, so they must be dicts, lists
+        and primitives (datetimes and dates are tagged); tuples come back as
+        lists. Entries unused for `ttl` seconds (LOCAL_IDLE for local copies
+        of shared entries) are dropped. Keys are kept as str, the way the
+        store sees them, so a user id may be given as int or str. Iteration
+        only sees local entries. Handlers use it on the event loop while
+        load() and write() run on executor threads; `_lock` guards the
+        bookkeeping both sides share.
+        """
+        self.namespace = namespace
+        self.ttl = config.STATE_TTL if ttl is None else ttl
+        self._local: Dict[str, object] = {}
+        self._touched: Dict[str, float] = {}
+        self._pruned_at = time.monotonic()
+        self._absent = set()
+        # Keys used since the last changes(): values are mutated in place, so any read may be a write
+        self._used = set()
+        self._deleted = set()
+        # key -> digest of the JSON the store holds, as last loaded or written
+        self._stored: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+        _maps.append(weakref.ref(self))
+
+    def _key(self, key: Hashable) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _prune(self, now: float):
+        """Drop local entries unused for longer than they may live here (with _lock held)"""
+        self._pruned_at = now
+        shared = get_store().shared
+        idle = min(self.ttl, LOCAL_IDLE) if shared and self.ttl else LOCAL_IDLE if shared else self.ttl
+        self._absent.clear()
+        if not idle:
+            return
+        for key, touched in list(self._touched.items()):
+            if now - touched > idle and key not in self._used and key not in self._deleted:
+                self._local.pop(key, None)
+                self._stored.pop(key, None)
+                del self._touched[key]
+
+    def _touch(self, key):
+        """Mark `key` used now (with _lock held)"""
+        now = time.monotonic()
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            self._prune(now)
+        self._touched[key] = now
+        if get_store().shared:
+            self._used.add(key)
+
+    def __getitem__(self, key):
+        key = str(key)
+        with self._lock:
+            if key in self._local:
+                self._touch(key)
+                return self._local[key]
+            if not get_store().shared or key in self._absent:
+                raise KeyError(key)
+
+        data = get_store().get(self._key(key))
+        with self._lock:
+            if key in self._local:
+                # Set or loaded meanwhile; that value wins
+                self._touch(key)
+                return self._local[key]
+            if data is None:
+                self._absent.add(key)
+                raise KeyError(key)
+            value = self._local[key] = loads(data)
+            self._stored[key] = _digest(data)
+            self._touch(key)
+            return value
+
+    def __setitem__(self, key, value):
+        key = str(key)
+        with self._lock:
+            self._local[key] = value
+            self._touch(key)
+            self._absent.discard(key)
+            self._deleted.discard(key)
+
+    def __delitem__(self, key):
+        key = str(key)
+        if key not in self._local:
+            self[key]  # Load it, or raise KeyError
+        with self._lock:
+            del self._local[key]
+            self._touched.pop(key, None)
+            self._stored.pop(key, None)
+            self._used.discard(key)
+            if get_store().shared:
+                self._absent.add(key)
+                self._deleted.add(key)
+
+    def __iter__(self) -> Iterator:
+        return iter(list(self._local))
+
+    def __len__(self) -> int:
+        return len(self._local)
+
+    def load(self, keys: Iterable[Hashable]):
+        """
+        Load entries for `keys` from the shared store ahead of use, so
+        reads on the event loop hit the local cache (blocking; run it off
+        the loop)
+        """
+        store = get_store()
+        if not store.shared:
+            return
+        for key in set(map(str, keys)):
+            if key in self._local or key in self._absent:
+                continue
+            data = store.get(self._key(key))
+            with self._lock:
+                if key in self._local:
+                    # A handler set it meanwhile; that value wins
+                    continue
+                if data is None:
+                    self._absent.add(key)
+                else:
+                    self._local[key] = loads(data)
+                    self._stored[key] = _digest(data)
+                    self._touched[key] = time.monotonic()
+
+    def changes(self) -> Tuple[List[str], List[Tuple[str, bytes]]]:
+        """
+        Keys deleted and (key, JSON) of entries changed since the last
+        call. Serialises the values, so call it where handlers mutate them
+        (on the event loop); write() does the store I/O.
+        """
+        if not get_store().shared:
+            return [], []
+        with self._lock:
+            used, self._used = self._used, set()
+            deleted, self._deleted = list(self._deleted), set()
+            changed = []
+            for key in used:
+                if key in self._local:
+                    data = dumps(self._local[key])
+                    if self._stored.get(key) != _digest(data):
+                        changed.append((key, data))
+        return deleted, changed
+
+    def write(self, deleted: List[str], changed: List[Tuple[str, bytes]]):
+        """Apply changes() to the shared store (blocking; run it off the loop)"""
+        store = get_store()
+        for key in deleted:
+            store.delete(self._key(key))
+        for key, data in changed:
+            store.set(self._key(key), data, self.ttl)
+            with self._lock:
+                if key in self._local:
+                    self._stored[key] = _digest(data)
+
+    def flush(self):
+        """Write entries changed since the last flush back to the shared store (blocking)"""
+        self.write(*self.changes())
+
+
+def _live_maps():
+    for ref in list(_maps):
+        state_map = ref()
+        if state_map is None:
+            _maps.remove(ref)
+        else:
+            yield state_map
+
+
+def load_all(keys: Iterable[Hashable]):
+    """Load `keys` into every StateMap in this process (blocking)"""
+    keys = list(keys)
+    for state_map in _live_maps():
+        state_map.load(keys)
+
+
+def collect_changes() -> List[Tuple[StateMap, List[str], List[Tuple[str, bytes]]]]:
+    """changes() of every StateMap in this process (on the event loop)"""
+    return [(state_map,) + state_map.changes() for state_map in _live_maps()]
+
+
+def write_changes(changes: List[Tuple[StateMap, List[str], List[Tuple[str, bytes]]]]):
+    """Write collect_changes() to the shared store (blocking)"""
+    for state_map, deleted, changed in changes:
+        if deleted or changed:
+            state_map.write(deleted, changed)
@@ -0,0 +1,385 @@
+"""
+Write Queue
+Durable write-ahead log of calendar writes, replayed in the background while Calendar is unreachable
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from googleapiclient.errors import HttpError
+import config
+from utils.circuit_breaker import CircuitOpenError
+from utils.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+CREATE = 'create'
+UPDATE = 'update'
+DELETE = 'delete'
+
+# Once nothing is pending the log is emptied, when it has grown past this
+COMPACT_BYTES = 64 * 1024
+
+WRITES_PENDING = gauge(
+    'bot_write_queue_pending', 'Calendar writes logged and not applied yet')
+WRITES_DONE = counter(
+    'bot_write_queue_writes_total', 'Logged calendar writes by how they ended '
+    '(direct, replayed, failed, expired)', ('kind', 'result'))
+REPLAY_ATTEMPTS = counter(
+    'bot_write_queue_replay_attempts_total', 'Background attempts to apply a queued write', ('kind',))
+DUPLICATE_WRITES = counter(
+    'bot_write_queue_duplicates_total', 'Repeated creates answered without another Calendar insert '
+    '(recent: already created, pending: still queued)', ('caught',))
+
+# RFC 4648 base32 alphabet -> base32hex, the alphabet of Calendar event ids (0-9, a-v)
+_BASE32HEX = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ234567', '0123456789abcdefghijklmnopqrstuv')
+
+
+def event_id_for(*parts) -> str:
+    """
+    Client-chosen event id derived from what asked for the event: the same
+    parts always give the same id, so Calendar refuses a repeat (409)
+    instead of creating a duplicate
+    """
+    digest = hashlib.sha256('\x1f'.join(str(part) for part in parts).encode('utf-8')).digest()
+    # 160 bits -> 32 characters, no padding
+    return base64.b32encode(digest[:20]).decode('ascii').translate(_BASE32HEX)
+
+
+def _causes(error: BaseException):
+    """The error and what it was raised from (the service wraps HttpError in Exception)"""
+    while error is not None:
+        yield error
+        error = error.__cause__ or error.__context__
+
+
+def http_status(error: BaseException) -> Optional[int]:
+    """Status of the HttpError behind an error, if any"""
+    for cause in _causes(error):
+        if isinstance(cause, HttpError):
+            return cause.resp.status
+    return None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether a write that failed with `error` may succeed later as it is:
+    Calendar failing fast, overloaded or unreachable (not a 4xx answer)
+    """
+    # Only error types of the HTTP/auth libraries already loaded can have been raised
+    transport = [OSError, CircuitOpenError]
+    for module, name in (('httplib2', 'HttpLib2Error'), ('google.auth.exceptions', 'TransportError')):
+        if module in sys.modules:
+            transport.append(getattr(sys.modules[module], name))
+    for cause in _causes(error):
+        if isinstance(cause, HttpError):
+            return cause.resp.status >= 500 or cause.resp.status == 429
+        if isinstance(cause, tuple(transport)):
+            return True
+    return False
+
+
+def retry_delay(attempts: int, error: BaseException = None) -> float:
+    """Exponential backoff with jitter, never before an open circuit lets calls through"""
+    delay = min(config.WRITE_RETRY_MAX, config.WRITE_RETRY_MIN * 2 ** attempts) * random.uniform(0.5, 1.0)
+    for cause in _causes(error):
+        if isinstance(cause, CircuitOpenError):
+            delay = max(delay, cause.retry_in)
+    return delay
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class WriteQueue:
+    def __init__(self, path: str = None):
+        """
+        Pending writes (create, update, delete) as an append-only JSONL log:
+        an "add" line when a write is accepted, a "done" line once it has
+        been applied or given up. "add" lines are fsynced before add()
+        returns, so an accepted write survives a crash or restart; a lost
+        "done" line only means a write is replayed, which its deterministic
+        event id makes harmless. The file (default config.WRITE_QUEUE_FILE)
+        is read on first use and emptied when nothing is pending.
+        A write is claimed by whoever is applying it (the handler that
+        accepted it, or the replayer) until done() or release().
+        add() and done() do file I/O, so callers on the event loop run them
+        on a thread. `_file_lock` serialises the log file, `_lock` the
+        pending writes; release(), claim_due() and is_pending() only take
+        `_lock`, so they never wait for an fsync.
+        """
+        self.path = path
+        self._ops: Dict[str, Dict] = {}
+        self._attempts: Dict[str, int] = {}
+        self._next_try: Dict[str, float] = {}
+        self._claimed = set()
+        self._file = None
+        # Taken before _lock when both are needed
+        self._file_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    def open(self, path: str = None):
+        """Load the log at `path` and keep only its pending writes"""
+        with self._file_lock:
+            self._open(path)
+
+    def _open(self, path: str = None):
+        if self._file:
+            self._file.close()
+        self.path = path or self.path or config.WRITE_QUEUE_FILE
+        ops = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; nothing after it was acknowledged
+                        logger.warning(f"{self.path}:{number}: unreadable write log line skipped")
+                        continue
+                    if record['op'] == 'add':
+                        ops[record['id']] = record
+                    else:
+                        ops.pop(record['id'], None)
+        with self._lock:
+            self._ops = ops
+        self._rewrite(list(ops.values()))
+        if ops:
+            logger.info(f"{len(ops)} pending calendar writes loaded from {self.path}")
+
+    def _rewrite(self, ops: List[Dict]):
+        """Replace the log with the pending writes only"""
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            for op in ops:
+                f.write(json.dumps(op) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        WRITES_PENDING.set(len(ops))
+
+    def _append(self, record: Dict, sync: bool):
+        """Write a log line (with _file_lock held)"""
+        if not self._file:
+            self._open()
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def add(self, kind: str, user_id: int, chat_id: int, **params) -> Dict:
+        """Log a write (datetimes as ISO strings) and return it, claimed by the caller (blocking)"""
+        op = {
+            'op': 'add',
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'params': {name: _encode(value) for name, value in params.items()},
+            'queued_at': time.time(),
+        }
+        with self._file_lock:
+            self._append(op, sync=True)
+            with self._lock:
+                self._ops[op['id']] = op
+                self._claimed.add(op['id'])
+                WRITES_PENDING.set(len(self._ops))
+        return op
+
+    def done(self, op_id: str, result: str = 'direct'):
+        """The write was applied (or given up, `result` failed/expired): forget it (blocking)"""
+        with self._file_lock:
+            with self._lock:
+                op = self._ops.pop(op_id, None)
+                if op is None:
+                    return
+                self._attempts.pop(op_id, None)
+                self._next_try.pop(op_id, None)
+                self._claimed.discard(op_id)
+                empty = not self._ops
+                WRITES_PENDING.set(len(self._ops))
+            self._append({'op': 'done', 'id': op_id}, sync=False)
+            WRITES_DONE.inc(kind=op['kind'], result=result)
+            # add() needs _file_lock too, so nothing was logged since `empty` was read
+            if empty and self._file.tell() > COMPACT_BYTES:
+                self._file.seek(0)
+                self._file.truncate()
+
+    def release(self, op_id: str, error: BaseException = None):
+        """Give a claimed write back after a failed attempt; it is retried after a backoff"""
+        with self._lock:
+            attempts = self._attempts.get(op_id, 0)
+            self._attempts[op_id] = attempts + 1
+            self._next_try[op_id] = time.monotonic() + retry_delay(attempts, error)
+            self._claimed.discard(op_id)
+
+    def claim_due(self) -> Tuple[List[Dict], Optional[float]]:
+        """Unclaimed writes due for an attempt, oldest first, and seconds until the next one is due"""
+        if not self._file:
+            self.open()
+        now = time.monotonic()
+        due, wait = [], None
+        with self._lock:
+            for op_id, op in self._ops.items():
+                if op_id in self._claimed:
+                    continue
+                next_try = self._next_try.get(op_id, now)
+                if next_try <= now:
+                    due.append(op)
+                    self._claimed.add(op_id)
+                else:
+                    wait = next_try - now if wait is None else min(wait, next_try - now)
+        return due, wait
+
+    def is_pending(self, kind: str, event_id: str, content_key: str = None) -> bool:
+        """
+        Whether a `kind` write of this event is logged and not applied yet,
+        or one with the same `content_key` queued in the last
+        config.DUPLICATE_CREATE_WINDOW seconds
+        """
+        since = time.time() - config.DUPLICATE_CREATE_WINDOW
+        with self._lock:
+            return any(op['kind'] == kind and (
+                op['params'].get('event_id') == event_id
+                or content_key is not None and op['params'].get('content_key') == content_key
+                and op['queued_at'] >= since) for op in self._ops.values())
+
+    def __len__(self) -> int:
+        return len(self._ops)
+
+
+class WriteReplayer:
+    def __init__(self,
+                 queue: WriteQueue,
+                 apply: Callable[[Dict], Awaitable[object]],
+                 notify: Callable[[Dict, object, Optional[BaseException]], Awaitable[None]]):
+        """
+        Background task applying the queue's writes, oldest first, one at a
+        time. `apply(op)` is a coroutine function; like the handlers it runs
+        the Calendar call on a lane thread. While Calendar is down its circuit
+        breaker fails them fast, and one failure backs off the whole batch.
+        `notify(op, result, error)` tells the user the write went through
+        (error None) or was given up: refused by Calendar, or still failing
+        after config.WRITE_QUEUE_MAX_AGE seconds.
+        """
+        self.queue = queue
+        self.apply = apply
+        self.notify = notify
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    def wake(self):
+        """A write was queued: look at the queue again now instead of at the next due time"""
+        self._wake.set()
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            due, wait = self.queue.claim_due()
+            if not due:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for index, op in enumerate(due):
+                error = await self._replay(op)
+                if error is not None:
+                    # Calendar is still down: the rest backs off too instead of failing one by one
+                    for skipped in due[index + 1:]:
+                        self.queue.release(skipped['id'], error)
+                    break
+
+    async def _replay(self, op: Dict) -> Optional[BaseException]:
+        """Try one write; returns the error when Calendar is still unreachable"""
+        REPLAY_ATTEMPTS.inc(kind=op['kind'])
+        try:
+            result = await self.apply(op)
+        except Exception as error:
+            retryable = is_retryable(error)
+            if retryable and time.time() - op['queued_at'] < config.WRITE_QUEUE_MAX_AGE:
+                self.queue.release(op['id'], error)
+                return error
+            logger.warning(f"Queued {op['kind']} {op['id']} {'expired' if retryable else 'failed'}: {error}")
+            await self._done(op, 'expired' if retryable else 'failed')
+            await self._notify(op, None, error)
+            return None
+        await self._done(op, 'replayed')
+        await self._notify(op, result, None)
+        return None
+
+    async def _done(self, op: Dict, result: str):
+        """queue.done() on a thread: it writes to the log"""
+        await asyncio.get_running_loop().run_in_executor(None, self.queue.done, op['id'], result)
+
+    async def _notify(self, op: Dict, result, error: Optional[BaseException]):
+        try:
+            await self.notify(op, result, error)
+        except Exception:
+            logger.exception(f"Could not notify user {op['user_id']} about queued {op['kind']}")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+
+def apply_write(calendar_service, op: Dict):
+    """
+    Apply a logged write with a GoogleCalendarService. Applying one that
+    already went through (its answer was lost) is a no-op: a create with an
+    existing event id returns that event, the deleted event is gone (404/410).
+    """
+    params = op['params']
+    try:
+        if op['kind'] == CREATE:
+            return calendar_service.create_event(
+                summary=params['summary'],
+                start_time=_decode(params['start']),
+                end_time=_decode(params['end']),
+                description=params.get('description'),
+                location=params.get('location'),
+                event_id=params['event_id'],
+            )
+        if op['kind'] == UPDATE:
+            return calendar_service.update_event(
+                params['event_id'],
+                summary=params.get('summary'),
+                start_time=_decode(params.get('start')),
+                end_time=_decode(params.get('end')),
+                description=params.get('description'),
+                location=params.get('location'),
+            )
+        if op['kind'] == DELETE:
+            return calendar_service.delete_event(params['event_id'], params.get('calendar_id', 'primary'))
+    except Exception as error:
+        if op['kind'] == DELETE and http_status(error) in (404, 410):
+            return True
+        raise
+    raise ValueError(f"Unknown write kind {op['kind']!r}")
@@ -0,0 +1,158 @@
+"""
+Circuit breaker
+Fails fast while a dependency is down and bounds each call by a deadline learned from its latency
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable
+from utils.metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+HALF_OPEN = 'half_open'
+OPEN = 'open'
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = gauge(
+    'bot_circuit_state', 'Circuit breaker state (0 closed, 1 half-open, 2 open)', ('circuit',))
+CIRCUIT_REJECTED = counter(
+    'bot_circuit_rejected_total', 'Calls failed fast because the circuit was open', ('circuit',))
+CIRCUIT_TIMEOUTS = counter(
+    'bot_circuit_timeouts_total', 'Calls abandoned at the adaptive deadline', ('circuit',))
+CIRCUIT_DEADLINE = gauge(
+    'bot_circuit_deadline_seconds', 'Current adaptive call deadline', ('circuit',))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} is unavailable (circuit open), retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CallTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 min_timeout: float = 1.0, max_timeout: float = 30.0, timeout_multiplier: float = 3.0,
+                 latency_window: int = 100, max_concurrent: int = 8,
+                 is_failure: Callable[[BaseException], bool] = None):
+        """
+        Opens after `failure_threshold` consecutive failures and then
+        rejects calls for `reset_timeout` seconds, after which a single probe
+        call decides whether it closes again. Every call runs on a pool of
+        `max_concurrent` threads, which bounds the calls in flight; the
+        caller's thread waits for it. Calls made with a deadline are
+        abandoned after `timeout_multiplier` times the p99 of the last
+        `latency_window` successful calls, clamped to [min_timeout,
+        max_timeout]. `is_failure` filters out errors that say nothing about
+        the dependency's health (e.g. 404s).
+        The waits block, so call from a worker thread (see
+        bot.dispatcher.run_blocking), never from the event loop.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.is_failure = is_failure or (lambda error: True)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._latencies = deque(maxlen=latency_window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix=f"circuit-{name}")
+        CIRCUIT_STATE.set(0, circuit=name)
+        CIRCUIT_DEADLINE.set(max_timeout, circuit=name)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+            CIRCUIT_STATE.set(_STATE_VALUES[state], circuit=self.name)
+
+    def deadline(self) -> float:
+        """Seconds a call may take before it is abandoned"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < 10:
+            return self.max_timeout
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def _before_call(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        CIRCUIT_REJECTED.inc(circuit=self.name)
+        raise CircuitOpenError(self.name, max(remaining, 0.0))
+
+    def _on_success(self, elapsed: float):
+        with self._lock:
+            self._latencies.append(elapsed)
+            self.failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def _on_failure(self):
+        with self._lock:
+            self.failures += 1
+            was_probe, self._probing = self._probing, False
+            if was_probe or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def _release_probe(self):
+        with self._lock:
+            self._probing = False
+
+    def call(self, func: Callable, *args, deadline: bool = True, **kwargs):
+        """
+        Run func(*args, **kwargs) on the breaker's threads and wait for it.
+        With `deadline`, the caller stops waiting at the adaptive deadline
+        (CallTimeoutError); the call itself cannot be interrupted and keeps
+        its thread until it returns, so func must bound itself too (e.g. a
+        socket timeout). Use deadline=False for non-idempotent calls, whose
+        outcome the caller must learn.
+        """
+        self._before_call()
+        started = time.perf_counter()
+        try:
+            future = self._executor.submit(func, *args, **kwargs)
+            if deadline:
+                timeout = self.deadline()
+                CIRCUIT_DEADLINE.set(timeout, circuit=self.name)
+                try:
+                    result = future.result(timeout)
+                except FutureTimeout:
+                    CIRCUIT_TIMEOUTS.inc(circuit=self.name)
+                    raise CallTimeoutError(f"{self.name} did not answer within {timeout:.1f}s")
+            else:
+                result = future.result()
+        except Exception as error:
+            if isinstance(error, CallTimeoutError) or self.is_failure(error):
+                self._on_failure()
+            else:
+                # The dependency answered; it just said no
+                self._on_success(time.perf_counter() - started)
+            raise
+        except BaseException:
+            self._release_probe()
+            raise
+        self._on_success(time.perf_counter() - started)
+        return result
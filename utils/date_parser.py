@@ -0,0 +1,336 @@
+"""
+Date/time parsing engine
+Single-pass, table-driven parser shared by every date, time and duration input
+"""
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional, Tuple
+import config
+
+# One precompiled tokenizer. Alternatives are ordered so that the most
+# specific shape wins: ISO dates before DD/MM/YYYY (otherwise "2024-12-25"
+# would be read as 24-12-25), full dates before HH:MM, decimals before ints.
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<ymd>\d{4})[/\-.](?P<ymd_m>\d{1,2})[/\-.](?P<ymd_d>\d{1,2})
+    | (?P<dmy>\d{1,2})[/\-.](?P<dmy_m>\d{1,2})[/\-.](?P<dmy_y>\d{2,4})
+    | (?P<hm>\d{1,2})[:.](?P<hm_m>\d{2})(?!\d)
+    | (?P<dec>\d+[.,]\d+)
+    | (?P<num>\d+)
+    | (?P<word>[a-z]+)
+    """,
+    re.VERBOSE,
+)
+
+WEEKDAYS = {
+    'senin': 0, 'monday': 0,
+    'selasa': 1, 'tuesday': 1,
+    'rabu': 2, 'wednesday': 2,
+    'kamis': 3, 'thursday': 3,
+    'jumat': 4, 'friday': 4,
+    'sabtu': 5, 'saturday': 5,
+    'minggu': 6, 'sunday': 6,
+}
+
+# Relative date phrases -> offset in days. Looked up by first word so the
+# tokenizer only does one dict probe per word; longest phrase wins.
+_RELATIVE_PHRASES = {}
+for _phrase, _offset in (
+    ('hari ini', 0), ('today', 0),
+    ('besok', 1), ('tomorrow', 1),
+    ('lusa', 2), ('day after tomorrow', 2),
+    ('minggu depan', 7), ('next week', 7),
+    ('bulan depan', 30), ('next month', 30),  # Approximate - 30 days
+):
+    _words = tuple(_phrase.split())
+    _RELATIVE_PHRASES.setdefault(_words[0], []).append((_words, _offset))
+for _candidates in _RELATIVE_PHRASES.values():
+    _candidates.sort(key=lambda item: len(item[0]), reverse=True)
+
+# "minggu" is Sunday, but "minggu ini"/"minggu depan" mean this/next week: without
+# a weekday they name no particular day
+WEEK_PHRASES = frozenset({('minggu', 'ini'), ('minggu', 'depan'), ('this', 'week'), ('next', 'week')})
+
+# Meridiem markers. "siang" only shifts early-afternoon hours
+# (jam 2 siang = 14:00, jam 11 siang = 11:00).
+AM_WORDS = frozenset({'am', 'pagi'})
+PM_WORDS = frozenset({'pm', 'sore', 'malam'})
+NOON_WORDS = frozenset({'siang'})
+
+HOUR_WORDS = frozenset({'jam', 'hour', 'hours', 'hr', 'hrs'})
+MINUTE_WORDS = frozenset({'menit', 'minute', 'minutes', 'min', 'mins'})
+
+
+def normalize(text: str) -> str:
+    """Normalize raw user input before tokenizing/caching"""
+    return text.lower().replace("'", '').strip()
+
+
+def tokenize(text: str) -> List[Tuple[str, tuple]]:
+    """Split normalized text into (kind, value) tokens in a single pass"""
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'ymd_d':
+            tokens.append(('date', (int(match.group('ymd')),
+                                    int(match.group('ymd_m')),
+                                    int(match.group('ymd_d')))))
+        elif kind == 'dmy_y':
+            year = int(match.group('dmy_y'))
+            # Handle 2-digit year
+            if year < 100:
+                year += 2000
+            tokens.append(('date', (year,
+                                    int(match.group('dmy_m')),
+                                    int(match.group('dmy')))))
+        elif kind == 'hm_m':
+            tokens.append(('hm', (int(match.group('hm')), int(match.group('hm_m')))))
+        elif kind == 'dec':
+            tokens.append(('dec', (float(match.group('dec').replace(',', '.')),)))
+        elif kind == 'num':
+            tokens.append(('num', (int(match.group('num')),)))
+        else:
+            tokens.append(('word', (match.group('word'),)))
+    return tokens
+
+
+def _match_phrase(words: List[Optional[str]], i: int) -> Optional[Tuple[int, int]]:
+    """Return (offset_days, phrase_length) for a relative phrase at words[i]"""
+    for phrase, offset in _RELATIVE_PHRASES.get(words[i], ()):
+        if tuple(words[i:i + len(phrase)]) == phrase:
+            return offset, len(phrase)
+    return None
+
+
+def _resolve_date(text: str, today: date) -> date:
+    tokens = tokenize(text)
+    words = [value[0] if kind == 'word' else None for kind, value in tokens]
+    relative = None
+    weekday = None
+
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        if kind == 'date':
+            # An explicit date always wins
+            return date(*value)
+        if kind == 'word':
+            phrase = _match_phrase(words, i)
+            if phrase:
+                if relative is None:
+                    relative = phrase[0]
+                i += phrase[1]
+                continue
+            if tuple(words[i:i + 2]) in WEEK_PHRASES:
+                i += 2
+                continue
+            if weekday is None and value[0] in WEEKDAYS:
+                weekday = WEEKDAYS[value[0]]
+        i += 1
+
+    if relative is not None:
+        return today + timedelta(days=relative)
+
+    if weekday is not None:
+        days_ahead = weekday - today.weekday()
+        if days_ahead <= 0:  # Target day already happened this week
+            days_ahead += 7
+        return today + timedelta(days=days_ahead)
+
+    raise ValueError(f"Could not parse date: {text}")
+
+
+@lru_cache(maxsize=1024)
+def _resolve_localized_date(text: str, today: date) -> datetime:
+    day = _resolve_date(text, today)
+    return config.TIMEZONE.localize(datetime(day.year, day.month, day.day))
+
+
+@lru_cache(maxsize=1024)
+def _resolve_time(text: str) -> Tuple[int, int]:
+    hour = minute = None
+    words = set()
+
+    for kind, value in tokenize(text):
+        if kind == 'word':
+            words.add(value[0])
+        elif hour is None and kind == 'hm':
+            hour, minute = value
+        elif hour is None and kind == 'num':
+            hour, minute = value[0], 0
+
+    if hour is None:
+        raise ValueError(f"Could not parse time: {text}")
+
+    if words & PM_WORDS:
+        if hour < 12:
+            hour += 12
+        elif hour == 12 and 'malam' in words:
+            hour = 0
+    elif words & NOON_WORDS:
+        if hour < 6:
+            hour += 12
+    elif words & AM_WORDS:
+        if hour == 12:
+            hour = 0
+
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"Could not parse time: {text}")
+
+    return hour, minute
+
+
+@lru_cache(maxsize=256)
+def _resolve_duration(text: str) -> Tuple[int, int]:
+    hours = minutes = 0
+    pending = None
+
+    for kind, value in tokenize(text):
+        if kind in ('num', 'dec'):
+            pending = value[0]
+        elif kind == 'word' and pending is not None:
+            if value[0] in HOUR_WORDS:
+                total = round(pending * 60)
+                hours += total // 60
+                minutes += total % 60
+                pending = None
+            elif value[0] in MINUTE_WORDS:
+                minutes += int(pending)
+                pending = None
+
+    if hours == 0 and minutes == 0:
+        # Default 1 hour
+        hours = 1
+
+    return hours, minutes
+
+
+def parse_date(text: str, now: datetime = None) -> datetime:
+    """
+    Parse a date expression into a localized datetime at midnight.
+    Results are memoized on (normalized text, today's date).
+    """
+    if now is None:
+        now = datetime.now(config.TIMEZONE)
+    return _resolve_localized_date(normalize(text), now.date())
+
+
+def parse_time(text: str) -> Tuple[int, int]:
+    """Parse a time expression into (hour, minute)"""
+    return _resolve_time(normalize(text))
+
+
+def parse_duration(text: str) -> Tuple[int, int]:
+    """Parse a duration expression into (hours, minutes), defaulting to 1 hour"""
+    return _resolve_duration(normalize(text))
+
+
+# Words that start the "when"/"where" part of a schedule message; the title is what comes before
+LOCATION_WORDS = frozenset({'di', 'at'})
+TIME_WORDS = frozenset({'jam', 'pukul'})
+_SCHEDULE_MARKERS = (frozenset(WEEKDAYS) | frozenset(_RELATIVE_PHRASES) | LOCATION_WORDS | TIME_WORDS
+                     | frozenset({'pada', 'tanggal', 'tgl', 'selama'}))
+
+
+def _vague_week(words: List[Optional[str]]) -> bool:
+    """Whether the text says "this/next week" without naming the day"""
+    weeks = [i for i in range(len(words)) if tuple(words[i:i + 2]) in WEEK_PHRASES]
+    return bool(weeks) and not any(word in WEEKDAYS and i not in weeks for i, word in enumerate(words))
+
+
+def _time_fragment(matches, words: List[Optional[str]]) -> Optional[Tuple[int, int]]:
+    """Token range [first, last] of the time of day: "jam 3 sore", "pukul 14.30", "09:00 pagi" """
+    meridiem = AM_WORDS | PM_WORDS | NOON_WORDS
+    for i, match in enumerate(matches):
+        if match.lastgroup == 'hm_m':
+            first = i - 1 if i and words[i - 1] in TIME_WORDS else i
+        elif words[i] in TIME_WORDS and i + 1 < len(matches) and matches[i + 1].lastgroup in ('num', 'hm_m'):
+            first, i = i, i + 1
+        else:
+            continue
+        last = i + 1 if i + 1 < len(matches) and words[i + 1] in meridiem else i
+        return first, last
+    return None
+
+
+def parse_schedule_locally(text: str, now: datetime = None) -> Optional[dict]:
+    """
+    Best-effort create_event extraction without the AI, e.g. for
+    "Meeting dengan tim besok jam 3 sore di kantor". Returns the same
+    fields the AI's JSON has, or None when the text names no time of day
+    or only the week ("rapat minggu ini jam 10").
+    """
+    if now is None:
+        now = datetime.now(config.TIMEZONE)
+    source = text.replace("'", '').strip()
+    lowered = source.lower()
+    matches = list(_TOKEN_RE.finditer(lowered))
+    words = [match.group('word') if match.lastgroup == 'word' else None for match in matches]
+
+    fragment = _time_fragment(matches, words)
+    if fragment is None or (_vague_week(words) and not any(
+            match.lastgroup in ('ymd_d', 'dmy_y') for match in matches)):
+        return None
+    first, last = fragment
+    try:
+        hour, minute = _resolve_time(lowered[matches[first].start():matches[last].end()])
+    except ValueError:
+        return None
+
+    try:
+        day = _resolve_date(lowered, now.date())
+    except ValueError:
+        # No date given: the next occurrence of that time
+        day = now.date() if (hour, minute) > (now.hour, now.minute) else now.date() + timedelta(days=1)
+
+    # Duration from what is left once the time of day is cut out ("selama 2 jam")
+    rest = lowered[:matches[first].start()] + ' ' + lowered[matches[last].end():]
+    hours, minutes = _resolve_duration(rest.strip())
+
+    start = datetime(day.year, day.month, day.day, hour, minute)
+    end = start + timedelta(hours=hours, minutes=minutes)
+
+    markers = [i for i, word in enumerate(words) if word in _SCHEDULE_MARKERS]
+    markers += [i for i, match in enumerate(matches) if match.lastgroup == 'ymd_d' or match.lastgroup == 'dmy_y']
+    cut = min(markers + [first])
+    title = source[:matches[cut].start()].strip(' ,.-') or 'Acara'
+
+    # "at"/"di" also introduce the time ("lunch at 12:00 at cafe"): the place is what a
+    # location word is followed by up to the next marker, when that is not empty
+    location = ''
+    for i, word in enumerate(words):
+        if word in LOCATION_WORDS and i + 1 < len(matches) and not first <= i <= last:
+            stop = next((j for j in sorted(markers + [first]) if j > i), None)
+            if stop == i + 1:
+                continue
+            end_at = matches[stop].start() if stop is not None else len(source)
+            location = source[matches[i + 1].start():end_at].strip(' ,.-')
+            break
+
+    return {
+        'action': 'create_event',
+        'title': title[0].upper() + title[1:],
+        'start_date': start.strftime('%Y-%m-%d'),
+        'start_time': start.strftime('%H:%M'),
+        'end_date': end.strftime('%Y-%m-%d'),
+        'end_time': end.strftime('%H:%M'),
+        'location': location,
+        'description': '',
+    }
+
+
+def cache_info() -> dict:
+    """Memo statistics for every parser"""
+    return {
+        'date': _resolve_localized_date.cache_info(),
+        'time': _resolve_time.cache_info(),
+        'duration': _resolve_duration.cache_info(),
+    }
+
+
+def cache_clear():
+    """Drop all memoized parse results"""
+    _resolve_localized_date.cache_clear()
+    _resolve_time.cache_clear()
+    _resolve_duration.cache_clear()
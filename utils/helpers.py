@@ -1,9 +1,103 @@
 """
 Helper functions for the bot
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 import re
 import config
+from utils import date_parser
+
+EVENT_EMOJI_MAP = {
+    'meeting': '👥',
+    'rapat': '👥',
+    'birthday': '🎂',
+    'ultah': '🎂',
+    'lunch': '🍽️',
+    'makan': '🍽️',
+    'dinner': '🍽️',
+    'breakfast': '🍳',
+    'sarapan': '🍳',
+    'gym': '🏋️',
+    'workout': '🏋️',
+    'olahraga': '🏃',
+    'doctor': '👨‍⚕️',
+    'dokter': '👨‍⚕️',
+    'dentist': '🦷',
+    'study': '📚',
+    'belajar': '📚',
+    'exam': '📝',
+    'ujian': '📝',
+    'flight': '✈️',
+    'pesawat': '✈️',
+    'travel': '🧳',
+    'liburan': '🏖️',
+    'vacation': '🏖️',
+    'call': '📞',
+    'telpon': '📞',
+    'zoom': '💻',
+    'online': '💻',
+    'deadline': '⏰',
+    'presentation': '📊',
+    'presentasi': '📊',
+    'interview': '🤝',
+    'wawancara': '🤝',
+    'date': '❤️',
+    'kencan': '❤️',
+    'party': '🎉',
+    'pesta': '🎉',
+    'wedding': '💒',
+    'nikah': '💒',
+    'shopping': '🛍️',
+    'belanja': '🛍️',
+    'coffee': '☕',
+    'kopi': '☕',
+    'movie': '🎬',
+    'film': '🎬',
+    'concert': '🎵',
+    'konser': '🎵',
+    'sport': '⚽',
+    'game': '🎮',
+    'church': '⛪',
+    'gereja': '⛪',
+    'mosque': '🕌',
+    'masjid': '🕌',
+    'pray': '🙏',
+    'ibadah': '🙏'
+}
+
+# Phrases that can be answered locally without asking the AI.
+# Order is priority: the first listed intent wins when several match.
+INTENT_KEYWORDS = {
+    'kapan saya free': 'free_slots',
+    'kapan aku free': 'free_slots',
+    'kapan saya kosong': 'free_slots',
+    'kapan aku kosong': 'free_slots',
+    'kapan saya luang': 'free_slots',
+    'waktu kosong': 'free_slots',
+    'waktu luang': 'free_slots',
+    'when am i free': 'free_slots',
+    'jadwal hari ini': 'view_today',
+    'agenda hari ini': 'view_today',
+    'acara hari ini': 'view_today',
+    "today's schedule": 'view_today',
+    'jadwal minggu ini': 'view_week',
+    'agenda minggu ini': 'view_week',
+    'acara minggu ini': 'view_week',
+    "this week's schedule": 'view_week',
+    'analisis jadwal': 'analyze',
+    'analisa jadwal': 'analyze',
+    'evaluasi jadwal': 'analyze',
+    'optimasi jadwal': 'analyze',
+    'analyze my schedule': 'analyze',
+}
+
+# Word stems of asking to create, delete or move an event. A message with
+# any of them is a write request even when it also names a view phrase
+# ("buat acara hari ini ...") and must go to the AI.
+ACTION_KEYWORDS = (
+    'buat', 'bikin', 'tambah', 'jadwalkan', 'hapus', 'batal', 'pindah', 'mindah',
+    'ubah', 'ganti', 'geser', 'undur', 'majukan',
+    'add', 'create', 'delete', 'remove', 'cancel', 'move', 'reschedule',
+)
 
 def format_event(event):
     """Format a Google Calendar event for display"""
@@ -48,106 +142,45 @@ def format_event(event):
     
     return formatted
 
+def parse_event_time(value):
+    """Parse a Google Calendar start/end object into an aware datetime"""
+    if 'dateTime' in value:
+        parsed = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            return config.TIMEZONE.localize(parsed)
+        return parsed.astimezone(config.TIMEZONE)
+    if 'date' in value:
+        # All-day events start/end at local midnight
+        return config.TIMEZONE.localize(datetime.strptime(value['date'], '%Y-%m-%d'))
+    return None
+
+def get_event_bounds(event):
+    """Get (start, end) aware datetimes of an event, or None if it has no times"""
+    start = parse_event_time(event.get('start', {}))
+    end = parse_event_time(event.get('end', {}))
+    if start is None or end is None:
+        return None
+    return start, end
+
+def is_busy_event(event):
+    """Whether an event blocks time (timed, not cancelled, not marked free)"""
+    return (
+        'dateTime' in event.get('start', {})
+        and event.get('status') != 'cancelled'
+        and event.get('transparency') != 'transparent'
+    )
+
 def parse_datetime_input(text):
     """Parse various datetime input formats"""
-    text = text.lower().strip()
-    now = datetime.now(config.TIMEZONE)
-    
-    # Handle relative dates
-    if text in ['hari ini', 'today']:
-        return now
-    elif text in ['besok', 'tomorrow']:
-        return now + timedelta(days=1)
-    elif text in ['lusa', 'day after tomorrow']:
-        return now + timedelta(days=2)
-    elif 'minggu depan' in text or 'next week' in text:
-        return now + timedelta(weeks=1)
-    elif 'bulan depan' in text or 'next month' in text:
-        # Approximate - add 30 days
-        return now + timedelta(days=30)
-    
-    # Try to parse DD/MM/YYYY format
-    date_pattern = r'(\d{1,2})[/\-.](\d{1,2})[/\-.](\d{2,4})'
-    match = re.search(date_pattern, text)
-    if match:
-        day = int(match.group(1))
-        month = int(match.group(2))
-        year = int(match.group(3))
-        
-        # Handle 2-digit year
-        if year < 100:
-            year += 2000
-        
-        return config.TIMEZONE.localize(datetime(year, month, day))
-    
-    # Try to parse YYYY-MM-DD format
-    date_pattern2 = r'(\d{4})[/\-.](\d{1,2})[/\-.](\d{1,2})'
-    match = re.search(date_pattern2, text)
-    if match:
-        year = int(match.group(1))
-        month = int(match.group(2))
-        day = int(match.group(3))
-        
-        return config.TIMEZONE.localize(datetime(year, month, day))
-    
-    # Try to parse day names
-    days = {
-        'senin': 0, 'monday': 0,
-        'selasa': 1, 'tuesday': 1,
-        'rabu': 2, 'wednesday': 2,
-        'kamis': 3, 'thursday': 3,
-        'jumat': 4, 'friday': 4,
-        'sabtu': 5, 'saturday': 5,
-        'minggu': 6, 'sunday': 6
-    }
-    
-    for day_name, day_num in days.items():
-        if day_name in text:
-            days_ahead = day_num - now.weekday()
-            if days_ahead <= 0:  # Target day already happened this week
-                days_ahead += 7
-            return now + timedelta(days=days_ahead)
-    
-    raise ValueError(f"Could not parse date: {text}")
+    return date_parser.parse_date(text)
 
 def parse_time_input(text):
     """Parse time input"""
-    text = text.lower().strip()
-    
-    # Remove common words
-    text = text.replace('jam', '').replace('pukul', '').replace('at', '').strip()
-    
-    # Handle format HH:MM
-    time_pattern = r'(\d{1,2})[:\.](\d{2})'
-    match = re.search(time_pattern, text)
-    if match:
-        hour = int(match.group(1))
-        minute = int(match.group(2))
-        
-        # Handle AM/PM
-        if 'pm' in text and hour < 12:
-            hour += 12
-        elif 'am' in text and hour == 12:
-            hour = 0
-        
-        return hour, minute
-    
-    # Handle single number (assume hour)
-    single_num = re.search(r'(\d{1,2})', text)
-    if single_num:
-        hour = int(single_num.group(1))
-        
-        # Handle PM
-        if 'malam' in text or 'sore' in text or 'pm' in text:
-            if hour < 12:
-                hour += 12
-        elif 'pagi' in text or 'am' in text:
-            if hour == 12:
-                hour = 0
-        
-        return hour, 0
-    
-    raise ValueError(f"Could not parse time: {text}")
+    return date_parser.parse_time(text)
+
+def parse_duration_input(text):
+    """Parse duration input into (hours, minutes)"""
+    return date_parser.parse_duration(text)
 
 def get_greeting():
     """Get appropriate greeting based on time"""
@@ -178,71 +211,27 @@ def format_duration(minutes):
 def get_event_emoji(event_title):
     """Get appropriate emoji for event based on title"""
     title_lower = event_title.lower()
-    
-    emoji_map = {
-        'meeting': '👥',
-        'rapat': '👥',
-        'birthday': '🎂',
-        'ultah': '🎂',
-        'lunch': '🍽️',
-        'makan': '🍽️',
-        'dinner': '🍽️',
-        'breakfast': '🍳',
-        'sarapan': '🍳',
-        'gym': '🏋️',
-        'workout': '🏋️',
-        'olahraga': '🏃',
-        'doctor': '👨‍⚕️',
-        'dokter': '👨‍⚕️',
-        'dentist': '🦷',
-        'study': '📚',
-        'belajar': '📚',
-        'exam': '📝',
-        'ujian': '📝',
-        'flight': '✈️',
-        'pesawat': '✈️',
-        'travel': '🧳',
-        'liburan': '🏖️',
-        'vacation': '🏖️',
-        'call': '📞',
-        'telpon': '📞',
-        'zoom': '💻',
-        'online': '💻',
-        'deadline': '⏰',
-        'presentation': '📊',
-        'presentasi': '📊',
-        'interview': '🤝',
-        'wawancara': '🤝',
-        'date': '❤️',
-        'kencan': '❤️',
-        'party': '🎉',
-        'pesta': '🎉',
-        'wedding': '💒',
-        'nikah': '💒',
-        'shopping': '🛍️',
-        'belanja': '🛍️',
-        'coffee': '☕',
-        'kopi': '☕',
-        'movie': '🎬',
-        'film': '🎬',
-        'concert': '🎵',
-        'konser': '🎵',
-        'sport': '⚽',
-        'game': '🎮',
-        'church': '⛪',
-        'gereja': '⛪',
-        'mosque': '🕌',
-        'masjid': '🕌',
-        'pray': '🙏',
-        'ibadah': '🙏'
-    }
-    
-    for keyword, emoji in emoji_map.items():
+    for keyword, emoji in EVENT_EMOJI_MAP.items():
         if keyword in title_lower:
             return emoji
-    
     return '📅'  # Default calendar emoji
 
+def classify_intent(text):
+    """
+    Cheap keyword pre-classification of a chat message, run before any AI call.
+    Returns one of INTENT_KEYWORDS' intents or None when nothing matched.
+    """
+    text_lower = text.lower()
+    for keyword, intent in INTENT_KEYWORDS.items():
+        if keyword in text_lower:
+            return intent
+    return None
+
+def mentions_action(text):
+    """Whether a message asks to create, delete or move an event"""
+    text_lower = text.lower()
+    return any(keyword in text_lower for keyword in ACTION_KEYWORDS)
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -0,0 +1,304 @@
+"""
+ICS
+Streaming iCalendar (RFC 5545) reader and writer for importing and exporting Calendar events
+"""
+import hashlib
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+import pytz
+import config
+from utils.metrics import counter
+
+ICS_EVENTS = counter(
+    'bot_ics_events_total', 'Events read from or written to iCalendar files '
+    '(read: parsed or skipped, written)', ('result',))
+
+# Unfolded lines longer than this (inline ATTACH data, images) are dropped, not kept in memory
+MAX_LINE = 64 * 1024
+# Properties kept per event; the rest of an oversized VEVENT is dropped
+MAX_PROPERTIES = 500
+# Octets per written line before it is folded (RFC 5545 3.1)
+FOLD_AT = 75
+
+# Lines Calendar takes as they are in an event's `recurrence`
+RECURRENCE_PROPERTIES = ('RRULE', 'EXRULE', 'RDATE', 'EXDATE')
+PRODID = '-//Telegram Calendar Bot//Calendar Export//ID'
+
+_LINE = re.compile(r'([A-Za-z0-9-]+)((?:;[A-Za-z0-9-]+=(?:"[^"]*"|[^";:]*)(?:,(?:"[^"]*"|[^";:]*))*)*):(.*)', re.S)
+_PARAM = re.compile(r';([A-Za-z0-9-]+)=((?:"[^"]*"|[^";:]*)(?:,(?:"[^"]*"|[^";:]*))*)')
+_DURATION = re.compile(r'([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+_UNESCAPE = re.compile(r'\\([\\;,nN])')
+
+# (name, params, value)
+Property = Tuple[str, Dict[str, str], str]
+
+
+def unfold(lines: Iterable[str]) -> Iterator[str]:
+    """Logical content lines of a file read line by line (continuations start with a space or tab)"""
+    current, too_long = None, False
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            if not too_long:
+                current += line[1:]
+                too_long = len(current) > MAX_LINE
+                if too_long:
+                    current = ''
+            continue
+        if current is not None and not too_long:
+            yield current
+        current, too_long = line, len(line) > MAX_LINE
+    if current is not None and not too_long:
+        yield current
+
+
+def parse_line(line: str) -> Property:
+    """NAME;PARAM=value;PARAM="quoted:value":value -> (NAME, {PARAM: value}, value)"""
+    match = _LINE.match(line)
+    if not match:
+        raise ValueError(f"Not an iCalendar content line: {line[:40]!r}")
+    params = {name.upper(): value.strip('"') for name, value in _PARAM.findall(match.group(2))}
+    return match.group(1).upper(), params, match.group(3)
+
+
+def vevents(lines: Iterable[str]) -> Iterator[List[Property]]:
+    """
+    The properties of each VEVENT in a file, one event at a time, so only
+    one event is ever held in memory. Components inside an event (VALARM)
+    and outside of events (VTIMEZONE, VTODO) are skipped.
+    """
+    event: Optional[List[Property]] = None
+    nested = 0
+    for line in unfold(lines):
+        if not line:
+            continue
+        try:
+            name, params, value = parse_line(line)
+        except ValueError:
+            continue
+        if name == 'BEGIN':
+            if event is not None:
+                nested += 1
+            elif value.upper() == 'VEVENT':
+                event, nested = [], 0
+        elif name == 'END':
+            if event is not None and nested:
+                nested -= 1
+            elif event is not None and value.upper() == 'VEVENT':
+                yield event
+                event = None
+        elif event is not None and not nested and len(event) < MAX_PROPERTIES:
+            event.append((name, params, value))
+
+
+def unescape(value: str) -> str:
+    return _UNESCAPE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _zone(tzid: str) -> str:
+    """IANA name of a TZID; vendor-prefixed ids ("/mozilla.org/.../Europe/Berlin") are reduced to it"""
+    if tzid in pytz.all_timezones_set:
+        return tzid
+    tail = '/'.join(tzid.split('/')[-2:])
+    if tail in pytz.all_timezones_set:
+        return tail
+    # e.g. Windows names ("W. Europe Standard Time"); their VTIMEZONE is not interpreted
+    return config.TIMEZONE_STR
+
+
+def _time(value: str, params: Dict[str, str]) -> Dict:
+    """DTSTART/DTEND/RECURRENCE-ID value -> Calendar API time ({'date'} or {'dateTime', 'timeZone'})"""
+    value = value.strip()
+    # Sliced rather than strptime'd: this runs twice per event of a file that can hold 10k+
+    if params.get('VALUE', '').upper() == 'DATE' or 'T' not in value:
+        return {'date': date(int(value[:4]), int(value[4:6]), int(value[6:8])).isoformat()}
+    if len(value) < 15 or value[8] != 'T':
+        raise ValueError(f"Bad date-time {value!r}")
+    moment = datetime(int(value[:4]), int(value[4:6]), int(value[6:8]),
+                      int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if value.endswith('Z'):
+        return {'dateTime': moment.isoformat() + 'Z', 'timeZone': 'UTC'}
+    # A floating time (no TZID) is read in the bot's timezone
+    return {'dateTime': moment.isoformat(), 'timeZone': _zone(params['TZID']) if 'TZID' in params
+            else config.TIMEZONE_STR}
+
+
+def _duration(value: str) -> timedelta:
+    match = _DURATION.match(value.strip())
+    if not match:
+        raise ValueError(f"Bad DURATION {value!r}")
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    delta = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                      minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -delta if sign == '-' else delta
+
+
+def _shift(start: Dict, delta: timedelta) -> Dict:
+    """The API time `delta` after `start`, in the same form (wall-clock time for zoned ones)"""
+    if 'date' in start:
+        day = datetime.strptime(start['date'], '%Y-%m-%d') + delta
+        return {'date': day.strftime('%Y-%m-%d')}
+    text = start['dateTime']
+    moment = datetime.fromisoformat(text.rstrip('Z')) + delta
+    return dict(start, dateTime=moment.isoformat() + ('Z' if text.endswith('Z') else ''))
+
+
+def _recurrence_line(name: str, params: Dict[str, str], value: str) -> str:
+    if 'TZID' in params:
+        params = dict(params, TZID=_zone(params['TZID']))
+    return name + ''.join(f";{key}={param}" for key, param in params.items()) + ':' + value
+
+
+def to_event(properties: List[Property]) -> Optional[Dict]:
+    """
+    Calendar API body (for events.import) of a VEVENT from vevents(), or
+    None for a cancelled event that is not a changed occurrence. Raises
+    ValueError for one Calendar would not accept (no or bad DTSTART).
+    """
+    event: Dict = {}
+    end = duration = None
+    recurrence = []
+    for name, params, value in properties:
+        if name == 'DTSTART':
+            event['start'] = _time(value, params)
+        elif name == 'DTEND':
+            end = _time(value, params)
+        elif name == 'DURATION':
+            duration = _duration(value)
+        elif name == 'UID':
+            event['iCalUID'] = value.strip()
+        elif name == 'SUMMARY':
+            event['summary'] = unescape(value)
+        elif name == 'DESCRIPTION':
+            event['description'] = unescape(value)
+        elif name == 'LOCATION':
+            event['location'] = unescape(value)
+        elif name == 'RECURRENCE-ID':
+            event['originalStartTime'] = _time(value, params)
+        elif name == 'STATUS' and value.upper() in ('CANCELLED', 'TENTATIVE'):
+            event['status'] = value.lower()
+        elif name == 'TRANSP' and value.upper() == 'TRANSPARENT':
+            event['transparency'] = 'transparent'
+        elif name in RECURRENCE_PROPERTIES:
+            recurrence.append(_recurrence_line(name, params, value))
+
+    if 'start' not in event:
+        raise ValueError('VEVENT without DTSTART')
+    if event.get('status') == 'cancelled' and 'originalStartTime' not in event:
+        return None
+    if end is None:
+        # RFC 5545 3.6.1: without DTEND a date event lasts the day, a timed one is an instant
+        end = _shift(event['start'], duration if duration is not None else
+                     timedelta(days=1) if 'date' in event['start'] else timedelta())
+    event['end'] = end
+    if recurrence and 'originalStartTime' not in event:
+        event['recurrence'] = recurrence
+    if 'iCalUID' not in event:
+        # Stable across imports of the same file, so a re-import still finds the event
+        digest = hashlib.sha1(f"{event.get('summary', '')}|{event['start']}".encode('utf-8')).hexdigest()
+        event['iCalUID'] = f"{digest}@calendar-bot"
+    return event
+
+
+def read_events(lines: Iterable[str], skipped: List[str] = None) -> Iterator[Dict]:
+    """
+    Calendar API bodies of the VEVENTs in a file, streamed. Events that
+    cannot be imported are left out; with `skipped`, why is appended to it.
+    """
+    for properties in vevents(lines):
+        try:
+            event = to_event(properties)
+        except ValueError as error:
+            event = None
+            if skipped is not None:
+                skipped.append(str(error))
+        if event is None:
+            ICS_EVENTS.inc(result='skipped')
+            continue
+        ICS_EVENTS.inc(result='parsed')
+        yield event
+
+
+def escape(text: str) -> str:
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line: str) -> str:
+    """A content line split into FOLD_AT-octet pieces (never inside a UTF-8 character), CRLF-terminated"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= FOLD_AT:
+        return line + '\r\n'
+    pieces, start, limit = [], 0, FOLD_AT
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Back off to the start of a character (continuation bytes are 10xxxxxx)
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        pieces.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, FOLD_AT - 1
+    return '\r\n '.join(pieces) + '\r\n'
+
+
+def _format_time(name: str, value: Dict) -> str:
+    if 'date' in value:
+        return f"{name};VALUE=DATE:{value['date'].replace('-', '')}"
+    moment = datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00'))
+    zone = value.get('timeZone')
+    if zone in pytz.all_timezones_set and zone != 'UTC':
+        # TZID by IANA name, as Google Calendar and Apple Calendar write and read it
+        local = moment.astimezone(pytz.timezone(zone))
+        return f"{name};TZID={zone}:{local.strftime('%Y%m%dT%H%M%S')}"
+    return f"{name}:{moment.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')}"
+
+
+def _stamp(updated: Optional[str]) -> str:
+    if updated:
+        moment = datetime.fromisoformat(updated.replace('Z', '+00:00')[:19] + '+00:00')
+    else:
+        moment = datetime.now(pytz.utc)
+    return moment.strftime('%Y%m%dT%H%M%SZ')
+
+
+def vevent_lines(event: Dict) -> List[str]:
+    """Content lines (unfolded) of a Calendar API event"""
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{event.get('iCalUID') or event['id'] + '@google.com'}",
+        f"DTSTAMP:{_stamp(event.get('updated'))}",
+        _format_time('DTSTART', event['start']),
+        _format_time('DTEND', event['end']),
+    ]
+    if event.get('originalStartTime'):
+        lines.append(_format_time('RECURRENCE-ID', event['originalStartTime']))
+    lines.extend(event.get('recurrence', ()))
+    for key, name in (('summary', 'SUMMARY'), ('description', 'DESCRIPTION'), ('location', 'LOCATION')):
+        if event.get(key):
+            lines.append(f"{name}:{escape(event[key])}")
+    if event.get('status') in ('cancelled', 'tentative'):
+        lines.append(f"STATUS:{event['status'].upper()}")
+    if event.get('transparency') == 'transparent':
+        lines.append('TRANSP:TRANSPARENT')
+    lines.append('END:VEVENT')
+    return lines
+
+
+def write_calendar(out: IO[str], events: Iterable[Dict], name: str = None) -> int:
+    """
+    Write events (Calendar API shape; recurring ones as their rule) to
+    `out` as one VCALENDAR, event by event. Open files with newline='' so
+    the CRLF line ends are kept. Returns the number of events written.
+    """
+    out.write(fold('BEGIN:VCALENDAR') + fold('VERSION:2.0') + fold(f"PRODID:{PRODID}") + fold('CALSCALE:GREGORIAN'))
+    if name:
+        out.write(fold(f"X-WR-CALNAME:{escape(name)}"))
+    written = 0
+    for event in events:
+        if 'start' not in event or 'end' not in event:
+            continue
+        out.write(''.join(fold(line) for line in vevent_lines(event)))
+        written += 1
+    out.write(fold('END:VCALENDAR'))
+    ICS_EVENTS.inc(written, result='written')
+    return written
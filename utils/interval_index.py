@@ -0,0 +1,166 @@
+"""
+Interval index
+Augmented interval tree for overlap and free-slot queries over events
+"""
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Hashable, List, Optional, Tuple
+
+Interval = Tuple[datetime, datetime, Hashable]
+
+
+class IntervalIndex:
+    def __init__(self):
+        """
+        Intervals are kept sorted by start and viewed as an implicit balanced
+        tree (node = midpoint of its slice) augmented with the max end of each
+        subtree, so overlap queries cost O(log n + k).
+        """
+        self._items: List[Interval] = []
+        self._keys = {}
+        self._max_end: List[Optional[datetime]] = []
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._keys
+
+    def add(self, start: datetime, end: datetime, key: Hashable):
+        """Insert or replace the interval stored under key (keys must be orderable)"""
+        if key in self._keys:
+            self.remove(key)
+        item = (start, end, key)
+        self._keys[key] = item
+        insort(self._items, item)
+        self._dirty = True
+
+    def remove(self, key: Hashable) -> bool:
+        """Remove the interval stored under key"""
+        item = self._keys.pop(key, None)
+        if item is None:
+            return False
+        del self._items[bisect_left(self._items, item)]
+        self._dirty = True
+        return True
+
+    def clear(self):
+        self._items.clear()
+        self._keys.clear()
+        self._dirty = True
+
+    def _build(self, lo: int, hi: int) -> Optional[datetime]:
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        best = self._items[mid][1]
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > best:
+                best = child
+        self._max_end[mid] = best
+        return best
+
+    def _ensure_built(self):
+        if self._dirty:
+            self._max_end = [None] * len(self._items)
+            self._build(0, len(self._items))
+            self._dirty = False
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Interval]:
+        """All intervals overlapping the half-open range [start, end), by start"""
+        self._ensure_built()
+        items = self._items
+        max_end = self._max_end
+        found = []
+        stack = [(0, len(items))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            # Nothing in this subtree ends after the query starts
+            if max_end[mid] <= start:
+                continue
+            item_start, item_end, _ = items[mid]
+            if item_start < end:
+                if item_end > start:
+                    found.append(items[mid])
+                stack.append((mid + 1, hi))
+            stack.append((lo, mid))
+        found.sort()
+        return found
+
+    def is_free(self, start: datetime, end: datetime) -> bool:
+        return not self.overlapping(start, end)
+
+    def nearest_free_slot(self,
+                          start: datetime,
+                          duration: timedelta,
+                          not_before: datetime = None,
+                          not_after: datetime = None) -> Optional[datetime]:
+        """
+        Start of the free slot of the given duration closest to `start`,
+        searching both later and earlier within [not_before, not_after].
+        """
+        later = start if not_before is None else max(start, not_before)
+        while True:
+            if not_after is not None and later + duration > not_after:
+                later = None
+                break
+            hits = self.overlapping(later, later + duration)
+            if not hits:
+                break
+            later = max(hit[1] for hit in hits)
+
+        earlier = start
+        while True:
+            if not_before is not None and earlier < not_before:
+                earlier = None
+                break
+            hits = self.overlapping(earlier, earlier + duration)
+            if not hits:
+                break
+            earlier = min(hit[0] for hit in hits) - duration
+
+        candidates = [slot for slot in (later, earlier) if slot is not None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda slot: abs(slot - start))
+
+    def items(self) -> List[Interval]:
+        return list(self._items)
+
+    def get(self, key: Hashable) -> Optional[Interval]:
+        return self._keys.get(key)
+
+
+def sweep_free_slots(busy: List[Tuple[datetime, datetime]],
+                     window_start: datetime,
+                     window_end: datetime,
+                     min_duration: timedelta = timedelta(0)) -> List[Tuple[datetime, datetime]]:
+    """
+    Free gaps inside [window_start, window_end) given busy intervals from any
+    number of calendars, found with a sweep line over start/end points.
+    """
+    points = []
+    for start, end in busy:
+        if end > window_start and start < window_end and end > start:
+            points.append((max(start, window_start), 1))
+            points.append((min(end, window_end), -1))
+    # Ends sort before starts at the same instant so touching intervals leave no gap
+    points.sort(key=lambda point: (point[0], point[1]))
+
+    min_gap = max(min_duration, timedelta.resolution)
+    free = []
+    depth = 0
+    cursor = window_start
+    for moment, delta in points:
+        if depth == 0 and delta == 1 and moment - cursor >= min_gap:
+            free.append((cursor, moment))
+        depth += delta
+        if depth == 0:
+            cursor = moment
+    if depth == 0 and window_end - cursor >= min_gap:
+        free.append((cursor, window_end))
+    return free
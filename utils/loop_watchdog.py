@@ -0,0 +1,112 @@
+"""
+Event loop watchdog
+Detects callbacks that block the asyncio event loop and reports where they block
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional, Tuple
+from utils.metrics import LOOP_LAG, LOOP_LAG_HISTOGRAM, counter, histogram, track_handler
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BLOCKING_CALLS = counter(
+    'bot_blocking_calls_total', 'Event loop stalls over the watchdog threshold',
+    ('handler', 'call_site'))
+STALL_DURATION = histogram(
+    'bot_event_loop_stall_seconds', 'Duration of event loop stalls over the watchdog threshold',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+
+# Code object of the @track_handler wrapper; its frame carries the handler name
+_HANDLER_WRAPPER_CODE = track_handler(lambda: None).__code__
+
+
+def _describe_stack(frame) -> Tuple[str, str, str]:
+    """Return (handler name, innermost project call site, formatted stack)"""
+    handler = 'unknown'
+    call_site = None
+    walker = frame
+    while walker is not None:
+        code = walker.f_code
+        if code is _HANDLER_WRAPPER_CODE and handler == 'unknown':
+            handler = walker.f_locals.get('name', 'unknown')
+        filename = os.path.abspath(code.co_filename)
+        if (call_site is None and filename.startswith(PROJECT_ROOT)
+                and filename != os.path.abspath(__file__)
+                and f'{os.sep}site-packages{os.sep}' not in filename):
+            relative = os.path.relpath(filename, PROJECT_ROOT)
+            call_site = f"{relative}:{walker.f_lineno} ({code.co_name})"
+        walker = walker.f_back
+
+    if call_site is None:
+        call_site = f"{frame.f_code.co_filename}:{frame.f_lineno} ({frame.f_code.co_name})"
+    stack = ''.join(traceback.format_stack(frame))
+    return handler, call_site, stack
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        """
+        A heartbeat coroutine ticks every `interval` seconds on the event loop;
+        a daemon thread captures the loop thread's stack whenever the
+        heartbeat is more than `threshold` seconds late.
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self._last_beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start watching the running event loop (call from inside the loop)"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f"Event loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+            if lag > self.threshold:
+                STALL_DURATION.observe(lag)
+            self._last_beat = now
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat
+            if stalled <= self.threshold or beat == self._reported_beat:
+                continue
+
+            # Report each stall once, while it is still in progress
+            self._reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            handler, call_site, stack = _describe_stack(frame)
+            BLOCKING_CALLS.inc(handler=handler, call_site=call_site)
+            logger.warning(
+                f"Event loop blocked for {stalled * 1000:.0f} ms in handler '{handler}' "
+                f"at {call_site}\n{stack}"
+            )
@@ -0,0 +1,372 @@
+"""
+Recurrence
+Expands the RRULE/EXDATE/RDATE lines of recurring Calendar events into instances
+"""
+import bisect
+import calendar
+import heapq
+from datetime import date, datetime, timedelta
+from typing import Container, Dict, Iterator, List, Optional, Tuple, Union
+import pytz
+import config
+
+WEEKDAYS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+# The rule parts Google Calendar writes; anything else is left to the server
+SUPPORTED_PARTS = {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL', 'BYDAY', 'BYMONTHDAY', 'BYMONTH', 'BYSETPOS', 'WKST'}
+
+# Periods walked without an occurrence before a rule is given up on (e.g. BYMONTH=2;BYMONTHDAY=30)
+MAX_EMPTY_PERIODS = 1000
+
+Start = Union[date, datetime]
+
+
+class UnsupportedRecurrence(ValueError):
+    """A recurrence this module does not expand; the caller lets the server do it"""
+
+
+class Rule:
+    __slots__ = ('freq', 'interval', 'count', 'until', 'byday', 'bymonthday', 'bymonth', 'bysetpos', 'wkst')
+
+    def __init__(self, freq: str, interval: int = 1, count: int = None, until: Start = None,
+                 byday: List[Tuple[Optional[int], int]] = (), bymonthday: List[int] = (),
+                 bymonth: List[int] = (), bysetpos: List[int] = (), wkst: int = 0):
+        """
+        One RRULE. `byday` holds (ordinal or None, weekday) pairs, e.g.
+        (-1, 4) for "last Friday"; weekdays are Monday=0 like datetime.
+        """
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+        self.byday = list(byday)
+        self.bymonthday = list(bymonthday)
+        self.bymonth = list(bymonth)
+        self.bysetpos = list(bysetpos)
+        self.wkst = wkst
+
+
+def _parse_value(value: str, tz) -> Start:
+    """20240108 -> date, 20240108T020000Z -> UTC datetime, 20240108T090000 -> datetime in tz"""
+    value = value.strip()
+    if 'T' not in value:
+        return datetime.strptime(value, '%Y%m%d').date()
+    if value.endswith('Z'):
+        return pytz.utc.localize(datetime.strptime(value[:-1], '%Y%m%dT%H%M%S'))
+    return tz.localize(datetime.strptime(value, '%Y%m%dT%H%M%S'))
+
+
+def parse_rule(text: str, tz) -> Rule:
+    """Parse the value of an RRULE line ("FREQ=WEEKLY;BYDAY=MO,WE")"""
+    parts = {}
+    for part in text.strip().split(';'):
+        name, _, value = part.partition('=')
+        parts[name.upper()] = value.upper()
+    unsupported = set(parts) - SUPPORTED_PARTS
+    if unsupported:
+        raise UnsupportedRecurrence(f"rule parts {sorted(unsupported)} in {text}")
+    if parts.get('FREQ') not in FREQUENCIES:
+        raise UnsupportedRecurrence(f"frequency {parts.get('FREQ')} in {text}")
+
+    byday = []
+    for item in filter(None, parts.get('BYDAY', '').split(',')):
+        ordinal, weekday = item[:-2], item[-2:]
+        if weekday not in WEEKDAYS:
+            raise UnsupportedRecurrence(f"weekday {item} in {text}")
+        byday.append((int(ordinal) if ordinal else None, WEEKDAYS[weekday]))
+    rule = Rule(
+        parts['FREQ'],
+        interval=int(parts.get('INTERVAL', 1)),
+        count=int(parts['COUNT']) if 'COUNT' in parts else None,
+        until=_parse_value(parts['UNTIL'], tz) if 'UNTIL' in parts else None,
+        byday=byday,
+        bymonthday=[int(day) for day in filter(None, parts.get('BYMONTHDAY', '').split(','))],
+        bymonth=[int(month) for month in filter(None, parts.get('BYMONTH', '').split(','))],
+        bysetpos=[int(pos) for pos in filter(None, parts.get('BYSETPOS', '').split(','))],
+        wkst=WEEKDAYS.get(parts.get('WKST', 'MO'), 0),
+    )
+    # Ordinal weekdays only mean something within a month here
+    if any(ordinal for ordinal, _ in rule.byday) and (
+            rule.freq in ('DAILY', 'WEEKLY') or (rule.freq == 'YEARLY' and not rule.bymonth)):
+        raise UnsupportedRecurrence(f"ordinal BYDAY with FREQ={rule.freq} in {text}")
+    return rule
+
+
+def _parse_dates(line: str, tz) -> List[Start]:
+    """Values of an EXDATE/RDATE line ("EXDATE;TZID=Asia/Jakarta:20240108T090000,...")"""
+    head, _, values = line.partition(':')
+    params = dict(param.split('=', 1) for param in head.split(';')[1:] if '=' in param)
+    if params.get('VALUE', '').upper() == 'PERIOD':
+        raise UnsupportedRecurrence(f"period values in {line}")
+    if 'TZID' in params:
+        tz = pytz.timezone(params['TZID'])
+    return [_parse_value(value, tz) for value in values.split(',') if value.strip()]
+
+
+def instance_key(start: Start) -> Start:
+    """What identifies an occurrence: the date of an all-day one, the UTC instant of a timed one"""
+    if isinstance(start, datetime):
+        return start.astimezone(pytz.utc)
+    return start
+
+
+def original_key(value: Dict) -> Start:
+    """instance_key of a start/originalStartTime object of the API"""
+    if 'dateTime' in value:
+        return instance_key(_parse_iso(value['dateTime']))
+    return date.fromisoformat(value['date'])
+
+
+def _parse_iso(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class _Localizer:
+    """
+    tz.localize for many wall-clock times in one zone. pytz tries every
+    offset the zone ever had on each call; between two transitions the
+    answer is always the same, so it is reused for times well inside the
+    stretch the previous answer came from.
+    """
+    MARGIN = timedelta(days=1)
+
+    def __init__(self, tz):
+        self.tz = tz
+        self.transitions = getattr(tz, '_utc_transition_times', None)
+        # (low, high, tzinfo), replaced as a whole so threads sharing it never see a mix
+        self.segment = None
+
+    def __call__(self, naive: datetime) -> datetime:
+        segment = self.segment
+        if segment is not None and segment[0] <= naive < segment[1]:
+            return naive.replace(tzinfo=segment[2])
+        aware = self.tz.localize(naive)
+        if self.transitions:
+            offset = aware.utcoffset()
+            index = bisect.bisect_right(self.transitions, naive - offset) - 1
+            low = self.transitions[index] + offset + self.MARGIN if index > 0 else datetime.min
+            following = index + 1
+            high = (self.transitions[following] + offset - self.MARGIN
+                    if following < len(self.transitions) else datetime.max)
+            self.segment = (low, high, aware.tzinfo)
+        return aware
+
+
+_localizers: Dict = {}
+
+
+def _localizer(tz) -> _Localizer:
+    """The _Localizer of a zone, shared by every expansion"""
+    localizer = _localizers.get(tz)
+    if localizer is None:
+        localizer = _localizers[tz] = _Localizer(tz)
+    return localizer
+
+
+def _month_days(year: int, month: int, rule: Rule, default_day: int) -> List[date]:
+    last = calendar.monthrange(year, month)[1]
+    if rule.bymonthday:
+        days = {day if day > 0 else last + day + 1 for day in rule.bymonthday}
+        result = [date(year, month, day) for day in sorted(days) if 1 <= day <= last]
+        if rule.byday:
+            weekdays = {weekday for _, weekday in rule.byday}
+            result = [day for day in result if day.weekday() in weekdays]
+        return result
+    if rule.byday:
+        result = set()
+        for ordinal, weekday in rule.byday:
+            first = (weekday - date(year, month, 1).weekday()) % 7 + 1
+            matching = [date(year, month, day) for day in range(first, last + 1, 7)]
+            if ordinal is None:
+                result.update(matching)
+            elif 0 < abs(ordinal) <= len(matching):
+                result.add(matching[ordinal - 1 if ordinal > 0 else ordinal])
+        return sorted(result)
+    return [date(year, month, default_day)] if default_day <= last else []
+
+
+def _period_days(rule: Rule, first: date, period: int) -> Tuple[date, List[date]]:
+    """(first day of the period, candidate days in it) for the period-th period from `first`"""
+    step = period * rule.interval
+    if rule.freq == 'DAILY':
+        day = first + timedelta(days=step)
+        days = [day]
+        if rule.byday:
+            days = [day for day in days if day.weekday() in {weekday for _, weekday in rule.byday}]
+        if rule.bymonthday:
+            last = calendar.monthrange(day.year, day.month)[1]
+            days = [day for day in days
+                    if day.day in rule.bymonthday or day.day - last - 1 in rule.bymonthday]
+        period_start = day
+    elif rule.freq == 'WEEKLY':
+        period_start = first - timedelta(days=(first.weekday() - rule.wkst) % 7) + timedelta(weeks=step)
+        weekdays = sorted({weekday for _, weekday in rule.byday} or {first.weekday()},
+                          key=lambda weekday: (weekday - rule.wkst) % 7)
+        days = [period_start + timedelta(days=(weekday - rule.wkst) % 7) for weekday in weekdays]
+    elif rule.freq == 'MONTHLY':
+        month_index = first.year * 12 + first.month - 1 + step
+        year, month = divmod(month_index, 12)
+        period_start = date(year, month + 1, 1)
+        days = _month_days(year, month + 1, rule, first.day)
+    else:
+        year = first.year + step
+        period_start = date(year, 1, 1)
+        months = rule.bymonth or (range(1, 13) if rule.bymonthday or rule.byday else [first.month])
+        days = [day for month in months for day in _month_days(year, month, rule, first.day)]
+    if rule.bymonth and rule.freq != 'YEARLY':
+        days = [day for day in days if day.month in rule.bymonth]
+    if rule.bysetpos and days:
+        days = sorted({days[pos - 1 if pos > 0 else pos] for pos in rule.bysetpos if 0 < abs(pos) <= len(days)})
+    return period_start, days
+
+
+def _after_until(start: Start, until: Start, tz) -> bool:
+    if isinstance(until, datetime):
+        if isinstance(start, datetime):
+            return start > until
+        return start > until.astimezone(tz).date()
+    if isinstance(start, datetime):
+        return start.astimezone(tz).date() > until
+    return start > until
+
+
+def _first_period(rule: Rule, first: date, day: date) -> int:
+    """A period index safely before the one containing `day`"""
+    if rule.freq == 'DAILY':
+        elapsed = (day - first).days
+    elif rule.freq == 'WEEKLY':
+        elapsed = (day - first).days // 7
+    elif rule.freq == 'MONTHLY':
+        elapsed = (day.year - first.year) * 12 + day.month - first.month
+    else:
+        elapsed = day.year - first.year
+    return max(0, elapsed // rule.interval - 1)
+
+
+def _rule_starts(dtstart: Start, rule: Rule, tz, skip_to: date, horizon: date) -> Iterator[Start]:
+    """
+    Starts generated by one rule from dtstart on, ascending, until
+    COUNT/UNTIL or past `horizon`. Without COUNT nothing before `skip_to`
+    matters, so the periods before it are not walked.
+    """
+    timed = isinstance(dtstart, datetime)
+    localize = _localizer(tz)
+    first = dtstart.date() if timed else dtstart
+    local_time = dtstart.replace(tzinfo=None).time() if timed else None
+    count = 0
+    empty = 0
+    period = _first_period(rule, first, skip_to) if rule.count is None else 0
+    while True:
+        period_start, days = _period_days(rule, first, period)
+        period += 1
+        if period_start > horizon:
+            return
+        produced = False
+        for day in days:
+            if day < first or (rule.count is None and day < skip_to):
+                continue
+            start = localize(datetime.combine(day, local_time)) if timed else day
+            if timed and start < dtstart:
+                continue
+            if rule.until is not None and _after_until(start, rule.until, tz):
+                return
+            produced = True
+            yield start
+            count += 1
+            if rule.count and count >= rule.count:
+                return
+        empty = 0 if produced else empty + 1
+        if empty >= MAX_EMPTY_PERIODS:
+            return
+
+
+def _event_timezone(start: Dict):
+    if start.get('timeZone'):
+        return pytz.timezone(start['timeZone'])
+    if 'dateTime' in start:
+        offset = _parse_iso(start['dateTime']).utcoffset()
+        return pytz.FixedOffset(int(offset.total_seconds() // 60))
+    return config.TIMEZONE
+
+
+def _instance(master: Dict, start: Start, end: Start, tz_name: Optional[str]) -> Dict:
+    """An occurrence shaped like a singleEvents=True item of the API"""
+    instance = {key: value for key, value in master.items() if key not in ('recurrence', 'start', 'end')}
+    if isinstance(start, datetime):
+        suffix = start.astimezone(pytz.utc).strftime('%Y%m%dT%H%M%SZ')
+        instance['start'] = {'dateTime': start.isoformat()}
+        instance['end'] = {'dateTime': end.isoformat()}
+        if tz_name:
+            instance['start']['timeZone'] = instance['end']['timeZone'] = tz_name
+    else:
+        suffix = start.strftime('%Y%m%d')
+        instance['start'] = {'date': start.isoformat()}
+        instance['end'] = {'date': end.isoformat()}
+    instance['id'] = f"{master['id']}_{suffix}"
+    instance['recurringEventId'] = master['id']
+    instance['originalStartTime'] = dict(instance['start'])
+    return instance
+
+
+def expand(master: Dict, window_start: datetime, window_end: datetime,
+           skip: Container = ()) -> Iterator[Dict]:
+    """
+    Instances of the recurring event `master` overlapping [window_start,
+    window_end), in start order and shaped like the API's singleEvents=True
+    items (id "<master id>_<start>", recurringEventId, originalStartTime).
+    EXDATEs are left out, and so is every occurrence whose instance_key is
+    in `skip` (those that have an exception: moved, edited or cancelled).
+    Raises UnsupportedRecurrence for recurrences it cannot expand exactly.
+    """
+    start_info, end_info = master['start'], master['end']
+    tz = _event_timezone(start_info)
+    if 'dateTime' in start_info:
+        dtstart = _parse_iso(start_info['dateTime']).astimezone(tz)
+        # Instances keep the wall-clock length across DST changes
+        duration = (_parse_iso(end_info['dateTime']).astimezone(tz).replace(tzinfo=None)
+                    - dtstart.replace(tzinfo=None))
+    else:
+        dtstart = date.fromisoformat(start_info['date'])
+        duration = date.fromisoformat(end_info['date']) - dtstart
+
+    rules, excluded, extra = [], set(), [dtstart]
+    for line in master.get('recurrence', []):
+        name = line.split(':', 1)[0].split(';', 1)[0].upper()
+        if name == 'RRULE':
+            rules.append(parse_rule(line.split(':', 1)[1], tz))
+        elif name == 'EXDATE':
+            excluded.update(instance_key(value) for value in _parse_dates(line, tz))
+        elif name == 'RDATE':
+            extra.extend(_parse_dates(line, tz))
+        else:
+            raise UnsupportedRecurrence(line)
+    if isinstance(dtstart, datetime):
+        extra = [value if isinstance(value, datetime) else _localizer(tz)(datetime.combine(value, dtstart.time()))
+                 for value in extra]
+    else:
+        extra = [value.astimezone(tz).date() if isinstance(value, datetime) else value for value in extra]
+
+    # A day of slack each way: instances are compared as instants, periods as local dates
+    skip_to = window_start.astimezone(tz).date() - duration - timedelta(days=1)
+    horizon = window_end.astimezone(tz).date() + timedelta(days=1)
+    streams = [_rule_starts(dtstart, rule, tz, skip_to, horizon) for rule in rules] + [iter(sorted(extra, key=instance_key))]
+    localize, local_midnight = _localizer(tz), _localizer(config.TIMEZONE)
+    seen = set()
+    for start in heapq.merge(*streams, key=instance_key):
+        key = instance_key(start)
+        if key in seen:
+            continue
+        seen.add(key)
+        if isinstance(start, datetime):
+            end = localize(start.replace(tzinfo=None) + duration)
+            start_at, end_at = start, end
+        else:
+            end = start + duration
+            # All-day instances span local midnights, as in utils.helpers.parse_event_time
+            start_at = local_midnight(datetime.combine(start, datetime.min.time()))
+            end_at = local_midnight(datetime.combine(end, datetime.min.time()))
+        if start_at >= window_end:
+            return
+        if end_at <= window_start or key in excluded or key in skip:
+            continue
+        yield _instance(master, start, end, start_info.get('timeZone'))
@@ -0,0 +1,161 @@
+"""
+RESP server
+Tiny Redis-protocol stand-in for local multi-worker runs and tests (no persistence)
+
+Run from the project root:
+    python -m utils.resp_server --port 6379
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RespServer:
+    def __init__(self):
+        """Strings and hashes with optional expiry; only the commands the bot uses"""
+        self.data: Dict[bytes, object] = {}
+        self.expires: Dict[bytes, float] = {}
+
+    def _live(self, key: bytes):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return self.data.get(key)
+
+    def _hash(self, key: bytes) -> Dict[bytes, bytes]:
+        value = self._live(key)
+        if value is None:
+            value = self.data[key] = {}
+        if not isinstance(value, dict):
+            raise TypeError
+        return value
+
+    def command(self, args: List[bytes]):
+        name = args[0].upper()
+        if name == b'PING':
+            return 'PONG'
+        if name in (b'AUTH', b'SELECT'):
+            return 'OK'
+        if name == b'GET':
+            value = self._live(args[1])
+            if isinstance(value, dict):
+                raise TypeError
+            return value
+        if name == b'SET':
+            self.data[args[1]] = args[2]
+            self.expires.pop(args[1], None)
+            if len(args) >= 5 and args[3].upper() == b'EX':
+                self.expires[args[1]] = time.monotonic() + int(args[4])
+            return 'OK'
+        if name == b'DEL':
+            removed = 0
+            for key in args[1:]:
+                if self._live(key) is not None:
+                    removed += 1
+                self.data.pop(key, None)
+                self.expires.pop(key, None)
+            return removed
+        if name == b'EXISTS':
+            return sum(1 for key in args[1:] if self._live(key) is not None)
+        if name == b'INCR':
+            value = int(self._live(args[1]) or 0) + 1
+            self.data[args[1]] = str(value).encode()
+            return value
+        if name == b'EXPIRE':
+            if self._live(args[1]) is None:
+                return 0
+            self.expires[args[1]] = time.monotonic() + int(args[2])
+            return 1
+        if name == b'HSET':
+            fields = self._hash(args[1])
+            added = 0
+            for i in range(2, len(args) - 1, 2):
+                added += args[i] not in fields
+                fields[args[i]] = args[i + 1]
+            return added
+        if name == b'HGET':
+            return self._hash(args[1]).get(args[2])
+        if name == b'HDEL':
+            fields = self._hash(args[1])
+            return sum(1 for field in args[2:] if fields.pop(field, None) is not None)
+        if name == b'HGETALL':
+            return [item for pair in self._hash(args[1]).items() for item in pair]
+        if name == b'FLUSHALL' or name == b'FLUSHDB':
+            self.data.clear()
+            self.expires.clear()
+            return 'OK'
+        return ValueError(f"ERR unknown command '{name.decode()}'")
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if value is None:
+            return b'$-1\r\n'
+        if isinstance(value, str):
+            return b'+%s\r\n' % value.encode()
+        if isinstance(value, Exception):
+            return b'-%s\r\n' % str(value).encode()
+        if isinstance(value, int):
+            return b':%d\r\n' % value
+        if isinstance(value, bytes):
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        return b'*%d\r\n' % len(value) + b''.join(RespServer.encode(item) for item in value)
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # Inline command, e.g. from telnet
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int((await reader.readline())[1:-2])
+            args.append((await reader.readexactly(length + 2))[:-2])
+        return args
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                try:
+                    reply = self.command(args)
+                except TypeError:
+                    reply = ValueError('WRONGTYPE Operation against a key holding the wrong kind of value')
+                except (IndexError, ValueError):
+                    reply = ValueError(f"ERR wrong arguments for '{args[0].decode()}' command")
+                writer.write(self.encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"RESP server listening on {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Redis-protocol stand-in for local runs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(RespServer().serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Schedule analytics
+Deterministic schedule statistics computed locally over array-backed event times
+"""
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from operator import sub
+from typing import Dict, List
+import config
+from utils.helpers import get_event_bounds, is_busy_event
+
+# Gaps up to this long still count as back-to-back
+BACK_TO_BACK_GAP = 10 * 60
+# Gaps shorter than this are too short to be useful breaks
+SHORT_GAP = 15 * 60
+
+DAY_NAMES = ['Sen', 'Sel', 'Rab', 'Kam', 'Jum', 'Sab', 'Min']
+
+
+def _hours(seconds: float) -> str:
+    return f"{seconds / 3600:.1f}j"
+
+
+def _outside_work_hours(start: float, end: float) -> float:
+    """Seconds of [start, end) outside configured work hours or on weekends"""
+    total = 0.0
+    cursor = datetime.fromtimestamp(start, config.TIMEZONE)
+    stop = datetime.fromtimestamp(end, config.TIMEZONE)
+    while cursor < stop:
+        day_start = cursor.replace(hour=0, minute=0, second=0, microsecond=0)
+        next_day = config.TIMEZONE.normalize(day_start + timedelta(days=1))
+        segment_end = min(stop, next_day)
+        segment = (segment_end - cursor).total_seconds()
+        if cursor.weekday() >= 5:
+            total += segment
+        else:
+            work_start = day_start + timedelta(hours=config.WORK_HOURS_START)
+            work_end = day_start + timedelta(hours=config.WORK_HOURS_END)
+            inside = (min(segment_end, work_end) - max(cursor, work_start)).total_seconds()
+            total += segment - max(0.0, inside)
+        cursor = segment_end
+    return total
+
+
+def analyze_schedule(events: List[Dict]) -> Dict:
+    """
+    Compute busy hours per day, overlaps, back-to-back chains, gaps and
+    after-hours load. Times live in parallel array('d') columns sorted by
+    start, and each statistic is one linear pass over those columns.
+    """
+    rows = []
+    for event in events:
+        bounds = get_event_bounds(event)
+        if bounds and is_busy_event(event):
+            rows.append((bounds[0].timestamp(), bounds[1].timestamp(), event.get('summary', 'Untitled')))
+    rows.sort()
+
+    starts = array('d', (row[0] for row in rows))
+    ends = array('d', (row[1] for row in rows))
+    titles = [row[2] for row in rows]
+    count = len(rows)
+
+    durations = array('d', map(sub, ends, starts))
+    # running_end[i] = latest end among events 0..i
+    running_end = array('d', accumulate(ends, max))
+    # gaps[i] = time between event i+1 and everything before it (negative = overlap)
+    gaps = array('d', map(sub, starts[1:], running_end[:-1]))
+
+    # Busy time per local day, counting overlapping time once
+    busy_per_day = OrderedDict()
+    events_per_day = OrderedDict()
+    union_end = None
+    for i in range(count):
+        day = datetime.fromtimestamp(starts[i], config.TIMEZONE).date()
+        events_per_day[day] = events_per_day.get(day, 0) + 1
+        busy_per_day.setdefault(day, 0.0)
+        if union_end is not None and starts[i] < union_end:
+            if ends[i] > union_end:
+                busy_per_day[day] += ends[i] - union_end
+                union_end = ends[i]
+        else:
+            busy_per_day[day] += durations[i]
+            union_end = ends[i]
+
+    overlaps = []
+    chains = []
+    chain_start = 0
+    short_gaps = 0
+    longest_gap = 0.0
+    for i, gap in enumerate(gaps):
+        if gap < 0:
+            overlaps.append((titles[i], titles[i + 1], starts[i + 1]))
+        same_day = (datetime.fromtimestamp(starts[i + 1], config.TIMEZONE).date() ==
+                    datetime.fromtimestamp(running_end[i], config.TIMEZONE).date())
+        if 0 < gap < SHORT_GAP and same_day:
+            short_gaps += 1
+        if gap > 0 and same_day:
+            longest_gap = max(longest_gap, gap)
+        if gap > BACK_TO_BACK_GAP or not same_day:
+            if i - chain_start >= 1:
+                chains.append((chain_start, i))
+            chain_start = i + 1
+    if count and count - 1 - chain_start >= 1:
+        chains.append((chain_start, count - 1))
+
+    after_hours = array('d', map(_outside_work_hours, starts, ends))
+    after_hours_events = sum(1 for seconds in after_hours if seconds > 0)
+
+    return {
+        'event_count': count,
+        'total_busy': sum(busy_per_day.values()),
+        'busy_per_day': busy_per_day,
+        'events_per_day': events_per_day,
+        'overlaps': overlaps,
+        'chains': [
+            {
+                'length': last - first + 1,
+                'start': starts[first],
+                'end': running_end[last],
+            }
+            for first, last in chains
+        ],
+        'short_gaps': short_gaps,
+        'longest_gap': longest_gap,
+        'after_hours': sum(after_hours),
+        'after_hours_events': after_hours_events,
+    }
+
+
+def summarize_schedule(stats: Dict, max_items: int = 3) -> str:
+    """Render analytics as a few compact lines for an AI prompt"""
+    if not stats['event_count']:
+        return "Tidak ada acara terjadwal."
+
+    def clock(timestamp):
+        moment = datetime.fromtimestamp(timestamp, config.TIMEZONE)
+        return f"{DAY_NAMES[moment.weekday()]} {moment.strftime('%H:%M')}"
+
+    days = stats['busy_per_day']
+    lines = [
+        f"Acara: {stats['event_count']}, total sibuk {_hours(stats['total_busy'])} "
+        f"dalam {len(days)} hari",
+        "Per hari: " + " | ".join(
+            f"{DAY_NAMES[day.weekday()]} {day.strftime('%d/%m')} {_hours(seconds)}"
+            f"({stats['events_per_day'][day]})"
+            for day, seconds in days.items()
+        ),
+    ]
+
+    overlaps = stats['overlaps']
+    line = f"Bentrok: {len(overlaps)}"
+    if overlaps:
+        line += " (" + "; ".join(
+            f"{first} x {second} {clock(start)}" for first, second, start in overlaps[:max_items]
+        ) + ")"
+    lines.append(line)
+
+    chains = sorted(stats['chains'], key=lambda chain: chain['end'] - chain['start'], reverse=True)
+    line = f"Back-to-back: {len(chains)} rantai"
+    if chains:
+        longest = chains[0]
+        line += (f", terpanjang {longest['length']} acara {_hours(longest['end'] - longest['start'])}"
+                 f" ({clock(longest['start'])})")
+    lines.append(line)
+
+    lines.append(f"Jeda <{SHORT_GAP // 60}m: {stats['short_gaps']}, jeda terpanjang {_hours(stats['longest_gap'])}")
+    lines.append(
+        f"Di luar jam kerja ({config.WORK_HOURS_START:02d}-{config.WORK_HOURS_END:02d}, akhir pekan): "
+        f"{_hours(stats['after_hours'])} dari {stats['after_hours_events']} acara"
+    )
+    return "\n".join(lines)
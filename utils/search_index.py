@@ -0,0 +1,144 @@
+"""
+Search index
+Local inverted index with prefix matching and Indonesian-aware normalization
+"""
+import re
+import unicodedata
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Hashable, List, Set
+
+_WORD_RE = re.compile(r'[a-z0-9]+')
+
+# Affixes stripped by the light stemmer, longest first. Stems shorter than
+# MIN_STEM are left alone so short words ("makan", "dinas") survive intact.
+PARTICLES = ('lah', 'kah', 'tah', 'pun')
+POSSESSIVES = ('nya', 'ku', 'mu')
+SUFFIXES = ('kan', 'an', 'i')
+PREFIXES = ('meng', 'meny', 'mem', 'men', 'me', 'peng', 'peny', 'pem', 'pen', 'pe',
+            'ber', 'be', 'ter', 'di', 'ke', 'se')
+MIN_STEM = 4
+
+# Common Indonesian spellings/abbreviations mapped onto one term
+SYNONYMS = {
+    'mtg': 'meeting',
+    'rapt': 'rapat',
+    'ultah': 'ulang',
+    'bday': 'birthday',
+    'dr': 'dokter',
+    'jkt': 'jakarta',
+}
+
+# Weight of a term hit per event field
+FIELD_WEIGHTS = {'summary': 3, 'location': 2, 'description': 1}
+
+
+def _strip(word: str, affixes, from_end: bool) -> str:
+    for affix in affixes:
+        if from_end and word.endswith(affix) and len(word) - len(affix) >= MIN_STEM:
+            return word[:-len(affix)]
+        if not from_end and word.startswith(affix) and len(word) - len(affix) >= MIN_STEM:
+            return word[len(affix):]
+    return word
+
+
+@lru_cache(maxsize=8192)
+def stem(word: str) -> str:
+    """Light Indonesian stemmer: particles, possessives, suffixes, then prefixes"""
+    word = SYNONYMS.get(word, word)
+    word = _strip(word, PARTICLES, True)
+    word = _strip(word, POSSESSIVES, True)
+    word = _strip(word, SUFFIXES, True)
+    return _strip(word, PREFIXES, False)
+
+
+def normalize_words(text: str) -> List[str]:
+    """Lowercase, drop accents and split text into words"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD_RE.findall(text)
+
+
+def index_terms(word: str) -> Set[str]:
+    """Terms stored for a word: the word itself (for prefix typeahead) and its stem"""
+    return {word, stem(word)}
+
+
+class SearchIndex:
+    def __init__(self):
+        """Postings map term -> {doc_id: score}; a sorted vocabulary serves prefix lookups"""
+        self._postings: Dict[str, Dict[Hashable, int]] = {}
+        self._doc_terms: Dict[Hashable, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def add(self, doc_id: Hashable, fields: Dict[str, str]):
+        """Index (or re-index) a document from its text fields"""
+        self.remove(doc_id)
+        terms = set()
+        for field, text in fields.items():
+            if not text:
+                continue
+            weight = FIELD_WEIGHTS.get(field, 1)
+            for word in normalize_words(text):
+                for term in index_terms(word):
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = {}
+                        self._dirty = True
+                    postings[doc_id] = postings.get(doc_id, 0) + weight
+                    terms.add(term)
+        self._doc_terms[doc_id] = terms
+
+    def remove(self, doc_id: Hashable):
+        """Drop a document from the index"""
+        for term in self._doc_terms.pop(doc_id, ()):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                self._dirty = True
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        if self._dirty:
+            self._vocabulary = sorted(self._postings)
+            self._dirty = False
+        terms = []
+        index = bisect_left(self._vocabulary, prefix)
+        while index < len(self._vocabulary) and self._vocabulary[index].startswith(prefix):
+            terms.append(self._vocabulary[index])
+            index += 1
+        return terms
+
+    def search(self, query: str, limit: int = None) -> List[Hashable]:
+        """
+        Documents containing every query term, best score first. The last
+        term is matched as a prefix so partially typed words already match.
+        """
+        words = normalize_words(query)
+        if not words:
+            return []
+
+        scores = None
+        for position, word in enumerate(words):
+            term_scores: Dict[Hashable, int] = {}
+            candidates = index_terms(word)
+            if position == len(words) - 1:
+                candidates = {term for prefix in candidates for term in self._prefix_terms(prefix)}
+            for term in candidates:
+                for doc_id, score in self._postings.get(term, {}).items():
+                    term_scores[doc_id] = max(term_scores.get(doc_id, 0), score)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: scores[doc_id] + score
+                          for doc_id, score in term_scores.items() if doc_id in scores}
+            if not scores:
+                return []
+
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        return ranked[:limit] if limit else ranked
@@ -0,0 +1,412 @@
+"""
+Tracing
+Per-update trace spans carried in contextvars, exported to JSONL or an OTLP/JSON collector
+
+Inspect a trace file from the project root:
+    python -m utils.tracing show traces.jsonl --slowest 5
+Run a local OTLP/HTTP collector stand-in that appends what it receives to a file:
+    python -m utils.tracing collector --port 4318 --output traces.jsonl
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest, RequestData
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'telegram-calendar-bot'
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+_processor: Optional['SpanProcessor'] = None
+_sample_rate = 1.0
+
+
+class Span:
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'name', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'error', 'sampled')
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Dict = None,
+                 sampled: bool = True):
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = 'ok'
+        self.error = None
+        self.sampled = parent.sampled if parent else sampled
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = 'error'
+        self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round(self.duration_ms, 3),
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes,
+        }
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def start_span(name: str, attributes: Dict = None, require_parent: bool = False) -> Iterator[Optional[Span]]:
+    """
+    Open a span as a child of the current one (or as a new trace root).
+    Yields None without doing any work when tracing is not configured, or
+    when `require_parent` is set and no trace is active.
+    """
+    parent = _current_span.get()
+    if _processor is None or (require_parent and parent is None) or (parent and not parent.sampled):
+        yield None
+        return
+
+    span = Span(name, parent, attributes, sampled=parent is not None or random.random() < _sample_rate)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(token)
+        if span.sampled:
+            _processor.submit(span)
+
+
+class JsonlExporter:
+    def __init__(self, path: str):
+        """Append one JSON object per finished span"""
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False) + '\n')
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans: List[Span]) -> Dict:
+    """OTLP/JSON ExportTraceServiceRequest body"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{
+            'scope': {'name': SERVICE_NAME},
+            'spans': [{
+                'traceId': span.trace_id,
+                'spanId': span.span_id,
+                'parentSpanId': span.parent_id or '',
+                'name': span.name,
+                'kind': 1 if span.parent_id else 2,  # INTERNAL / SERVER
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns),
+                'attributes': [{'key': key, 'value': _otlp_value(value)}
+                               for key, value in span.attributes.items()],
+                'status': {'code': 2, 'message': span.error} if span.status == 'error' else {'code': 1},
+            } for span in spans],
+        }],
+    }]}
+
+
+class OtlpHttpExporter:
+    def __init__(self, endpoint: str, timeout: float = 5.0):
+        """POST spans as OTLP/JSON, e.g. to http://localhost:4318/v1/traces"""
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def export(self, spans: List[Span]):
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(to_otlp(spans)).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+
+class SpanProcessor:
+    def __init__(self, exporters: List, max_queue: int = 10000, batch_size: int = 512,
+                 flush_interval: float = 1.0):
+        """Batches finished spans and exports them from a daemon thread, off the event loop"""
+        self.exporters = exporters
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def submit(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            if not self.dropped:
+                logger.warning("Trace export queue is full; dropping spans")
+            self.dropped += 1
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]):
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+            except Exception as e:
+                logger.warning(f"Trace export via {type(exporter).__name__} failed: {e}")
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            batch = self._drain()
+            while batch:
+                self._export(batch)
+                batch = self._drain()
+
+    def shutdown(self):
+        """Stop the thread and export whatever is still queued"""
+        self._stopped.set()
+        self._thread.join(timeout=self.flush_interval * 2)
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+
+
+def configure(trace_file: str = None, otlp_endpoint: str = None, sample_rate: float = 1.0) -> SpanProcessor:
+    """Enable tracing with the given exporters; spans are flushed again at exit"""
+    global _processor, _sample_rate
+    exporters = []
+    if trace_file:
+        exporters.append(JsonlExporter(trace_file))
+    if otlp_endpoint:
+        exporters.append(OtlpHttpExporter(otlp_endpoint))
+    _sample_rate = sample_rate
+    _processor = SpanProcessor(exporters)
+    atexit.register(_processor.shutdown)
+    logger.info(f"Tracing enabled ({', '.join(type(e).__name__ for e in exporters) or 'no exporters'})")
+    return _processor
+
+
+def _update_attributes(update: Update) -> Dict:
+    attributes = {'telegram.update_id': update.update_id}
+    if update.effective_user:
+        attributes['telegram.user_id'] = update.effective_user.id
+    if update.effective_chat:
+        attributes['telegram.chat_id'] = update.effective_chat.id
+    if update.callback_query:
+        attributes['telegram.kind'] = 'callback_query'
+        attributes['telegram.callback_data'] = update.callback_query.data or ''
+    elif update.message and update.message.text:
+        text = update.message.text
+        # Only the command name is recorded, never message contents
+        attributes['telegram.kind'] = 'command' if text.startswith('/') else 'text'
+        if text.startswith('/'):
+            attributes['telegram.command'] = text.split()[0].split('@')[0]
+    return attributes
+
+
+class TracedApplication(Application):
+    """Application that opens a root span around the dispatch of every update"""
+
+    async def process_update(self, update: object) -> None:
+        if not isinstance(update, Update):
+            return await super().process_update(update)
+        attributes = _update_attributes(update)
+        name = f"update {attributes.get('telegram.command') or attributes.get('telegram.kind', 'other')}"
+        with start_span(name, attributes):
+            await super().process_update(update)
+
+
+class TracingRequest(BaseRequest):
+    def __init__(self, request: BaseRequest):
+        """Wraps another Bot API request object; calls made while handling an update become spans"""
+        self.request = request
+
+    @property
+    def read_timeout(self):
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: RequestData = None, **timeouts):
+        endpoint = url.rsplit('/', 1)[-1]
+        with start_span(f"telegram {endpoint}", {'telegram.method': endpoint}, require_parent=True) as span:
+            code, payload = await self.request.do_request(url, method, request_data, **timeouts)
+            if span:
+                span.set_attribute('http.status_code', code)
+                if code >= 400:
+                    span.status = 'error'
+            return code, payload
+
+
+def load_spans(path: str) -> List[Dict]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def format_trace(spans: List[Dict]) -> str:
+    """Indented span tree with durations and each span's offset from the root"""
+    children: Dict[Optional[str], List[Dict]] = {}
+    ids = {span['span_id'] for span in spans}
+    for span in spans:
+        parent = span['parent_id'] if span['parent_id'] in ids else None
+        children.setdefault(parent, []).append(span)
+    for siblings in children.values():
+        siblings.sort(key=lambda span: span['start_ns'])
+
+    roots = children.get(None, [])
+    origin = min(span['start_ns'] for span in spans)
+    lines = []
+
+    def walk(span, depth):
+        offset = (span['start_ns'] - origin) / 1e6
+        status = f"  ! {span['error'] or 'error'}" if span['status'] == 'error' else ''
+        lines.append(f"{'  ' * depth}{span['name']:<{max(1, 44 - 2 * depth)}} "
+                     f"{span['duration_ms']:>9.1f} ms  @+{offset:.1f} ms{status}")
+        for child in children.get(span['span_id'], []):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+    return '\n'.join(lines)
+
+
+def _show(args):
+    traces: Dict[str, List[Dict]] = {}
+    for span in load_spans(args.path):
+        traces.setdefault(span['trace_id'], []).append(span)
+
+    def root_duration(spans):
+        roots = [span for span in spans if not span['parent_id']]
+        return max(span['duration_ms'] for span in roots or spans)
+
+    selected = traces.get(args.trace_id, []) if args.trace_id else None
+    ranked = [selected] if selected else sorted(traces.values(), key=root_duration, reverse=True)
+    for spans in ranked[:args.slowest]:
+        print(f"trace {spans[0]['trace_id']}")
+        print(format_trace(spans))
+        print()
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    output = 'traces.jsonl'
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/v1/traces':
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        with open(self.output, 'a', encoding='utf-8') as f:
+            for resource in body.get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    for span in scope.get('spans', []):
+                        start, end = int(span['startTimeUnixNano']), int(span['endTimeUnixNano'])
+                        status = span.get('status', {})
+                        f.write(json.dumps({
+                            'trace_id': span['traceId'],
+                            'span_id': span['spanId'],
+                            'parent_id': span.get('parentSpanId') or None,
+                            'name': span['name'],
+                            'start_ns': start,
+                            'end_ns': end,
+                            'duration_ms': round((end - start) / 1e6, 3),
+                            'status': 'error' if status.get('code') == 2 else 'ok',
+                            'error': status.get('message'),
+                            'attributes': {attribute['key']: next(iter(attribute['value'].values()))
+                                           for attribute in span.get('attributes', [])},
+                        }, ensure_ascii=False) + '\n')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _collector(args):
+    _CollectorHandler.output = args.output
+    server = ThreadingHTTPServer((args.host, args.port), _CollectorHandler)
+    print(f"Collecting OTLP/JSON traces on http://{args.host}:{args.port}/v1/traces into {args.output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Trace file viewer and OTLP collector stand-in')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    show = commands.add_parser('show', help='print span trees, slowest first')
+    show.add_argument('path')
+    show.add_argument('--slowest', type=int, default=5)
+    show.add_argument('--trace-id')
+    show.set_defaults(func=_show)
+
+    collector = commands.add_parser('collector', help='accept OTLP/JSON on /v1/traces')
+    collector.add_argument('--host', default='127.0.0.1')
+    collector.add_argument('--port', type=int, default=4318)
+    collector.add_argument('--output', default='traces.jsonl')
+    collector.set_defaults(func=_collector)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()